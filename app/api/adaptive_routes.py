@@ -1,11 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from datetime import date
+import json
+import logging
 import uuid
 
 from app.db.database import get_db
 from app.api import schemas
-from app.services.adaptive_service import AdaptiveMechanisms
+from app.services.adaptive_service import AdaptiveMechanisms, ADAPT_BATCH_MAX_CONCURRENCY
+from app.services import review_scheduler
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -35,6 +42,41 @@ async def adapt_content(
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error adapting content: {str(e)}")
 
+@router.post("/content/adapt/batch")
+async def adapt_content_batch(
+    request: schemas.BatchAdaptationRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Адаптирует набор контента для учащегося; результаты передаются по мере готовности (NDJSON).
+    """
+    # Профиль и сохраненные варианты загружаются до начала потока,
+    # чтобы ошибки запроса возвращались обычным ответом
+    try:
+        batch = await AdaptiveMechanisms.prepare_content_batch(
+            db=db,
+            user_id=request.user_id,
+            content_ids=request.content_ids,
+            adaptation_params=request.adaptation_params
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error adapting content: {str(e)}")
+    
+    # Параллелизм запроса не может превышать настроенный на сервере
+    max_concurrency = min(request.max_concurrency or ADAPT_BATCH_MAX_CONCURRENCY, ADAPT_BATCH_MAX_CONCURRENCY)
+    
+    async def result_stream():
+        async for result in AdaptiveMechanisms.adapt_content_batch(batch, max_concurrency):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/feedback/generate", response_model=Dict[str, Any])
 async def generate_adaptive_feedback(
     assessment_result: Dict[str, Any],
@@ -75,8 +117,52 @@ async def optimize_learning_path(
             path_params=path_params
         )
         
+        # Контент первых занятий адаптируется в фоне, пока учащийся изучает план;
+        # импорт здесь, так как app.tasks импортирует сервисы и маршруты
+        try:
+            from app.tasks import prefetch_plan_content_task
+            prefetch_plan_content_task.delay(str(user_id), learning_path["plan_id"])
+        except Exception as e:
+            logger.warning(f"Failed to enqueue content prefetch for plan {learning_path['plan_id']}: {e}")
+        
         return learning_path
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error optimizing learning path: {str(e)}")
+
+@router.get("/reviews/due", response_model=List[Dict[str, Any]])
+async def get_due_reviews(
+    user_id: uuid.UUID,
+    limit: int = review_scheduler.REVIEW_DUE_LIMIT,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Возвращает концепции, которые учащийся должен повторить сейчас.
+    """
+    try:
+        due = await review_scheduler.get_due_reviews(db, user_id, limit=limit)
+        return [
+            {
+                "concept_id": str(mastery.concept_id),
+                "mastery_level": mastery.mastery_level,
+                "due_at": mastery.next_review_at.isoformat()
+            }
+            for mastery in due
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error getting due reviews: {str(e)}")
+
+@router.get("/reviews/queue", response_model=List[Dict[str, Any]])
+async def get_review_queue(
+    user_id: uuid.UUID,
+    queue_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Возвращает очередь повторений учащегося на день.
+    """
+    try:
+        return await review_scheduler.get_daily_queue(db, user_id, queue_date)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error getting review queue: {str(e)}")
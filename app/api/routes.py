@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Path, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timedelta
+import json
 
 from app.db.database import get_db
 from app.api import schemas
@@ -134,6 +136,35 @@ async def adapt_content(
     
     return await content_service.adapt_content(db, adaptation_request)
 
+@api_router.post("/content/adapt/work-items", response_model=schemas.AdaptationWorkItemsResponse)
+async def create_adaptation_work_items(
+    work_items_request: schemas.AdaptationWorkItemsRequest,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Проверка прав доступа
+    if current_user.role not in ["admin", "teacher"]:
+        raise HTTPException(status_code=403, detail="Not authorized to create adaptation work items")
+    
+    try:
+        items = await content_service.create_adaptation_work_items(
+            db,
+            work_items_request.content_ids,
+            work_items_request.user_ids,
+            work_items_request.adaptation_params
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    
+    # Задания выполняются воркером Celery через пакетный API провайдера
+    from app.tasks import batch_adapt_content_task
+    task = batch_adapt_content_task.delay(
+        [str(item.id) for item in items],
+        chunk_size=work_items_request.chunk_size
+    )
+    
+    return {"task_id": task.id, "work_item_ids": [item.id for item in items]}
+
 # Оценки и диагностика
 @api_router.post("/assessments", response_model=schemas.AssessmentResponse)
 async def create_assessment(
@@ -194,6 +225,39 @@ async def send_chat_message(
     
     return response
 
+@api_router.post("/chat/message/stream")
+async def stream_chat_message(
+    request: schemas.ChatRequest,
+    background_tasks: BackgroundTasks,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Отправляет ответ ассистента по мере генерации (Server-Sent Events)."""
+    # Проверка прав доступа
+    if current_user.id != request.user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to send messages for this user")
+    
+    # Сохранение сообщения и подготовка промпта выполняются до начала потока
+    chat = await chat_service.prepare_chat(db, request)
+    
+    async def event_stream():
+        async for event in chat_service.stream_message(request, chat):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+    
+    # Асинхронное обновление профиля
+    background_tasks.add_task(
+        profile_service.update_profile_from_interaction,
+        db, 
+        request.user_id, 
+        {"type": "chat", "content": request.message}
+    )
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Импорт и подключение маршрутов адаптивных механизмов
 from app.api.adaptive_routes import router as adaptive_router
 api_router.include_router(adaptive_router, prefix="/adaptive", tags=["adaptive"])
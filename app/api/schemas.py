@@ -117,6 +117,22 @@ class AdaptationRequest(BaseModel):
     user_id: UUID4
     adaptation_params: Optional[Dict[str, Any]] = None
 
+class BatchAdaptationRequest(BaseModel):
+    content_ids: List[UUID4] = Field(..., min_length=1, max_length=100)
+    user_id: UUID4
+    adaptation_params: Optional[Dict[str, Any]] = None
+    max_concurrency: Optional[int] = Field(None, ge=1)
+
+class AdaptationWorkItemsRequest(BaseModel):
+    content_ids: List[UUID4] = Field(..., min_length=1, max_length=100)
+    user_ids: List[UUID4] = Field(..., min_length=1, max_length=1000)
+    adaptation_params: Optional[Dict[str, Any]] = None
+    chunk_size: int = Field(100, ge=1, le=1000)
+
+class AdaptationWorkItemsResponse(BaseModel):
+    task_id: str
+    work_item_ids: List[UUID4]
+
 # Схемы для чата
 class ChatMessage(BaseModel):
     role: str
@@ -1,9 +1,14 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import logging
+import asyncio
+import signal
+import os
+from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
 from app.db.database import init_db
 from app.api.routes import api_router
+from app.services.llm_service import open_http_clients, close_http_clients, llm_registry
 
 # Настройка логирования
 logging.basicConfig(
@@ -36,15 +41,32 @@ app.include_router(api_router)
 async def startup_event():
     logger.info("Initializing application...")
     await init_db()
+    await open_http_clients()
+    # Горячая перезагрузка конфигурации LLM по SIGHUP
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, llm_registry.reload)
+    except (NotImplementedError, AttributeError):
+        logger.warning("SIGHUP reload of LLM config is not supported on this platform")
     logger.info("Application started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down application...")
+    await close_http_clients()
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    """Метрики Prometheus, в том числе задержки, токены и стоимость вызовов LLM."""
+    registry = REGISTRY
+    # При нескольких процессах uvicorn/gunicorn метрики собираются из общего каталога
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,4 +1,4 @@
-from app.models.user import User, LearningProfile, ConceptMastery, UserRole
+from app.models.user import User, LearningProfile, ConceptMastery, UserRole, LearnerCohort, DailyReviewQueue
 from app.models.content import Concept, ConceptRelationship, EducationalContent, AdaptedContent
 from app.models.assessment import (
     Assessment, AssessmentQuestion, AssessmentResponse,
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Text, Float, Table, JSON
+from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Text, Float, Table, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -30,6 +30,9 @@ class Concept(Base):
     # Отношения
     educational_content = relationship("EducationalContent", secondary=content_concept, back_populates="concepts")
 
+# Тип связи "source требует предварительного изучения target"
+PREREQUISITE_RELATIONSHIP = "prerequisite"
+
 class ConceptRelationship(Base):
     """Модель связи между концепциями."""
     __tablename__ = "concept_relationships"
@@ -40,6 +43,11 @@ class ConceptRelationship(Base):
     relationship_type = Column(String(50), nullable=False)
     strength = Column(Float, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    __table_args__ = (
+        Index("idx_concept_relationships_source_concept_id", "source_concept_id"),
+        Index("idx_concept_relationships_target_concept_id", "target_concept_id"),
+    )
 
 class EducationalContent(Base):
     """Модель образовательного контента."""
@@ -63,10 +71,19 @@ class AdaptedContent(Base):
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     original_content_id = Column(UUID(as_uuid=True), ForeignKey("educational_content.id", ondelete="CASCADE"), nullable=False)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Пусто для вариантов, заранее созданных для когорты учащихся
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
     title = Column(String(255), nullable=False)
     body = Column(Text, nullable=False)
     difficulty = Column(Float, nullable=False)
     adaptation_params = Column(JSON, nullable=False, default={})
+    # Ключ кэша адаптации: контент, его версия и квантованный профиль учащегося
+    cache_key = Column(String(64), nullable=True)
+    # Готовые варианты - ready; задания пакетной адаптации - pending до выполнения и failed при ошибке
+    status = Column(String(16), nullable=False, default="ready", server_default="ready")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    
+    __table_args__ = (
+        Index("idx_adapted_content_cache_key", "cache_key"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Integer, Enum, ForeignKey, Text, Float, Boolean, JSON
+from sqlalchemy import Column, String, DateTime, Date, Integer, Enum, ForeignKey, Text, Float, Boolean, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 import uuid
@@ -44,5 +44,43 @@ class ConceptMastery(Base):
     mastery_level = Column(Float, nullable=False, default=0.0)
     confidence = Column(Float, nullable=False, default=0.0)
     last_assessed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Состояние интервального повторения (SM-2)
+    ease_factor = Column(Float, nullable=False, default=2.5)
+    interval_days = Column(Float, nullable=False, default=0.0)
+    repetitions = Column(Integer, nullable=False, default=0)
+    next_review_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    
+    __table_args__ = (
+        # Очередь повторений учащегося: user_id = X AND next_review_at <= now
+        Index("idx_concept_mastery_user_next_review", "user_id", "next_review_at"),
+        # Повторения всех учащихся в интервале времени с постраничным обходом по id
+        Index("idx_concept_mastery_next_review", "next_review_at", "id"),
+    )
+
+class DailyReviewQueue(Base):
+    """Очередь повторений учащегося на день, рассчитанная заранее."""
+    __tablename__ = "daily_review_queues"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    queue_date = Column(Date, nullable=False)
+    # Концепции с временем повторения, по возрастанию времени
+    items = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    __table_args__ = (
+        Index("idx_daily_review_queues_user_date", "user_id", "queue_date", unique=True),
+    )
+
+class LearnerCohort(Base):
+    """Когорта учащихся со сходным стилем обучения и уровнем сложности."""
+    __tablename__ = "learner_cohorts"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    index = Column(Integer, nullable=False)
+    # Центр когорты: оценки стилей обучения и целевая сложность
+    centroid = Column(JSON, nullable=False)
+    size = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,213 @@
+import os
+import json
+import hashlib
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.content import EducationalContent, AdaptedContent
+from app.services.prompt_builder import ADAPTATION_TEMPLATE
+
+logger = logging.getLogger(__name__)
+
+# Параметры кэша адаптированного контента
+ADAPTATION_CACHE_ENABLED = os.getenv("ADAPTATION_CACHE_ENABLED", "true").lower() == "true"
+ADAPTATION_CACHE_MAX_ENTRIES = int(os.getenv("ADAPTATION_CACHE_MAX_ENTRIES", "5000"))
+# Шаг квантования целевой сложности: учащиеся из одного интервала получают один вариант
+ADAPTATION_DIFFICULTY_STEP = float(os.getenv("ADAPTATION_DIFFICULTY_STEP", "0.1"))
+
+# Целевая сложность, если уровень владения концепциями контента неизвестен
+DEFAULT_TARGET_DIFFICULTY = 0.5
+
+# Изменение шаблона адаптации делает недействительными ранее сохраненные варианты
+TEMPLATE_VERSION = hashlib.sha256(
+    (ADAPTATION_TEMPLATE.system_prompt + ADAPTATION_TEMPLATE.prefix + ADAPTATION_TEMPLATE.text).encode("utf-8")
+).hexdigest()[:8]
+
+def quantize_difficulty(difficulty: float, step: float = ADAPTATION_DIFFICULTY_STEP) -> float:
+    """Округляет сложность до ближайшего значения сетки с шагом step в пределах [0, 1]."""
+    difficulty = min(1.0, max(0.0, difficulty))
+    return round(round(difficulty / step) * step, 4)
+
+def target_difficulty(avg_mastery: Optional[float]) -> float:
+    """Целевая сложность немного выше текущего уровня владения (зона ближайшего развития)."""
+    if avg_mastery is None:
+        return DEFAULT_TARGET_DIFFICULTY
+    return min(1.0, avg_mastery + 0.2)
+
+def dominant_learning_style(learning_style: Dict[str, float]) -> str:
+    """Возвращает стиль обучения с наибольшей оценкой, как при формировании промпта адаптации."""
+    return max(learning_style.items(), key=lambda x: x[1])[0] if learning_style else "balanced"
+
+def content_version(content: EducationalContent) -> str:
+    """Версия контента - хэш его текста: любое изменение текста дает новую версию."""
+    return hashlib.sha256(content.body.encode("utf-8")).hexdigest()[:16]
+
+class AdaptationProfile(BaseModel):
+    """Квантованный профиль учащегося, от которого зависит результат адаптации."""
+    difficulty: float
+    style: str
+    interests: List[str]
+    background: str
+    
+    @classmethod
+    def from_profile(
+        cls,
+        target_difficulty: float,
+        learning_style: Dict[str, float],
+        preferences: Dict[str, Any]
+    ) -> "AdaptationProfile":
+        return cls(
+            difficulty=quantize_difficulty(target_difficulty),
+            style=dominant_learning_style(learning_style or {}),
+            interests=sorted({str(interest).strip().lower() for interest in (preferences or {}).get("interests", [])}),
+            background=str((preferences or {}).get("background", "general")).strip().lower()
+        )
+    
+    def signature(self) -> str:
+        """Подпись профиля: интервал сложности, доминирующий стиль и хэш интересов."""
+        interests_hash = hashlib.sha256(
+            json.dumps([self.interests, self.background], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:12]
+        return f"{self.difficulty:.2f}:{self.style}:{interests_hash}"
+    
+    def learning_style(self) -> Dict[str, float]:
+        """Стиль обучения для запроса к LLM, сводящийся к доминирующему стилю."""
+        return {} if self.style == "balanced" else {self.style: 1.0}
+    
+    def preferences(self) -> Dict[str, Any]:
+        """Предпочтения для запроса к LLM, содержащие только поля из подписи."""
+        return {"interests": self.interests, "background": self.background}
+
+def adaptation_cache_key(content: EducationalContent, profile: AdaptationProfile) -> str:
+    """Ключ кэша: контент, его версия, версия шаблона и подпись профиля."""
+    raw = f"{content.id}:{content_version(content)}:{TEMPLATE_VERSION}:{profile.signature()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class CachedAdaptation(BaseModel):
+    """Сохраненный вариант адаптированного контента."""
+    id: str
+    body: str
+    difficulty: float
+
+class AdaptationCache:
+    """Кэш адаптированного контента: LRU в памяти процесса перед таблицей AdaptedContent.
+    
+    Вариант, адаптированный для одного учащегося, выдается всем учащимся с тем
+    же ключом (см. adaptation_cache_key) без обращения к LLM.
+    """
+    
+    def __init__(self, max_entries: int = ADAPTATION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedAdaptation]" = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+    
+    def _remember(self, key: str, entry: CachedAdaptation) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    async def get(self, db: AsyncSession, key: str) -> Optional[CachedAdaptation]:
+        """Ищет вариант сначала в памяти, затем в таблице AdaptedContent."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return entry
+        
+        query = select(AdaptedContent).where(
+            AdaptedContent.cache_key == key,
+            AdaptedContent.status == "ready"
+        ).order_by(AdaptedContent.updated_at.desc()).limit(1)
+        result = await db.execute(query)
+        row = result.scalars().first()
+        if row is None:
+            self.misses += 1
+            return None
+        
+        self.db_hits += 1
+        entry = CachedAdaptation(id=str(row.id), body=row.body, difficulty=row.difficulty)
+        self._remember(key, entry)
+        return entry
+    
+    async def put(
+        self,
+        db: AsyncSession,
+        key: str,
+        content: EducationalContent,
+        user_id: Optional[uuid.UUID],
+        body: str,
+        difficulty: float,
+        adaptation_params: Dict[str, Any]
+    ) -> CachedAdaptation:
+        """Сохраняет вариант в AdaptedContent и в памяти.
+        
+        Хранится одна запись на пару контент-пользователь; варианты когорт
+        (user_id=None) хранятся по одной записи на ключ. Незавершенные задания
+        пакетной адаптации (status не ready) не перезаписываются.
+        """
+        if user_id is None:
+            query = select(AdaptedContent).where(
+                AdaptedContent.cache_key == key,
+                AdaptedContent.user_id.is_(None),
+                AdaptedContent.status == "ready"
+            )
+        else:
+            query = select(AdaptedContent).where(
+                AdaptedContent.original_content_id == content.id,
+                AdaptedContent.user_id == user_id,
+                AdaptedContent.status == "ready"
+            )
+        result = await db.execute(query)
+        row = result.scalars().first()
+        if row is None:
+            row = AdaptedContent(id=uuid.uuid4(), original_content_id=content.id, user_id=user_id, status="ready")
+            db.add(row)
+        
+        row.title = content.title
+        row.body = body
+        row.difficulty = difficulty
+        row.adaptation_params = adaptation_params
+        row.cache_key = key
+        
+        entry = CachedAdaptation(id=str(row.id), body=body, difficulty=difficulty)
+        try:
+            await db.commit()
+        except Exception as e:
+            # Результат адаптации возвращается и без сохранения, например при гонке записей
+            logger.error(f"Error saving adapted content {content.id} for user {user_id}: {e}")
+            await db.rollback()
+        
+        self._remember(key, entry)
+        return entry
+    
+    def clear(self) -> None:
+        self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.memory_hits + self.db_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.db_hits) / total if total else 0.0
+        }
+
+_adaptation_cache: Optional[AdaptationCache] = None
+
+def get_adaptation_cache() -> Optional[AdaptationCache]:
+    """Возвращает общий кэш адаптированного контента или None, если кэш выключен."""
+    global _adaptation_cache
+    if not ADAPTATION_CACHE_ENABLED:
+        return None
+    if _adaptation_cache is None:
+        _adaptation_cache = AdaptationCache()
+    return _adaptation_cache
@@ -1,18 +1,39 @@
+import os
 import uuid
-from typing import Dict, Any, List, Optional
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import json
 import logging
+import numpy as np
 
+from app.db.database import async_session
 from app.models.user import LearningProfile, ConceptMastery
 from app.models.content import Concept, EducationalContent, content_concept
 from app.services.llm_service import get_llm_provider
+from app.services.prompt_builder import FEEDBACK_TEMPLATE, render_prompt
+from app.services.llm_policy import plan_llm_call
+from app.services.adaptation_cache import (
+    AdaptationProfile, AdaptationCache, CachedAdaptation, adaptation_cache_key, get_adaptation_cache,
+    target_difficulty, dominant_learning_style
+)
+from app.services.feedback_templates import (
+    score_band, band_score, normalize_topics, needs_llm, render_feedback, feedback_cache_key, get_feedback_cache
+)
+from app.services.cohort_service import get_cohort_profile
+from app.services.content_sections import adapt_sections
+from app.services.concept_graph import get_concept_graph
+from app.services.path_scoring import order_by_curve, DEFAULT_DIFFICULTY, DEFAULT_MASTERY
+from app.services.learning_plan_service import build_learning_plan, save_learning_plan
 from app.services.profile_service import get_profile, get_concept_mastery
 
 logger = logging.getLogger(__name__)
 
+# Максимум одновременных обращений к LLM при пакетной адаптации
+ADAPT_BATCH_MAX_CONCURRENCY = int(os.getenv("ADAPT_BATCH_MAX_CONCURRENCY", "5"))
+
 class AdaptiveMechanisms:
     """Класс адаптивных механизмов для персонализации обучения."""
     
@@ -45,6 +66,64 @@ class AdaptiveMechanisms:
         related_concepts_result = await db.execute(related_concepts_query)
         related_concepts = related_concepts_result.scalars().all()
         
+        # Уровни владения нужны только для контента со связанными концепциями
+        masteries = {}
+        if related_concepts:
+            masteries = {
+                str(mastery.concept_id): mastery.mastery_level
+                for mastery in await get_concept_mastery(db, user_id)
+            }
+        
+        params, profile = AdaptiveMechanisms._adaptation_params(
+            user_profile, masteries, related_concepts, adaptation_params
+        )
+        
+        # Результат адаптации зависит только от версии контента и квантованного профиля,
+        # поэтому учащиеся с одинаковым ключом получают сохраненный вариант
+        cache = get_adaptation_cache()
+        cache_key, cached = await AdaptiveMechanisms._find_adaptation(
+            db, cache, original_content, profile, user_profile.learning_style if user_profile else {}
+        )
+        cache_hit = cached is not None
+        
+        # При разомкнутой цепи LLM сразу отдаем исходный контент, не дожидаясь таймаута
+        llm_provider = get_llm_provider()
+        if cached is None and not llm_provider.is_available():
+            return AdaptiveMechanisms._original_content(
+                original_content, related_concepts, "LLM provider is unavailable"
+            )
+        
+        # Использование LLM для адаптации контента
+        try:
+            if cached is None:
+                # Адаптация контента по разделам с использованием LLM по параметрам из ключа кэша
+                adapted_body, sections = await adapt_sections(llm_provider, original_content.body, profile)
+                if cache:
+                    cached = await cache.put(
+                        db, cache_key, original_content, user_id,
+                        adapted_body, profile.difficulty, params
+                    )
+            else:
+                adapted_body = cached.body
+                sections = None
+            
+            return AdaptiveMechanisms._adapted_content(
+                original_content, user_id, related_concepts, params, adapted_body, cached, cache_key, cache_hit, sections
+            )
+            
+        except Exception as e:
+            logger.error(f"Error adapting content: {e}")
+            # В случае ошибки возвращаем оригинальный контент
+            return AdaptiveMechanisms._original_content(original_content, related_concepts, str(e))
+    
+    @staticmethod
+    def _adaptation_params(
+        user_profile: Optional[LearningProfile],
+        masteries: Dict[str, float],
+        related_concepts: List[Concept],
+        adaptation_params: Optional[Dict[str, Any]]
+    ) -> Tuple[Dict[str, Any], AdaptationProfile]:
+        """Рассчитывает параметры адаптации и квантованный профиль учащегося для контента."""
         # Определение параметров адаптации
         params = {
             "target_difficulty": 0.5,
@@ -57,27 +136,15 @@ class AdaptiveMechanisms:
         if adaptation_params:
             params.update(adaptation_params)
         
-        # Корректировка целевой сложности на основе профиля
-        if related_concepts:
-            # Получение уровней владения пользователя релевантными концепциями
-            concept_mastery_list = await get_concept_mastery(db, user_id)
-            concept_mastery_dict = {
-                str(mastery.concept_id): mastery.mastery_level 
-                for mastery in concept_mastery_list
-            }
-            
-            # Вычисление среднего уровня владения релевантными концепциями
-            relevant_masteries = [
-                concept_mastery_dict.get(str(concept.id), 0.0) 
-                for concept in related_concepts
-                if str(concept.id) in concept_mastery_dict
-            ]
-            
-            if relevant_masteries:
-                avg_mastery = sum(relevant_masteries) / len(relevant_masteries)
-                # Целевая сложность: немного выше текущего уровня владения 
-                # (зона ближайшего развития)
-                params["target_difficulty"] = min(1.0, avg_mastery + 0.2)
+        # Корректировка целевой сложности по среднему уровню владения
+        # релевантными концепциями (зона ближайшего развития)
+        relevant_masteries = [
+            masteries[str(concept.id)]
+            for concept in related_concepts
+            if str(concept.id) in masteries
+        ]
+        if relevant_masteries:
+            params["target_difficulty"] = target_difficulty(sum(relevant_masteries) / len(relevant_masteries))
         
         # Определение предпочтительного стиля обучения
         learning_style = user_profile.learning_style if user_profile else {}
@@ -97,58 +164,218 @@ class AdaptiveMechanisms:
         # Получение предпочтений пользователя
         preferences = user_profile.preferences if user_profile else {}
         
-        # Использование LLM для адаптации контента
+        profile = AdaptationProfile.from_profile(params["target_difficulty"], learning_style, preferences)
+        params["target_difficulty"] = profile.difficulty
+        return params, profile
+    
+    @staticmethod
+    async def _find_adaptation(
+        db: AsyncSession,
+        cache: Optional[AdaptationCache],
+        content: EducationalContent,
+        profile: AdaptationProfile,
+        learning_style: Dict[str, float]
+    ) -> Tuple[str, Optional[CachedAdaptation]]:
+        """Ищет сохраненный вариант для профиля учащегося, затем для его когорты."""
+        cache_key = adaptation_cache_key(content, profile)
+        cached = await cache.get(db, cache_key) if cache else None
+        if cached is None and cache:
+            # Вариант, заранее созданный для когорты учащегося (см. cohort_service)
+            cohort_profile = await get_cohort_profile(db, learning_style, profile.difficulty)
+            if cohort_profile is not None:
+                cohort_key = adaptation_cache_key(content, cohort_profile)
+                cohort_cached = await cache.get(db, cohort_key)
+                if cohort_cached is not None:
+                    return cohort_key, cohort_cached
+        return cache_key, cached
+    
+    @staticmethod
+    def _adapted_content(
+        original_content: EducationalContent,
+        user_id: uuid.UUID,
+        related_concepts: List[Concept],
+        params: Dict[str, Any],
+        adapted_body: str,
+        cached: Optional[CachedAdaptation],
+        cache_key: str,
+        cache_hit: bool,
+        sections: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Any]:
+        """Создает копию исходного контента с адаптированными данными."""
+        adapted_content = {
+            "id": cached.id if cached else str(uuid.uuid4()),
+            "original_content_id": str(original_content.id),
+            "user_id": str(user_id),
+            "title": original_content.title,
+            "content_type": original_content.content_type,
+            "body": adapted_body,
+            "difficulty": params["target_difficulty"],
+            "concepts": [str(concept.id) for concept in related_concepts],
+            "created_at": datetime.now().isoformat(),
+            "metadata": {
+                "adaptation": {
+                    "original_difficulty": original_content.difficulty,
+                    "target_difficulty": params["target_difficulty"],
+                    "preferred_learning_style": params["preferred_learning_style"],
+                    "adaptation_params": params,
+                    "cache_key": cache_key,
+                    "cache_hit": cache_hit
+                }
+            }
+        }
+        if sections:
+            # Число разделов и сколько из них взято из кэша разделов
+            adapted_content["metadata"]["adaptation"]["sections"] = sections
+        return adapted_content
+    
+    @staticmethod
+    async def prepare_content_batch(
+        db: AsyncSession,
+        user_id: uuid.UUID,
+        content_ids: List[uuid.UUID],
+        adaptation_params: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Готовит пакетную адаптацию контента для одного учащегося.
+        
+        Профиль, уровни владения, контент и связанные концепции загружаются
+        одним запросом каждый на весь пакет, после чего для каждого элемента
+        ищется сохраненный вариант. Обращения к LLM выполняет adapt_content_batch.
+        """
+        user_profile = await get_profile(db, user_id)
+        masteries = {
+            str(mastery.concept_id): mastery.mastery_level
+            for mastery in await get_concept_mastery(db, user_id)
+        }
+        
+        content_result = await db.execute(
+            select(EducationalContent).where(EducationalContent.id.in_(content_ids))
+        )
+        contents = {content.id: content for content in content_result.scalars().all()}
+        
+        related_concepts_query = select(content_concept.c.content_id, Concept).join(
+            content_concept, content_concept.c.concept_id == Concept.id
+        ).where(
+            content_concept.c.content_id.in_(content_ids)
+        )
+        related_concepts_result = await db.execute(related_concepts_query)
+        related_concepts: Dict[uuid.UUID, List[Concept]] = {}
+        for content_id, concept in related_concepts_result.all():
+            related_concepts.setdefault(content_id, []).append(concept)
+        
+        cache = get_adaptation_cache()
+        learning_style = user_profile.learning_style if user_profile else {}
+        items = []
+        for index, content_id in enumerate(content_ids):
+            content = contents.get(content_id)
+            item = {"index": index, "content_id": content_id, "content": content}
+            if content is not None:
+                item["concepts"] = related_concepts.get(content_id, [])
+                item["params"], item["profile"] = AdaptiveMechanisms._adaptation_params(
+                    user_profile, masteries, item["concepts"], adaptation_params
+                )
+                item["cache_key"], item["cached"] = await AdaptiveMechanisms._find_adaptation(
+                    db, cache, content, item["profile"], learning_style
+                )
+            items.append(item)
+        
+        return {"user_id": user_id, "items": items}
+    
+    @staticmethod
+    async def adapt_content_batch(
+        batch: Dict[str, Any],
+        max_concurrency: int = ADAPT_BATCH_MAX_CONCURRENCY
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Адаптирует подготовленный пакет, отдавая результаты по мере готовности.
+        
+        Сохраненные варианты отдаются сразу, обращения к LLM выполняются
+        параллельно, не более max_concurrency одновременно. Ошибка элемента
+        не прерывает пакет: для него отдается исходный контент со статусом
+        error. Новые варианты сохраняются в отдельной сессии БД, так как
+        поток переживает сессию запроса.
+        """
+        user_id = batch["user_id"]
         llm_provider = get_llm_provider()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def adapt(profile: AdaptationProfile, content: EducationalContent) -> Tuple[str, Dict[str, int]]:
+            # Семафор пакета ограничивает обращения к LLM по разделам всех элементов
+            return await adapt_sections(llm_provider, content.body, profile, semaphore)
+        
+        def result(item: Dict[str, Any], content: Optional[Dict[str, Any]], error: Optional[str] = None) -> Dict[str, Any]:
+            line = {"index": item["index"], "content_id": str(item["content_id"]), "status": "error" if error else "ok"}
+            if content is not None:
+                line["content"] = content
+            if error:
+                line["error"] = error
+            return line
         
+        pending: Dict[asyncio.Future, Dict[str, Any]] = {}
         try:
-            # Адаптация контента с использованием LLM
-            adapted_body = await llm_provider.adapt_content(
-                content=original_content.body,
-                target_difficulty=params["target_difficulty"],
-                learning_style=learning_style,
-                preferences=preferences
-            )
-            
-            # Создание копии исходного контента с адаптированными данными
-            adapted_content = {
-                "id": str(uuid.uuid4()),
-                "original_content_id": str(content_id),
-                "user_id": str(user_id),
-                "title": original_content.title,
-                "content_type": original_content.content_type,
-                "body": adapted_body,
-                "difficulty": params["target_difficulty"],
-                "concepts": [str(concept.id) for concept in related_concepts],
-                "created_at": datetime.now().isoformat(),
-                "metadata": {
-                    "adaptation": {
-                        "original_difficulty": original_content.difficulty,
-                        "target_difficulty": params["target_difficulty"],
-                        "preferred_learning_style": params["preferred_learning_style"],
-                        "adaptation_params": params
-                    }
-                }
-            }
-            
-            return adapted_content
-            
-        except Exception as e:
-            logger.error(f"Error adapting content: {e}")
-            # В случае ошибки возвращаем оригинальный контент
-            return {
-                "id": str(content_id),
-                "title": original_content.title,
-                "content_type": original_content.content_type,
-                "body": original_content.body,
-                "difficulty": original_content.difficulty,
-                "concepts": [str(concept.id) for concept in related_concepts],
-                "created_at": original_content.created_at.isoformat(),
-                "updated_at": original_content.updated_at.isoformat(),
-                "metadata": {
-                    "error": f"Failed to adapt content: {str(e)}",
-                    "original_metadata": original_content.metadata
-                }
+            for item in batch["items"]:
+                content = item["content"]
+                if content is None:
+                    yield result(item, None, f"Content with id {item['content_id']} not found")
+                elif item["cached"] is not None:
+                    yield result(item, AdaptiveMechanisms._adapted_content(
+                        content, user_id, item["concepts"], item["params"], item["cached"].body,
+                        item["cached"], item["cache_key"], True
+                    ))
+                elif not llm_provider.is_available():
+                    reason = "LLM provider is unavailable"
+                    yield result(item, AdaptiveMechanisms._original_content(content, item["concepts"], reason), reason)
+                else:
+                    pending[asyncio.ensure_future(adapt(item["profile"], content))] = item
+            
+            cache = get_adaptation_cache()
+            async with async_session() as db:
+                while pending:
+                    done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        item = pending.pop(task)
+                        content = item["content"]
+                        try:
+                            adapted_body, sections = task.result()
+                        except Exception as e:
+                            logger.error(f"Error adapting content {content.id} in batch: {e}")
+                            yield result(item, AdaptiveMechanisms._original_content(content, item["concepts"], str(e)), str(e))
+                            continue
+                        
+                        cached = None
+                        if cache:
+                            cached = await cache.put(
+                                db, item["cache_key"], content, user_id,
+                                adapted_body, item["profile"].difficulty, item["params"]
+                            )
+                        yield result(item, AdaptiveMechanisms._adapted_content(
+                            content, user_id, item["concepts"], item["params"], adapted_body,
+                            cached, item["cache_key"], False, sections
+                        ))
+        finally:
+            # Клиент отключился: незавершенные обращения к LLM отменяются
+            for task in pending:
+                task.cancel()
+    
+    @staticmethod
+    def _original_content(
+        original_content: EducationalContent,
+        related_concepts: List[Concept],
+        reason: str
+    ) -> Dict[str, Any]:
+        """Возвращает исходный контент, когда адаптация недоступна."""
+        return {
+            "id": str(original_content.id),
+            "title": original_content.title,
+            "content_type": original_content.content_type,
+            "body": original_content.body,
+            "difficulty": original_content.difficulty,
+            "concepts": [str(concept.id) for concept in related_concepts],
+            "created_at": original_content.created_at.isoformat(),
+            "updated_at": original_content.updated_at.isoformat(),
+            "metadata": {
+                "error": f"Failed to adapt content: {reason}",
+                "original_metadata": original_content.metadata
             }
+        }
     
     @staticmethod
     async def generate_adaptive_feedback(
@@ -189,76 +416,132 @@ class AdaptiveMechanisms:
         # Получение мотивационного профиля (если есть)
         motivation_profile = preferences.get("motivation_profile", {})
         
+        score = assessment_result.get("total_score", 0.0)
+        band = score_band(score)
+        strengths = normalize_topics(assessment_result.get("strengths"))
+        weaknesses = normalize_topics(assessment_result.get("areas_for_improvement"))
+        if preferences.get("feedback_preferences", {}).get("use_llm"):
+            params.setdefault("use_llm", True)
+        
+        # Типовые результаты получают обратную связь по шаблону без обращения к LLM
+        if not needs_llm(band, strengths, weaknesses, feedback_style, params):
+            return AdaptiveMechanisms._template_feedback(assessment_result, strengths, weaknesses, feedback_style, params)
+        
+        # Ответы LLM кэшируются по полосе оценки, темам, стилю и параметрам промпта
+        cache = get_feedback_cache()
+        learning_style = {dominant_learning_style(learning_style): 1.0} if learning_style else {}
+        cache_key = feedback_cache_key(band, strengths, weaknesses, feedback_style, {
+            "learning_style": learning_style,
+            "motivation_profile": motivation_profile,
+            "motivational_tone": params["motivational_tone"],
+            "include_next_steps": params["include_next_steps"],
+            "detail_level": params["detail_level"]
+        })
+        cached_text = await cache.get(cache_key)
+        if cached_text is not None:
+            return AdaptiveMechanisms._llm_feedback(assessment_result, cached_text, feedback_style, params, band, True)
+        
         # Создание промпта для генерации обратной связи
         llm_provider = get_llm_provider()
+        if not llm_provider.is_available():
+            return AdaptiveMechanisms._template_feedback(
+                assessment_result, strengths, weaknesses, feedback_style, params, "LLM provider is unavailable"
+            )
         
         try:
-            # Подготовка промпта для LLM
-            prompt = f"""
-            Сгенерируйте персонализированную образовательную обратную связь для учащегося на основе результатов оценки.
-            
-            Результаты оценки:
-            - Оценка: {assessment_result.get('total_score', 0.0):.2f} из 1.0
-            - Сильные стороны: {', '.join(assessment_result.get('strengths', ['Не указано']))}
-            - Области для улучшения: {', '.join(assessment_result.get('areas_for_improvement', ['Не указано']))}
-            
-            Профиль учащегося:
-            - Стиль обучения: {json.dumps(learning_style)}
-            - Мотивационный профиль: {json.dumps(motivation_profile)}
-            
-            Параметры обратной связи:
-            - Стиль: {feedback_style}
-            - Мотивационный тон: {params['motivational_tone']}
-            - Включать следующие шаги: {params['include_next_steps']}
-            - Уровень детализации: {params['detail_level']}
-            
-            Сгенерируйте персонализированную обратную связь, которая:
-            1. Обращается к конкретным сильным и слабым сторонам в ответе учащегося
-            2. Адаптирована к его стилю обучения и мотивационному профилю
-            3. Предоставляет конкретные предложения по улучшению
-            4. Использует {feedback_style} тон, который будет хорошо воспринят учащимся
-            5. {"Включает конкретные следующие шаги или предложения по практике" if params['include_next_steps'] else "Фокусируется только на текущем ответе"}
+            # Подготовка промпта для LLM: оценка заменяется типичной для полосы
+            prompt = render_prompt(
+                FEEDBACK_TEMPLATE,
+                total_score=band_score(band),
+                strengths=', '.join(strengths or ['Не указано']),
+                areas_for_improvement=', '.join(weaknesses or ['Не указано']),
+                learning_style=json.dumps(learning_style),
+                motivation_profile=json.dumps(motivation_profile),
+                feedback_style=feedback_style,
+                motivational_tone=params['motivational_tone'],
+                include_next_steps=params['include_next_steps'],
+                detail_level=params['detail_level'],
+                next_steps_instruction=(
+                    "Включите конкретные следующие шаги или предложения по практике."
+                    if params['include_next_steps'] else "Сосредоточьтесь только на текущем ответе."
+                )
+            )
             
-            Верните обратную связь как связный абзац без метакомментариев или заголовков разделов.
-            """
+            # Краткая обратная связь генерируется быстрой моделью
+            plan = plan_llm_call("feedback", detail_level=params['detail_level'])
             
             # Генерация обратной связи с помощью LLM
             response = await llm_provider.generate(
-                prompt=prompt,
-                max_tokens=1000,
+                prompt=prompt.text,
+                max_tokens=plan.max_tokens,
                 temperature=0.5,
-                metadata={"system_prompt": "Вы - опытный педагог, который предоставляет полезную и мотивирующую обратную связь учащимся."}
+                metadata=prompt.metadata(call_site="feedback", tier=plan.tier)
             )
             
-            # Формирование итогового объекта обратной связи
-            feedback = {
-                "feedback_id": str(uuid.uuid4()),
-                "assessment_id": assessment_result.get("result_id", "unknown"),
-                "content": response.text.strip(),
-                "type": "adaptive",
-                "metadata": {
-                    "feedback_style": feedback_style,
-                    "score_context": assessment_result.get("total_score", 0.0),
-                    "generation_params": params,
-                    "timestamp": datetime.now().isoformat()
-                }
-            }
-            
-            return feedback
+            text = response.text.strip()
+            await cache.set(cache_key, text)
+            return AdaptiveMechanisms._llm_feedback(assessment_result, text, feedback_style, params, band, False)
             
         except Exception as e:
             logger.error(f"Error generating adaptive feedback: {e}")
-            # В случае ошибки возвращаем базовую обратную связь
-            return {
-                "feedback_id": str(uuid.uuid4()),
-                "assessment_id": assessment_result.get("result_id", "unknown"),
-                "content": f"Ваш общий результат: {assessment_result.get('total_score', 0.0):.2f} из 1.0. Продолжайте практиковаться для улучшения понимания.",
-                "type": "basic",
-                "metadata": {
-                    "error": f"Failed to generate adaptive feedback: {str(e)}",
-                    "timestamp": datetime.now().isoformat()
-                }
+            # В случае ошибки возвращаем обратную связь по шаблону
+            return AdaptiveMechanisms._template_feedback(
+                assessment_result, strengths, weaknesses, feedback_style, params, str(e)
+            )
+    
+    @staticmethod
+    def _llm_feedback(
+        assessment_result: Dict[str, Any],
+        text: str,
+        feedback_style: str,
+        params: Dict[str, Any],
+        band: str,
+        cache_hit: bool
+    ) -> Dict[str, Any]:
+        """Формирует объект обратной связи, сгенерированной LLM."""
+        return {
+            "feedback_id": str(uuid.uuid4()),
+            "assessment_id": assessment_result.get("result_id", "unknown"),
+            "content": text,
+            "type": "adaptive",
+            "metadata": {
+                "feedback_style": feedback_style,
+                "score_context": assessment_result.get("total_score", 0.0),
+                "score_band": band,
+                "generation_params": params,
+                "cache_hit": cache_hit,
+                "timestamp": datetime.now().isoformat()
             }
+        }
+    
+    @staticmethod
+    def _template_feedback(
+        assessment_result: Dict[str, Any],
+        strengths: List[str],
+        weaknesses: List[str],
+        feedback_style: str,
+        params: Dict[str, Any],
+        reason: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Возвращает обратную связь по шаблону без обращения к LLM."""
+        score = assessment_result.get("total_score", 0.0)
+        metadata = {
+            "feedback_style": feedback_style,
+            "score_context": score,
+            "score_band": score_band(score),
+            "generation_params": params,
+            "timestamp": datetime.now().isoformat()
+        }
+        if reason:
+            metadata["error"] = f"Failed to generate adaptive feedback: {reason}"
+        
+        return {
+            "feedback_id": str(uuid.uuid4()),
+            "assessment_id": assessment_result.get("result_id", "unknown"),
+            "content": render_feedback(score, strengths, weaknesses, feedback_style, params["include_next_steps"]),
+            "type": "template",
+            "metadata": metadata
+        }
     
     @staticmethod
     async def optimize_learning_path(
@@ -283,39 +566,38 @@ class AdaptiveMechanisms:
         if path_params:
             params.update(path_params)
         
-        # Получение данных о концепциях
-        concept_data = {}
-        for concept_id in concept_ids:
-            concept_query = select(Concept).where(Concept.id == concept_id)
-            concept_result = await db.execute(concept_query)
-            concept = concept_result.scalars().first()
-            
-            if concept:
-                # Получение предварительных требований для концепции
-                prereq_query = select(Concept).join(
-                    # Здесь предполагается наличие таблицы связей concept_prerequisites
-                    # В реальном приложении эту таблицу нужно создать
-                    # content_prerequisites, content_prerequisites.c.target_concept_id == Concept.id
-                ).where(
-                    # content_prerequisites.c.source_concept_id == concept_id
-                    Concept.id != concept_id  # Временная заглушка
-                ).limit(3)  # Для примера ограничиваем количество предварительных требований
-                
-                prereq_result = await db.execute(prereq_query)
-                prerequisites = prereq_result.scalars().all()
-                
-                concept_data[str(concept_id)] = {
-                    "name": concept.name,
-                    "difficulty": concept.difficulty,
-                    "prerequisites": [str(prereq.id) for prereq in prerequisites],
-                    "domain": concept.domain
-                }
+        # Концепции и уровни владения загружаются двумя запросами независимо от размера
+        # плана, предварительные требования берутся из графа концепций в памяти
+        concept_query = select(Concept).where(Concept.id.in_(concept_ids))
+        concept_result = await db.execute(concept_query)
+        concepts = concept_result.scalars().all()
         
-        # Получение уровней владения концепциями
-        concept_mastery_list = await get_concept_mastery(db, user_id)
-        mastery_levels = {
-            str(mastery.concept_id): mastery.mastery_level 
-            for mastery in concept_mastery_list
+        mastery_query = select(
+            ConceptMastery.concept_id, ConceptMastery.mastery_level, ConceptMastery.next_review_at
+        ).where(
+            ConceptMastery.user_id == user_id,
+            ConceptMastery.concept_id.in_(concept_ids)
+        )
+        mastery_result = await db.execute(mastery_query)
+        mastery_levels = {}
+        # Расписание повторений SM-2: из него строятся занятия повторения плана
+        next_reviews = {}
+        for concept_id, level, next_review_at in mastery_result.all():
+            mastery_levels[str(concept_id)] = level
+            if next_review_at is not None:
+                next_reviews[str(concept_id)] = next_review_at.isoformat()
+        
+        concept_graph = await get_concept_graph(db)
+        
+        # Получение данных о концепциях
+        concept_data = {
+            str(concept.id): {
+                "name": concept.name,
+                "difficulty": concept.difficulty,
+                "prerequisites": concept_graph.prerequisites(str(concept.id)),
+                "domain": concept.domain
+            }
+            for concept in concepts
         }
         
         # Добавление уровней владения для концепций, которых нет в профиле
@@ -323,213 +605,39 @@ class AdaptiveMechanisms:
             if str(concept_id) not in mastery_levels:
                 mastery_levels[str(concept_id)] = 0.0
         
-        # Создание графа зависимостей концепций
-        dependency_graph = {}
-        for concept_id, data in concept_data.items():
-            dependency_graph[concept_id] = data["prerequisites"]
-        
-        # Топологическая сортировка для определения базового порядка
-        def topological_sort(graph):
-            """Выполняет топологическую сортировку графа."""
-            visited = set()
-            temp = set()
-            order = []
-            
-            def dfs(node):
-                if node in temp:
-                    # В случае циклической зависимости продолжаем с другими узлами
-                    return
-                if node in visited:
-                    return
-                
-                temp.add(node)
-                for neighbor in graph.get(node, []):
-                    if neighbor in graph:  # Проверка наличия соседа в графе
-                        dfs(neighbor)
-                
-                temp.remove(node)
-                visited.add(node)
-                order.append(node)
-            
-            for node in graph:
-                if node not in visited:
-                    dfs(node)
-            
-            return order[::-1]  # Обратный порядок для получения правильной последовательности
+        # Базовый порядок: требования раньше зависящих от них концепций
+        base_sequence = concept_graph.topological_order([str(c) for c in concept_ids])
         
-        # Получение базового порядка концепций с учетом зависимостей
-        try:
-            base_sequence = topological_sort(dependency_graph)
-            
-            # Фильтрация только до запрошенных концепций с сохранением порядка
-            base_sequence = [c for c in base_sequence if c in [str(cid) for cid in concept_ids]]
-            
-            # Добавление концепций, которые не попали в сортировку
-            missing_concepts = [str(c) for c in concept_ids if str(c) not in base_sequence]
-            base_sequence.extend(missing_concepts)
-        except Exception as e:
-            logger.error(f"Error in topological sort: {e}")
-            # В случае ошибки используем исходный порядок концепций
-            base_sequence = [str(c) for c in concept_ids]
-        
-        # Оптимизация последовательности на основе параметров
-        optimized_sequence = []
-        
-        if params["target_difficulty_curve"] == "gradual":
-            # Сортировка по сложности (с учетом текущего уровня владения)
-            weighted_difficulty = {
-                c: concept_data.get(c, {}).get("difficulty", 0.5) * (1 - mastery_levels.get(c, 0.0)) 
-                for c in base_sequence
-            }
-            optimized_sequence = sorted(base_sequence, key=lambda c: weighted_difficulty.get(c, 0.5))
-            
-        elif params["target_difficulty_curve"] == "challenging":
-            # Сначала базовые зависимости, затем по убыванию сложности
-            levels = []
-            remaining = set(base_sequence)
-            
-            while remaining:
-                # Находим концепции, чьи все зависимости уже в уровнях
-                level_concepts = []
-                for concept in list(remaining):
-                    if all(prereq not in remaining for prereq in dependency_graph.get(concept, [])):
-                        level_concepts.append(concept)
-                        remaining.remove(concept)
-                
-                if not level_concepts and remaining:
-                    # Если не можем добавить ни одной концепции, но остались концепции,
-                    # добавляем оставшиеся (возможно, из-за циклических зависимостей)
-                    level_concepts = list(remaining)
-                    remaining.clear()
-                
-                # Сортируем уровень по сложности (от сложного к простому)
-                level_concepts.sort(
-                    key=lambda c: concept_data.get(c, {}).get("difficulty", 0.5), 
-                    reverse=True
-                )
-                levels.append(level_concepts)
-            
-            # Соединяем все уровни
-            for level in levels:
-                optimized_sequence.extend(level)
-            
-        else:  # "adaptive" или другое
-            # Адаптивный подход - чередуем разные уровни сложности
-            difficulty_bands = {
-                "low": [],
-                "medium": [],
-                "high": []
+        # Оптимизация последовательности на основе параметров: ключи сортировки
+        # рассчитываются над массивами сразу для всех концепций
+        difficulty = np.fromiter(
+            (concept_data.get(c, {}).get("difficulty", DEFAULT_DIFFICULTY) for c in base_sequence),
+            dtype=np.float64, count=len(base_sequence)
+        )
+        mastery = np.fromiter(
+            (mastery_levels.get(c, DEFAULT_MASTERY) for c in base_sequence),
+            dtype=np.float64, count=len(base_sequence)
+        )
+        order = order_by_curve(
+            params["target_difficulty_curve"], difficulty, mastery, concept_graph.levels_of(base_sequence)
+        )
+        optimized_sequence = [base_sequence[index] for index in order]
+        
+        # Разбиение на учебные сессии с детерминированными идентификаторами
+        # сессий и занятий, которые сохраняются при перепланировании
+        sequence = [
+            {
+                "concept_id": concept_id,
+                "name": concept_data.get(concept_id, {}).get("name", f"Concept {concept_id}"),
+                "difficulty": concept_data.get(concept_id, {}).get("difficulty", DEFAULT_DIFFICULTY),
+                "current_mastery": mastery_levels.get(concept_id, DEFAULT_MASTERY),
+                "next_review_at": next_reviews.get(concept_id)
             }
-            
-            for concept in base_sequence:
-                # Эффективная сложность: сложность * (1 - уровень владения)
-                effective_difficulty = concept_data.get(concept, {}).get("difficulty", 0.5) * (1 - mastery_levels.get(concept, 0.0))
-                
-                if effective_difficulty < 0.3:
-                    difficulty_bands["low"].append(concept)
-                elif effective_difficulty < 0.7:
-                    difficulty_bands["medium"].append(concept)
-                else:
-                    difficulty_bands["high"].append(concept)
-            
-            # Формирование последовательности - сначала простые, затем средние, потом сложные
-            optimized_sequence = (
-                difficulty_bands["low"] + 
-                difficulty_bands["medium"] + 
-                difficulty_bands["high"]
-            )
-        
-        # Разбиение на учебные сессии
-        max_per_session = params["max_concepts_per_session"]
-        sessions = []
+            for concept_id in optimized_sequence
+        ]
+        learning_plan = build_learning_plan(str(uuid.uuid4()), user_id, concept_ids, sequence, params)
         
-        for i in range(0, len(optimized_sequence), max_per_session):
-            session_concepts = optimized_sequence[i:i+max_per_session]
-            
-            # Создание сессии
-            session = {
-                "session_id": str(uuid.uuid4()),
-                "concepts": [
-                    {
-                        "concept_id": concept_id,
-                        "name": concept_data.get(concept_id, {}).get("name", f"Concept {concept_id}"),
-                        "difficulty": concept_data.get(concept_id, {}).get("difficulty", 0.5),
-                        "current_mastery": mastery_levels.get(concept_id, 0.0)
-                    }
-                    for concept_id in session_concepts
-                ],
-                "estimated_duration_minutes": 30 * len(session_concepts),
-                "activities": []
-            }
-            
-            # Добавление активностей для каждой концепции
-            for concept_id in session_concepts:
-                # Основное изучение
-                session["activities"].append({
-                    "activity_id": str(uuid.uuid4()),
-                    "activity_type": "learn",
-                    "concept_id": concept_id,
-                    "difficulty": concept_data.get(concept_id, {}).get("difficulty", 0.5),
-                    "duration_minutes": 15
-                })
-                
-                # Добавление оценки, если требуется
-                if params["include_assessments"]:
-                    session["activities"].append({
-                        "activity_id": str(uuid.uuid4()),
-                        "activity_type": "assess",
-                        "concept_id": concept_id,
-                        "difficulty": concept_data.get(concept_id, {}).get("difficulty", 0.5),
-                        "duration_minutes": 10
-                    })
-            
-            sessions.append(session)
-        
-        # Если включено интервальное повторение, добавляем повторения в последующие сессии
-        if params["spaced_repetition"] and len(sessions) > 1:
-            for i in range(1, len(sessions)):
-                # Получаем концепции из предыдущих сессий для повторения
-                repeat_candidates = []
-                
-                # Из предыдущей сессии повторяем все
-                for concept in sessions[i-1]["concepts"]:
-                    repeat_candidates.append(concept["concept_id"])
-                
-                # Из более ранних сессий повторяем выборочно
-                if i > 1:
-                    for j in range(0, i-1):
-                        for concept in sessions[j]["concepts"]:
-                            # Повторяем только концепции с низким уровнем владения
-                            if mastery_levels.get(concept["concept_id"], 0.0) < 0.6:
-                                repeat_candidates.append(concept["concept_id"])
-                
-                # Ограничиваем количество повторений
-                repeat_candidates = repeat_candidates[:2]  # Не более 2 повторений
-                
-                # Добавляем активности повторения
-                for concept_id in repeat_candidates:
-                    sessions[i]["activities"].append({
-                        "activity_id": str(uuid.uuid4()),
-                        "activity_type": "review",
-                        "concept_id": concept_id,
-                        "difficulty": concept_data.get(concept_id, {}).get("difficulty", 0.5),
-                        "duration_minutes": 5
-                    })
-        
-        # Формирование итогового плана обучения
-        learning_plan = {
-            "plan_id": str(uuid.uuid4()),
-            "user_id": str(user_id),
-            "created_at": datetime.now().isoformat(),
-            "concepts": [str(cid) for cid in concept_ids],
-            "sessions": sessions,
-            "metadata": {
-                "target_difficulty_curve": params["target_difficulty_curve"],
-                "spaced_repetition": params["spaced_repetition"],
-                "total_concepts": len(concept_ids),
-                "total_sessions": len(sessions),
-                "estimated_total_duration_minutes": sum(session["estimated_duration_minutes"] for session in sessions)
-            }
-        }
+        # План сохраняется, чтобы изменения уровня владения обновляли его инкрементально
+        await save_learning_plan(db, user_id, learning_plan)
         
         return learning_plan
@@ -2,16 +2,24 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
+import logging
 
+from app.db.database import async_session
 from app.models.assessment import LearningInteraction, LearningSession
 from app.api.schemas import ChatRequest, ChatResponse
 from app.services.llm_service import get_llm_provider
+from app.services.prompt_builder import CHAT_TEMPLATE, render_prompt, estimate_tokens
+from app.services.llm_policy import plan_llm_call
 from app.services.rag_service import get_educational_context
 from app.services.profile_service import get_profile
 
-async def process_message(db: AsyncSession, request: ChatRequest) -> ChatResponse:
-    """Обрабатывает сообщение чата и генерирует ответ."""
+logger = logging.getLogger(__name__)
+
+CHAT_SYSTEM_PROMPT = CHAT_TEMPLATE.system_prompt
+
+async def prepare_chat(db: AsyncSession, request: ChatRequest) -> Dict[str, Any]:
+    """Сохраняет сообщение пользователя и собирает промпт для ответа ассистента."""
     # Создание или получение сессии
     session_id = request.session_id or uuid.uuid4()
     
@@ -50,32 +58,56 @@ async def process_message(db: AsyncSession, request: ChatRequest) -> ChatRespons
     # Получение образовательного контекста
     context = await get_educational_context(db, request.message, profile)
     
-    # Получение LLM для генерации ответа
-    llm_provider = get_llm_provider()
-    
-    # Составление промпта для LLM
-    prompt = f"""
-    Вы - адаптивный образовательный ассистент, помогающий пользователю в обучении.
-    
-    Сообщение пользователя: {request.message}
+    # Составление промпта для LLM; документы укладываются в бюджет по релевантности
+    prompt = render_prompt(
+        CHAT_TEMPLATE,
+        context=context["documents"],
+        message=request.message,
+        user_profile=context["user_profile"]
+    )
     
-    Образовательный контекст:
-    {context["educational_context"]}
+    return {
+        "session_id": session_id,
+        "prompt": prompt.text,
+        "cache_prefix": prompt.cache_prefix,
+        "plan": plan_llm_call("chat", input_tokens=estimate_tokens(request.message)),
+        "context": context
+    }
+
+async def store_assistant_message(db: AsyncSession, user_id: uuid.UUID, response: ChatResponse) -> None:
+    """Сохраняет ответ ассистента как взаимодействие."""
+    assistant_message = LearningInteraction(
+        id=response.message_id,
+        user_id=user_id,
+        session_id=response.session_id,
+        interaction_type="chat_message",
+        content={"role": "assistant", "message": response.content},
+        metadata=response.metadata,
+        timestamp=response.timestamp
+    )
     
-    Профиль пользователя:
-    {context["user_profile"]}
+    db.add(assistant_message)
+    await db.commit()
+
+async def process_message(db: AsyncSession, request: ChatRequest) -> ChatResponse:
+    """Обрабатывает сообщение чата и генерирует ответ."""
+    chat = await prepare_chat(db, request)
     
-    Отвечайте в соответствии с профилем пользователя и предоставленным образовательным контекстом.
-    Будьте полезны, точны и адаптивны - подстраивайте объяснения под стиль обучения и уровень пользователя.
-    """
+    # Получение LLM для генерации ответа
+    llm_provider = get_llm_provider()
     
     # Генерация ответа с помощью LLM
     llm_response = await llm_provider.generate(
-        prompt=prompt,
-        max_tokens=1500,
+        prompt=chat["prompt"],
+        max_tokens=chat["plan"].max_tokens,
         temperature=0.7,
         metadata={
-            "system_prompt": "Вы - адаптивный образовательный ассистент, который персонализирует ответы под профиль конкретного учащегося."
+            "system_prompt": CHAT_SYSTEM_PROMPT,
+            "cache_prefix": chat["cache_prefix"],
+            "tier": chat["plan"].tier,
+            # Ответы чата генерируются с высокой температурой и не кэшируются
+            "cache": False,
+            "call_site": "chat"
         }
     )
     
@@ -84,26 +116,70 @@ async def process_message(db: AsyncSession, request: ChatRequest) -> ChatRespons
         message_id=uuid.uuid4(),
         role="assistant",
         content=llm_response.text,
-        session_id=session_id,
+        session_id=chat["session_id"],
         timestamp=datetime.now(),
         metadata={
-            "concepts_referenced": context.get("concepts_referenced", []),
+            "concepts_referenced": chat["context"].get("concepts_referenced", []),
             "adaptive_context": True
         }
     )
     
     # Сохранение ответа ассистента
-    assistant_message = LearningInteraction(
-        id=uuid.uuid4(),
-        user_id=request.user_id,
-        session_id=session_id,
-        interaction_type="chat_message",
-        content={"role": "assistant", "message": response.content},
-        metadata=response.metadata,
-        timestamp=response.timestamp
+    await store_assistant_message(db, request.user_id, response)
+    
+    return response
+
+async def stream_message(request: ChatRequest, chat: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Генерирует ответ ассистента по частям.
+    
+    Отдает события start, token и done (или error). Ответ сохраняется после
+    завершения генерации в отдельной сессии БД, так как поток переживает
+    сессию запроса.
+    """
+    message_id = uuid.uuid4()
+    yield {"event": "start", "data": {"message_id": str(message_id), "session_id": str(chat["session_id"])}}
+    
+    llm_provider = get_llm_provider()
+    chunks = []
+    failed = False
+    
+    try:
+        async for chunk in llm_provider.generate_stream(
+            prompt=chat["prompt"],
+            max_tokens=chat["plan"].max_tokens,
+            temperature=0.7,
+            metadata={
+                "system_prompt": CHAT_SYSTEM_PROMPT,
+                "cache_prefix": chat["cache_prefix"],
+                "tier": chat["plan"].tier,
+                "cache": False,
+                "call_site": "chat_stream"
+            }
+        ):
+            chunks.append(chunk)
+            yield {"event": "token", "data": {"delta": chunk}}
+    except Exception as e:
+        logger.error(f"Error streaming chat response: {e}")
+        yield {"event": "error", "data": {"message": "Failed to generate response"}}
+        if not chunks:
+            return
+        failed = True
+    
+    response = ChatResponse(
+        message_id=message_id,
+        role="assistant",
+        content="".join(chunks),
+        session_id=chat["session_id"],
+        timestamp=datetime.now(),
+        metadata={
+            "concepts_referenced": chat["context"].get("concepts_referenced", []),
+            "adaptive_context": True,
+            "streamed": True,
+            "incomplete": failed
+        }
     )
     
-    db.add(assistant_message)
-    await db.commit()
+    async with async_session() as db:
+        await store_assistant_message(db, request.user_id, response)
     
-    return response
+    yield {"event": "done", "data": response.model_dump(mode="json")}
@@ -0,0 +1,231 @@
+import os
+import time
+import logging
+from typing import Dict, Any, Optional, Callable, Tuple
+import numpy as np
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import LearningProfile, ConceptMastery, LearnerCohort
+from app.models.content import EducationalContent
+from app.services.adaptation_cache import (
+    AdaptationProfile, adaptation_cache_key, get_adaptation_cache, quantize_difficulty, target_difficulty
+)
+from app.services.content_sections import adapt_sections_batch
+from app.services.llm_service import get_llm_provider
+
+logger = logging.getLogger(__name__)
+
+# Стили обучения, различаемые промптом адаптации; последнее измерение вектора - целевая сложность
+STYLE_DIMENSIONS = ["visual", "auditory", "kinesthetic"]
+
+# Параметры кластеризации учащихся
+COHORT_COUNT = int(os.getenv("ADAPTATION_COHORT_COUNT", "8"))
+COHORT_KMEANS_ITERATIONS = int(os.getenv("ADAPTATION_COHORT_ITERATIONS", "50"))
+# Учащийся получает вариант когорты, только если он достаточно близок к ее центру
+COHORT_MAX_DISTANCE = float(os.getenv("ADAPTATION_COHORT_MAX_DISTANCE", "0.2"))
+# Период обновления центров когорт в памяти процесса
+COHORT_REFRESH_SECONDS = float(os.getenv("ADAPTATION_COHORT_REFRESH_SECONDS", "300"))
+
+def profile_vector(learning_style: Dict[str, float], difficulty: float) -> np.ndarray:
+    """Вектор профиля: оценки стилей обучения и целевая сложность."""
+    style = learning_style or {}
+    return np.array([float(style.get(name, 0.0)) for name in STYLE_DIMENSIONS] + [difficulty])
+
+def kmeans(
+    vectors: np.ndarray,
+    k: int,
+    iterations: int = COHORT_KMEANS_ITERATIONS,
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Кластеризует векторы методом k-средних с инициализацией k-means++.
+    
+    Возвращает центры кластеров, номер кластера каждого вектора и сумму
+    квадратов расстояний до центров.
+    """
+    random = np.random.default_rng(seed)
+    count = len(vectors)
+    k = max(1, min(k, len(np.unique(vectors, axis=0))))
+    
+    centroids = vectors[[random.integers(count)]]
+    while len(centroids) < k:
+        distances = ((vectors[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        centroids = np.vstack([centroids, vectors[random.choice(count, p=distances / distances.sum())]])
+    
+    for _ in range(iterations):
+        labels = ((vectors[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        sizes = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        # Пустой кластер сохраняет прежний центр
+        updated = np.where(sizes[:, None] > 0, sums / np.maximum(sizes, 1)[:, None], centroids)
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+    
+    distances = ((vectors[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+    labels = distances.argmin(axis=1)
+    return centroids, labels, float(distances[np.arange(count), labels].sum())
+
+def cohort_profile(centroid: np.ndarray) -> AdaptationProfile:
+    """Квантованный профиль адаптации для центра когорты, без личных интересов."""
+    scores = {name: float(score) for name, score in zip(STYLE_DIMENSIONS, centroid) if score > 0}
+    return AdaptationProfile.from_profile(float(centroid[-1]), scores, {})
+
+async def load_profile_vectors(db: AsyncSession) -> np.ndarray:
+    """Строит векторы профилей всех учащихся двумя запросами."""
+    profile_result = await db.execute(select(LearningProfile.user_id, LearningProfile.learning_style))
+    profiles = profile_result.all()
+    
+    mastery_query = select(
+        ConceptMastery.user_id, func.avg(ConceptMastery.mastery_level)
+    ).group_by(ConceptMastery.user_id)
+    mastery_result = await db.execute(mastery_query)
+    masteries = dict(mastery_result.all())
+    
+    vectors = [
+        profile_vector(learning_style, quantize_difficulty(target_difficulty(masteries.get(user_id))))
+        for user_id, learning_style in profiles
+    ]
+    return np.array(vectors) if vectors else np.empty((0, len(STYLE_DIMENSIONS) + 1))
+
+async def build_cohorts(db: AsyncSession, cohort_count: int = COHORT_COUNT) -> Dict[str, Any]:
+    """Кластеризует учащихся и заменяет сохраненные когорты новыми."""
+    vectors = await load_profile_vectors(db)
+    await db.execute(delete(LearnerCohort))
+    if len(vectors) == 0:
+        await db.commit()
+        return {"learners": 0, "cohorts": [], "learner_coverage": 0.0}
+    
+    centroids, labels, inertia = kmeans(vectors, cohort_count)
+    sizes = np.bincount(labels, minlength=len(centroids))
+    distances = np.sqrt(((vectors - centroids[labels]) ** 2).sum(axis=1))
+    
+    db.add_all([
+        LearnerCohort(index=index, centroid=centroid.round(4).tolist(), size=int(sizes[index]))
+        for index, centroid in enumerate(centroids)
+    ])
+    await db.commit()
+    _cohorts_cache.clear()
+    
+    return {
+        "learners": len(vectors),
+        "cohorts": [
+            {"index": index, "size": int(sizes[index]), "profile": cohort_profile(centroid).signature()}
+            for index, centroid in enumerate(centroids)
+        ],
+        "inertia": inertia,
+        # Доля учащихся, которым подходят варианты их когорт
+        "learner_coverage": float((distances <= COHORT_MAX_DISTANCE).mean())
+    }
+
+# Центры когорт в памяти процесса: (время загрузки, центры)
+_cohorts_cache: Dict[str, Tuple[float, np.ndarray]] = {}
+
+async def get_cohort_centroids(db: AsyncSession) -> np.ndarray:
+    """Возвращает центры сохраненных когорт, обновляя их раз в COHORT_REFRESH_SECONDS."""
+    cached = _cohorts_cache.get("centroids")
+    if cached is not None and time.monotonic() - cached[0] < COHORT_REFRESH_SECONDS:
+        return cached[1]
+    
+    result = await db.execute(select(LearnerCohort.centroid).order_by(LearnerCohort.index))
+    centroids = np.array([centroid for centroid in result.scalars().all()])
+    _cohorts_cache["centroids"] = (time.monotonic(), centroids)
+    return centroids
+
+async def get_cohort_profile(
+    db: AsyncSession,
+    learning_style: Dict[str, float],
+    difficulty: float
+) -> Optional[AdaptationProfile]:
+    """Возвращает профиль ближайшей когорты или None, если учащийся далек от всех когорт."""
+    centroids = await get_cohort_centroids(db)
+    if len(centroids) == 0:
+        return None
+    
+    distances = np.sqrt(((centroids - profile_vector(learning_style, difficulty)) ** 2).sum(axis=1))
+    nearest = int(distances.argmin())
+    if distances[nearest] > COHORT_MAX_DISTANCE:
+        return None
+    return cohort_profile(centroids[nearest])
+
+async def pre_adapt_content(
+    db: AsyncSession,
+    cohort_count: int = COHORT_COUNT,
+    chunk_size: int = 100,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> Dict[str, Any]:
+    """Кластеризует учащихся и заранее адаптирует опубликованный контент для каждой когорты.
+    
+    Уже созданные варианты не генерируются повторно, поэтому задачу можно
+    запускать регулярно: адаптируется только новый или измененный контент.
+    """
+    cache = get_adaptation_cache()
+    if cache is None:
+        raise ValueError("Adaptation cache is disabled")
+    
+    report = await build_cohorts(db, cohort_count)
+    centroids = await get_cohort_centroids(db)
+    profiles = {profile.signature(): profile for profile in map(cohort_profile, centroids)}
+    
+    content_result = await db.execute(select(EducationalContent))
+    contents = [
+        content for content in content_result.scalars().all()
+        if (content.metadata or {}).get("published", True)
+    ]
+    
+    # Поиск уже созданных вариантов
+    missing = []
+    hits = 0
+    for content in contents:
+        for profile in profiles.values():
+            key = adaptation_cache_key(content, profile)
+            if await cache.get(db, key) is not None:
+                hits += 1
+            else:
+                missing.append((key, content, profile))
+    
+    total = len(contents) * len(profiles)
+    generated = 0
+    failed = 0
+    llm_provider = get_llm_provider()
+    
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        # Адаптация по разделам, как при интерактивной адаптации с тем же ключом кэша
+        results = await adapt_sections_batch(
+            llm_provider,
+            [(content.body, profile) for key, content, profile in chunk],
+            call_site="adapt_content_cohort"
+        )
+        
+        for (key, content, profile), (adapted_body, error) in zip(chunk, results):
+            if adapted_body is None:
+                failed += 1
+                logger.warning(f"Cohort adaptation of content {content.id} failed: {error}")
+                continue
+            await cache.put(
+                db, key, content, None, adapted_body, profile.difficulty,
+                {
+                    "target_difficulty": profile.difficulty,
+                    "preferred_learning_style": profile.style,
+                    "cohort": profile.signature()
+                }
+            )
+            generated += 1
+        
+        if on_progress:
+            on_progress(hits + generated, total)
+    
+    report.update({
+        "contents": len(contents),
+        "variants": total,
+        "generated": generated,
+        "failed": failed,
+        # Доля пар контент-когорта, для которых есть готовый вариант
+        "variant_coverage": (hits + generated) / total if total else 0.0,
+        # Доля вариантов, найденных в кэше до генерации
+        "cache_hit_rate": hits / total if total else 0.0
+    })
+    logger.info(f"Cohort pre-adaptation finished: {report}")
+    return report
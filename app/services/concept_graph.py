@@ -0,0 +1,230 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.content import ConceptRelationship, PREREQUISITE_RELATIONSHIP
+from app.services.path_scoring import kahn_levels
+
+logger = logging.getLogger(__name__)
+
+# Период полной перезагрузки графа: связи, созданные другими процессами,
+# становятся видны не позже чем через это время
+CONCEPT_GRAPH_REFRESH_SECONDS = float(os.getenv("CONCEPT_GRAPH_REFRESH_SECONDS", "300"))
+# Число добавленных связей, после которого буфер переносится в массивы CSR
+CONCEPT_GRAPH_COMPACT_THRESHOLD = int(os.getenv("CONCEPT_GRAPH_COMPACT_THRESHOLD", "1024"))
+
+def _csr(count: int, edges: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Строит смежность в формате CSR: соседи узла v - indices[indptr[v]:indptr[v + 1]]."""
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    if not edges:
+        return indptr, np.empty(0, dtype=np.int32)
+    
+    array = np.array(edges, dtype=np.int32)
+    array = array[np.argsort(array[:, 0], kind="stable")]
+    np.cumsum(np.bincount(array[:, 0], minlength=count), out=indptr[1:])
+    return indptr, array[:, 1].copy()
+
+class ConceptGraph:
+    """Граф предварительных требований концепций в памяти процесса.
+    
+    Концепции получают компактные целочисленные номера, связи хранятся в
+    массивах CSR в обоих направлениях. Топологические уровни (длина самой
+    длинной цепочки требований) и транзитивное замыкание требований
+    (битовые маски) рассчитываются заранее, поэтому запросы к графу не
+    обращаются к базе данных. Новые связи добавляются инкрементально через
+    буфер, который периодически переносится в CSR.
+    """
+    
+    def __init__(self, edges: Iterable[Tuple[str, str]] = ()):
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        # Связи (концепция, требование)
+        self._edges: List[Tuple[int, int]] = []
+        self._pending: Dict[int, List[int]] = {}
+        self._pending_reverse: Dict[int, List[int]] = {}
+        self.loaded_at = time.monotonic()
+        
+        for concept_id, prerequisite_id in edges:
+            self._edges.append((self._node(concept_id), self._node(prerequisite_id)))
+        self._rebuild()
+    
+    def _node(self, concept_id: str) -> int:
+        node = self.index.get(concept_id)
+        if node is None:
+            node = len(self.ids)
+            self.index[concept_id] = node
+            self.ids.append(concept_id)
+        return node
+    
+    def _rebuild(self) -> None:
+        """Перестраивает массивы CSR, уровни и замыкание по всем связям."""
+        count = len(self.ids)
+        self.indptr, self.indices = _csr(count, self._edges)
+        self.reverse_indptr, self.reverse_indices = _csr(count, [(target, source) for source, target in self._edges])
+        self._pending.clear()
+        self._pending_reverse.clear()
+        self._pending_edges = 0
+        
+        order = self._compute_levels()
+        self._compute_closure(order)
+    
+    def _compute_levels(self) -> List[int]:
+        """Рассчитывает уровни алгоритмом Кана по слоям; возвращает порядок обхода."""
+        self.levels, order, cyclic = kahn_levels(self.indptr, self.reverse_indptr, self.reverse_indices)
+        # Концепции в циклах размещаются после всех остальных
+        if len(cyclic):
+            logger.warning(f"Concept graph contains {len(cyclic)} concepts in prerequisite cycles")
+        return order.tolist()
+    
+    def _compute_closure(self, order: List[int]) -> None:
+        """Рассчитывает транзитивные требования в порядке уровней."""
+        self.closure = [0] * len(self.ids)
+        changed = True
+        while changed:
+            # Для графа без циклов достаточно одного прохода
+            changed = False
+            for node in order:
+                mask = self.closure[node]
+                for prerequisite in self._neighbors(node):
+                    mask |= self.closure[prerequisite] | (1 << prerequisite)
+                if mask != self.closure[node]:
+                    self.closure[node] = mask
+                    changed = True
+    
+    def _neighbors(self, node: int, reverse: bool = False) -> List[int]:
+        indptr, indices, pending = (
+            (self.reverse_indptr, self.reverse_indices, self._pending_reverse) if reverse
+            else (self.indptr, self.indices, self._pending)
+        )
+        neighbors = indices[indptr[node]:indptr[node + 1]].tolist() if node + 1 < len(indptr) else []
+        return neighbors + pending.get(node, [])
+    
+    def add_prerequisite(self, concept_id: str, prerequisite_id: str) -> None:
+        """Добавляет связь и обновляет уровни и замыкание затронутых концепций."""
+        count = len(self.ids)
+        source = self._node(concept_id)
+        target = self._node(prerequisite_id)
+        if len(self.ids) > count:
+            self.levels = np.concatenate([self.levels, np.zeros(len(self.ids) - count, dtype=np.int32)])
+            self.closure.extend([0] * (len(self.ids) - count))
+        if target in self._neighbors(source):
+            return
+        
+        self._edges.append((source, target))
+        self._pending.setdefault(source, []).append(target)
+        self._pending_reverse.setdefault(target, []).append(source)
+        self._pending_edges += 1
+        if self._pending_edges >= CONCEPT_GRAPH_COMPACT_THRESHOLD:
+            self._rebuild()
+            return
+        
+        cycle = source == target or bool(self.closure[target] >> source & 1)
+        if cycle:
+            logger.warning(f"Prerequisite {prerequisite_id} of concept {concept_id} creates a cycle")
+        
+        # Новые требования распространяются на концепцию и все зависящие от нее
+        added = self.closure[target] | (1 << target)
+        stack = [source]
+        while stack:
+            node = stack.pop()
+            if self.closure[node] | added != self.closure[node]:
+                self.closure[node] |= added
+                stack.extend(self._neighbors(node, reverse=True))
+        
+        if cycle:
+            return
+        stack = [(source, int(self.levels[target]) + 1)]
+        while stack:
+            node, level = stack.pop()
+            if level > self.levels[node]:
+                self.levels[node] = level
+                stack.extend((dependent, level + 1) for dependent in self._neighbors(node, reverse=True))
+    
+    def prerequisites(self, concept_id: str, transitive: bool = False) -> List[str]:
+        """Возвращает прямые или все транзитивные требования концепции."""
+        node = self.index.get(concept_id)
+        if node is None:
+            return []
+        if not transitive:
+            return [self.ids[prerequisite] for prerequisite in self._neighbors(node)]
+        
+        mask = self.closure[node]
+        result = []
+        while mask:
+            low = mask & -mask
+            result.append(self.ids[low.bit_length() - 1])
+            mask ^= low
+        return result
+    
+    def requires(self, concept_id: str, prerequisite_id: str) -> bool:
+        """Проверяет, входит ли prerequisite_id в транзитивные требования концепции."""
+        node = self.index.get(concept_id)
+        prerequisite = self.index.get(prerequisite_id)
+        if node is None or prerequisite is None:
+            return False
+        return bool(self.closure[node] >> prerequisite & 1)
+    
+    def level(self, concept_id: str) -> int:
+        """Топологический уровень концепции; 0 - концепция без требований."""
+        node = self.index.get(concept_id)
+        return int(self.levels[node]) if node is not None else 0
+    
+    def levels_of(self, concept_ids: List[str]) -> np.ndarray:
+        """Возвращает массив уровней концепций; неизвестные концепции имеют уровень 0."""
+        nodes = np.fromiter((self.index.get(concept_id, -1) for concept_id in concept_ids), dtype=np.int64, count=len(concept_ids))
+        levels = np.zeros(len(concept_ids), dtype=np.int32)
+        known = nodes >= 0
+        levels[known] = self.levels[nodes[known]]
+        return levels
+    
+    def topological_order(self, concept_ids: List[str]) -> List[str]:
+        """Упорядочивает концепции так, чтобы требования шли раньше зависящих от них концепций."""
+        order = np.argsort(self.levels_of(concept_ids), kind="stable")
+        return [concept_ids[index] for index in order]
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concepts": len(self.ids),
+            "edges": len(self._edges),
+            "pending_edges": self._pending_edges,
+            "levels": int(self.levels.max()) + 1 if len(self.levels) else 0
+        }
+
+_graph: Optional[ConceptGraph] = None
+_graph_lock = asyncio.Lock()
+
+async def load_concept_graph(db: AsyncSession) -> ConceptGraph:
+    """Загружает все связи-требования одним запросом и строит граф."""
+    query = select(
+        ConceptRelationship.source_concept_id, ConceptRelationship.target_concept_id
+    ).where(ConceptRelationship.relationship_type == PREREQUISITE_RELATIONSHIP)
+    result = await db.execute(query)
+    graph = ConceptGraph((str(source), str(target)) for source, target in result.all())
+    logger.info(f"Concept graph loaded: {graph.stats()}")
+    return graph
+
+async def get_concept_graph(db: AsyncSession) -> ConceptGraph:
+    """Возвращает граф процесса, загружая его при первом обращении и по истечении периода обновления."""
+    global _graph
+    if _graph is not None and time.monotonic() - _graph.loaded_at < CONCEPT_GRAPH_REFRESH_SECONDS:
+        return _graph
+    
+    async with _graph_lock:
+        if _graph is None or time.monotonic() - _graph.loaded_at >= CONCEPT_GRAPH_REFRESH_SECONDS:
+            _graph = await load_concept_graph(db)
+    return _graph
+
+def record_relationship(relationship: ConceptRelationship) -> None:
+    """Добавляет созданную связь в загруженный граф процесса."""
+    if _graph is not None and relationship.relationship_type == PREREQUISITE_RELATIONSHIP:
+        _graph.add_prerequisite(str(relationship.source_concept_id), str(relationship.target_concept_id))
+
+def reset_concept_graph() -> None:
+    """Сбрасывает граф процесса; он будет загружен заново при следующем обращении."""
+    global _graph
+    _graph = None
@@ -0,0 +1,172 @@
+import os
+import re
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.services.adaptation_cache import AdaptationProfile, TEMPLATE_VERSION
+from app.services.llm_cache import InMemoryCacheBackend, RedisCacheBackend, TextCache
+from app.services.llm_service import LLMProvider, LLMRequest, build_adaptation_request
+from app.services.prompt_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Бюджет раздела во входных токенах: абзацы объединяются в раздел, пока он не превышен
+SECTION_MAX_TOKENS = int(os.getenv("ADAPTATION_SECTION_MAX_TOKENS", "800"))
+# Максимум одновременных обращений к LLM при адаптации разделов одного контента
+SECTION_MAX_CONCURRENCY = int(os.getenv("ADAPTATION_SECTION_MAX_CONCURRENCY", "4"))
+
+# Параметры кэша адаптированных разделов
+SECTION_CACHE_BACKEND = os.getenv("ADAPTATION_SECTION_CACHE_BACKEND", "memory")  # memory, redis, none
+SECTION_CACHE_TTL_SECONDS = int(os.getenv("ADAPTATION_SECTION_CACHE_TTL_SECONDS", str(7 * 86400)))
+SECTION_CACHE_MAX_ENTRIES = int(os.getenv("ADAPTATION_SECTION_CACHE_MAX_ENTRIES", "50000"))
+
+# Заголовок Markdown начинает новый раздел
+HEADING_PATTERN = re.compile(r"^\s{0,3}#{1,6}\s")
+
+def split_sections(body: str, max_tokens: int = SECTION_MAX_TOKENS) -> List[str]:
+    """Разбивает контент на разделы по заголовкам и бюджету токенов.
+    
+    Абзацы (блоки, разделенные пустой строкой) не разрываются: абзац больше
+    бюджета образует отдельный раздел.
+    """
+    sections: List[List[str]] = []
+    tokens = 0
+    for paragraph in re.split(r"\n\s*\n", body.strip()):
+        if not paragraph.strip():
+            continue
+        paragraph_tokens = estimate_tokens(paragraph)
+        if not sections or HEADING_PATTERN.match(paragraph) or tokens + paragraph_tokens > max_tokens:
+            sections.append([])
+            tokens = 0
+        sections[-1].append(paragraph)
+        tokens += paragraph_tokens
+    return ["\n\n".join(section) for section in sections]
+
+def section_cache_key(section: str, profile: AdaptationProfile) -> str:
+    """Ключ кэша раздела: хэш его текста, версия шаблона и подпись профиля."""
+    section_hash = hashlib.sha256(section.encode("utf-8")).hexdigest()
+    return hashlib.sha256(
+        f"{section_hash}:{TEMPLATE_VERSION}:{profile.signature()}".encode("utf-8")
+    ).hexdigest()
+
+_section_cache: Optional[TextCache] = None
+
+def get_section_cache() -> Optional[TextCache]:
+    """Возвращает общий кэш разделов или None, если кэш выключен."""
+    global _section_cache
+    if SECTION_CACHE_BACKEND == "none":
+        return None
+    if _section_cache is None:
+        if SECTION_CACHE_BACKEND == "redis":
+            backend = RedisCacheBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        elif SECTION_CACHE_BACKEND == "memory":
+            backend = InMemoryCacheBackend(max_entries=SECTION_CACHE_MAX_ENTRIES)
+        else:
+            raise ValueError(f"Unsupported section cache backend: {SECTION_CACHE_BACKEND}")
+        _section_cache = TextCache(backend, ttl_seconds=SECTION_CACHE_TTL_SECONDS, prefix="section:")
+    return _section_cache
+
+async def adapt_sections(
+    llm_provider: LLMProvider,
+    body: str,
+    profile: AdaptationProfile,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> Tuple[str, Dict[str, int]]:
+    """Адаптирует контент по разделам и собирает результат в исходном порядке.
+    
+    Разделы из кэша не отправляются в LLM, поэтому после правки одного абзаца
+    заново адаптируется только его раздел. Остальные разделы адаптируются
+    параллельно под semaphore (общим, например, для всего пакета) или не более
+    SECTION_MAX_CONCURRENCY одновременно; при ошибке любого раздела исключение
+    передается вызывающему коду, а успешные разделы остаются в кэше.
+    """
+    sections = split_sections(body)
+    cache = get_section_cache()
+    keys = [section_cache_key(section, profile) for section in sections]
+    adapted: List[Optional[str]] = [await cache.get(key) if cache else None for key in keys]
+    cached = sum(1 for text in adapted if text is not None)
+    semaphore = semaphore or asyncio.Semaphore(SECTION_MAX_CONCURRENCY)
+    
+    async def adapt(index: int) -> None:
+        async with semaphore:
+            text = await llm_provider.adapt_content(
+                content=sections[index],
+                target_difficulty=profile.difficulty,
+                learning_style=profile.learning_style(),
+                preferences=profile.preferences()
+            )
+        adapted[index] = text.strip()
+        if cache:
+            await cache.set(keys[index], adapted[index])
+    
+    results = await asyncio.gather(
+        *[adapt(index) for index, text in enumerate(adapted) if text is None],
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        logger.warning(f"{len(errors)} of {len(sections)} content sections failed to adapt")
+        raise errors[0]
+    
+    return "\n\n".join(adapted), {"sections": len(sections), "cached_sections": cached}
+
+async def adapt_sections_batch(
+    llm_provider: LLMProvider,
+    jobs: List[Tuple[str, AdaptationProfile]],
+    call_site: str
+) -> List[Tuple[Optional[str], Optional[str]]]:
+    """Адаптирует несколько текстов по разделам одним пакетом провайдера.
+    
+    Разделы разбиваются и кэшируются так же, как в adapt_sections, поэтому
+    варианты из пакетной и интерактивной адаптации совпадают. Одинаковые
+    разделы разных текстов запрашиваются один раз. Для каждого текста
+    возвращается пара (адаптированный текст, ошибка): текст собирается,
+    только если адаптированы все его разделы.
+    """
+    cache = get_section_cache()
+    job_keys: List[List[str]] = []
+    adapted: Dict[str, str] = {}
+    requests: Dict[str, LLMRequest] = {}
+    for body, profile in jobs:
+        sections = split_sections(body)
+        keys = [section_cache_key(section, profile) for section in sections]
+        job_keys.append(keys)
+        for section, key in zip(sections, keys):
+            if key in adapted or key in requests:
+                continue
+            text = await cache.get(key) if cache else None
+            if text is not None:
+                adapted[key] = text
+                continue
+            request = build_adaptation_request(
+                section,
+                profile.difficulty,
+                profile.learning_style(),
+                profile.preferences(),
+                custom_id=key
+            )
+            request.metadata["call_site"] = call_site
+            requests[key] = request
+    
+    errors: Dict[str, str] = {}
+    results = await llm_provider.generate_batch(list(requests.values())) if requests else []
+    for key, result in zip(requests, results):
+        if result.response is None:
+            errors[key] = result.error or "Section adaptation failed"
+            continue
+        adapted[key] = result.response.text.strip()
+        if cache:
+            await cache.set(key, adapted[key])
+    if errors:
+        logger.warning(f"{len(errors)} of {len(requests)} content sections failed to adapt in batch")
+    
+    outcomes: List[Tuple[Optional[str], Optional[str]]] = []
+    for keys in job_keys:
+        failed = [errors[key] for key in keys if key in errors]
+        if failed:
+            outcomes.append((None, failed[0]))
+        else:
+            outcomes.append(("\n\n".join(adapted[key] for key in keys), None))
+    return outcomes
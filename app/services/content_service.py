@@ -2,12 +2,15 @@ from sqlalchemy import select, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 
 from app.models.content import Concept, ConceptRelationship, EducationalContent, AdaptedContent, content_concept
 from app.models.user import LearningProfile
 from app.api.schemas import ConceptCreate, ContentCreate, AdaptationRequest, LearningPlanRequest
 from app.services.llm_service import get_llm_provider
+from app.services.adaptation_cache import AdaptationProfile, adaptation_cache_key
+from app.services.content_sections import adapt_sections, adapt_sections_batch
+from app.services.concept_graph import record_relationship
 
 async def create_concept(db: AsyncSession, concept_create: ConceptCreate):
     """Создает новую образовательную концепцию."""
@@ -52,6 +55,9 @@ async def create_concept_relationship(db: AsyncSession, source_id: uuid.UUID, ta
     await db.commit()
     await db.refresh(relationship)
     
+    # Инкрементальное обновление графа концепций процесса
+    record_relationship(relationship)
+    
     return relationship
 
 async def create_content(db: AsyncSession, content_create: ContentCreate):
@@ -127,13 +133,9 @@ async def adapt_content(db: AsyncSession, adaptation_request: AdaptationRequest)
     # 2. Получение предпочтительного стиля обучения
     learning_style = learner_profile.learning_style
     
-    # Вызов LLM для адаптации контента
-    adapted_body = await llm_provider.adapt_content(
-        original_content.body,
-        target_difficulty,
-        learning_style,
-        learner_profile.preferences
-    )
+    # Вызов LLM для адаптации контента по разделам
+    profile = AdaptationProfile.from_profile(target_difficulty, learning_style, learner_profile.preferences)
+    adapted_body, _ = await adapt_sections(llm_provider, original_content.body, profile)
     
     # Создание адаптированного контента
     adapted_content = AdaptedContent(
@@ -170,6 +172,140 @@ async def adapt_content(db: AsyncSession, adaptation_request: AdaptationRequest)
         "updated_at": adapted_content.updated_at
     }
 
+async def create_adaptation_work_items(
+    db: AsyncSession,
+    content_ids: List[uuid.UUID],
+    user_ids: List[uuid.UUID],
+    adaptation_params: Optional[Dict[str, Any]] = None
+) -> List[AdaptedContent]:
+    """Создает задания на пакетную адаптацию: по одному на пару контент-пользователь.
+    
+    Задания хранятся в AdaptedContent со статусом pending и не используются
+    кэшем адаптации, пока не будут выполнены.
+    """
+    params = adaptation_params or {}
+    
+    content_query = select(EducationalContent).where(EducationalContent.id.in_(content_ids))
+    content_result = await db.execute(content_query)
+    contents = {content.id: content for content in content_result.scalars().all()}
+    
+    items = []
+    for content_id in content_ids:
+        content = contents.get(content_id)
+        if not content:
+            raise ValueError(f"Content with id {content_id} not found")
+        
+        for user_id in user_ids:
+            items.append(AdaptedContent(
+                id=uuid.uuid4(),
+                original_content_id=content.id,
+                user_id=user_id,
+                title=content.title,
+                body="",
+                difficulty=params.get("target_difficulty", content.difficulty),
+                adaptation_params=params,
+                status="pending"
+            ))
+    
+    db.add_all(items)
+    await db.commit()
+    
+    return items
+
+async def process_adaptation_work_items(
+    db: AsyncSession,
+    item_ids: List[uuid.UUID],
+    chunk_size: int = 100,
+    on_progress: Optional[Callable[[int, int, int], None]] = None
+) -> Dict[str, int]:
+    """Выполняет пакетную адаптацию незавершенных заданий.
+    
+    Результаты сохраняются после каждой части пакета, поэтому повторный запуск
+    после сбоя продолжает работу с незавершенных заданий.
+    """
+    items_query = select(AdaptedContent).where(AdaptedContent.id.in_(item_ids))
+    items_result = await db.execute(items_query)
+    items = items_result.scalars().all()
+    
+    pending = [item for item in items if item.status != "ready"]
+    done = len(items) - len(pending)
+    failed = 0
+    
+    if not pending:
+        return {"total": len(items), "done": done, "failed": failed}
+    
+    # Загрузка исходного контента и профилей одним запросом на таблицу
+    content_query = select(EducationalContent).where(
+        EducationalContent.id.in_({item.original_content_id for item in pending})
+    )
+    content_result = await db.execute(content_query)
+    contents = {content.id: content for content in content_result.scalars().all()}
+    
+    profile_query = select(LearningProfile).where(
+        LearningProfile.user_id.in_({item.user_id for item in pending})
+    )
+    profile_result = await db.execute(profile_query)
+    profiles = {profile.user_id: profile for profile in profile_result.scalars().all()}
+    
+    llm_provider = get_llm_provider()
+    
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        
+        jobs = []
+        requested_items = []
+        for item in chunk:
+            content = contents.get(item.original_content_id)
+            if content is None:
+                # Исходный контент удален после создания задания
+                item.status = "failed"
+                item.adaptation_params = {
+                    **item.adaptation_params,
+                    "batch_error": f"Content with id {item.original_content_id} not found"
+                }
+                failed += 1
+                continue
+            
+            profile = profiles.get(item.user_id)
+            adaptation_profile = AdaptationProfile.from_profile(
+                item.difficulty,
+                profile.learning_style if profile else {},
+                profile.preferences if profile else {}
+            )
+            jobs.append((content, adaptation_profile))
+            requested_items.append(item)
+        
+        # Адаптация по разделам, как при интерактивной адаптации
+        results = await adapt_sections_batch(
+            llm_provider,
+            [(content.body, adaptation_profile) for content, adaptation_profile in jobs],
+            call_site="adapt_content_batch"
+        ) if jobs else []
+        
+        for item, (content, adaptation_profile), (adapted_body, error) in zip(requested_items, jobs, results):
+            # Новый словарь, чтобы SQLAlchemy отследил изменение JSON-поля
+            params = dict(item.adaptation_params)
+            if adapted_body is not None:
+                # Готовое задание доступно кэшу адаптации наравне с интерактивными вариантами
+                item.body = adapted_body
+                item.difficulty = adaptation_profile.difficulty
+                item.cache_key = adaptation_cache_key(content, adaptation_profile)
+                item.status = "ready"
+                params.pop("batch_error", None)
+                done += 1
+            else:
+                item.status = "failed"
+                params["batch_error"] = error
+                failed += 1
+            item.adaptation_params = params
+        
+        await db.commit()
+        
+        if on_progress:
+            on_progress(done, failed, len(items))
+    
+    return {"total": len(items), "done": done, "failed": failed}
+
 async def create_learning_plan(db: AsyncSession, plan_request: LearningPlanRequest):
     """Создает план обучения для учащегося."""
     # В реальной реализации здесь будет вызов к адаптивным механизмам
@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services.llm_cache import InMemoryCacheBackend, TextCache
+
+# Параметры кэша обратной связи, сгенерированной LLM
+FEEDBACK_CACHE_MAX_ENTRIES = int(os.getenv("FEEDBACK_CACHE_MAX_ENTRIES", "5000"))
+FEEDBACK_CACHE_TTL_SECONDS = int(os.getenv("FEEDBACK_CACHE_TTL_SECONDS", "86400"))
+
+# Полосы оценки: (название, нижняя граница, оценка, передаваемая в промпт)
+SCORE_BANDS: List[Tuple[str, float, float]] = [
+    ("perfect", 0.999, 1.0),
+    ("high", 0.8, 0.9),
+    ("medium", 0.5, 0.65),
+    ("low", 0.001, 0.25),
+    ("zero", 0.0, 0.0)
+]
+
+# Полосы, в которых сочетание сильных и слабых сторон требует развернутого разбора
+NUANCED_BANDS = {"medium"}
+
+# Вступление по полосе оценки и стилю обратной связи
+OPENINGS: Dict[str, Dict[str, str]] = {
+    "constructive": {
+        "perfect": "Отличная работа: все ответы верны.",
+        "high": "Хороший результат: материал в основном усвоен.",
+        "medium": "Неплохой результат, но часть материала стоит закрепить.",
+        "low": "Материал пока усвоен частично, и это нормальный этап обучения.",
+        "zero": "В этот раз верных ответов не было, поэтому начнем с основ."
+    },
+    "encouraging": {
+        "perfect": "Великолепно! Вы справились со всеми заданиями.",
+        "high": "Здорово! Вы уверенно продвигаетесь вперед.",
+        "medium": "Вы на верном пути, и прогресс уже заметен.",
+        "low": "Каждая попытка приближает вас к цели, не сдавайтесь.",
+        "zero": "Начало всегда самое трудное, и у вас все получится."
+    },
+    "direct": {
+        "perfect": "Все ответы верны.",
+        "high": "Большинство ответов верны.",
+        "medium": "Примерно половина ответов верна.",
+        "low": "Большинство ответов неверны.",
+        "zero": "Верных ответов нет."
+    }
+}
+
+NEXT_STEPS: Dict[str, str] = {
+    "perfect": "Переходите к следующей теме или попробуйте задания повышенной сложности.",
+    "high": "Повторите отмеченные темы и переходите к следующему разделу.",
+    "medium": "Вернитесь к отмеченным темам и выполните несколько практических заданий.",
+    "low": "Повторите теорию по отмеченным темам и решите простые примеры перед повторной попыткой.",
+    "zero": "Начните с вводных материалов по теме и затем пройдите оценку еще раз."
+}
+
+def score_band(score: float) -> str:
+    """Полоса оценки для результата в [0, 1]."""
+    for name, lower, _ in SCORE_BANDS:
+        if score >= lower:
+            return name
+    return "zero"
+
+def band_score(band: str) -> float:
+    """Типичная оценка полосы: кэшированный ответ LLM не зависит от точной оценки."""
+    return next(score for name, _, score in SCORE_BANDS if name == band)
+
+def normalize_topics(topics: Optional[List[str]]) -> List[str]:
+    return sorted({str(topic).strip().lower() for topic in topics or [] if str(topic).strip()})
+
+def needs_llm(band: str, strengths: List[str], weaknesses: List[str], feedback_style: str, params: Dict[str, Any]) -> bool:
+    """Решает, нужна ли обратная связь от LLM вместо шаблона.
+    
+    LLM используется, если учащийся явно запросил ее, для стиля без шаблона,
+    для подробной обратной связи и для средних результатов, где есть и
+    сильные, и слабые стороны.
+    """
+    if params.get("use_llm"):
+        return True
+    if feedback_style not in OPENINGS or params.get("detail_level") == "detailed":
+        return True
+    return band in NUANCED_BANDS and bool(strengths) and bool(weaknesses)
+
+def render_feedback(
+    score: float,
+    strengths: List[str],
+    weaknesses: List[str],
+    feedback_style: str,
+    include_next_steps: bool
+) -> str:
+    """Собирает обратную связь из шаблонов полосы оценки и стиля."""
+    band = score_band(score)
+    parts = [
+        OPENINGS.get(feedback_style, OPENINGS["constructive"])[band],
+        f"Ваш результат: {score:.2f} из 1.0."
+    ]
+    if strengths:
+        parts.append(f"Сильные стороны: {', '.join(strengths)}.")
+    if weaknesses:
+        parts.append(f"Стоит уделить внимание: {', '.join(weaknesses)}.")
+    if include_next_steps:
+        parts.append(NEXT_STEPS[band])
+    return " ".join(parts)
+
+def feedback_cache_key(
+    band: str,
+    strengths: List[str],
+    weaknesses: List[str],
+    feedback_style: str,
+    context: Dict[str, Any]
+) -> str:
+    """Ключ кэша: полоса оценки, сильные и слабые стороны, стиль и параметры промпта."""
+    raw = json.dumps([band, strengths, weaknesses, feedback_style, context], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+_feedback_cache = TextCache(
+    InMemoryCacheBackend(max_entries=FEEDBACK_CACHE_MAX_ENTRIES),
+    ttl_seconds=FEEDBACK_CACHE_TTL_SECONDS,
+    prefix="feedback:"
+)
+
+def get_feedback_cache() -> TextCache:
+    """Возвращает общий кэш обратной связи процесса."""
+    return _feedback_cache
@@ -0,0 +1,234 @@
+import uuid
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import flag_modified
+
+from app.models.assessment import LearningPlan
+from app.services.path_scoring import effective_difficulty, difficulty_bands
+
+logger = logging.getLogger(__name__)
+
+# Интервальное повторение: концепции плана, которые планировщик SM-2 отметил
+# к повторению, распределяются по сессиям, не более REVIEW_LIMIT за сессию
+REVIEW_LIMIT = 2
+
+# Длительность занятий в минутах
+LEARN_MINUTES = 15
+ASSESS_MINUTES = 10
+REVIEW_MINUTES = 5
+SESSION_MINUTES_PER_CONCEPT = 30
+
+def stable_id(plan_id: str, *parts: Any) -> str:
+    """Детерминированный идентификатор элемента плана, не меняющийся при перепланировании."""
+    return str(uuid.uuid5(uuid.UUID(plan_id), ":".join(str(part) for part in parts)))
+
+def _activity(plan_id: str, activity_type: str, concept: Dict[str, Any], duration: int, *scope: Any) -> Dict[str, Any]:
+    return {
+        "activity_id": stable_id(plan_id, activity_type, concept["concept_id"], *scope),
+        "activity_type": activity_type,
+        "concept_id": concept["concept_id"],
+        "difficulty": concept["difficulty"],
+        "duration_minutes": duration
+    }
+
+def build_session(plan_id: str, index: int, concepts: List[Dict[str, Any]], include_assessments: bool) -> Dict[str, Any]:
+    """Создает сессию с изучением и оценкой концепций; повторения добавляет set_reviews."""
+    activities = []
+    for concept in concepts:
+        activities.append(_activity(plan_id, "learn", concept, LEARN_MINUTES))
+        if include_assessments:
+            activities.append(_activity(plan_id, "assess", concept, ASSESS_MINUTES))
+    
+    return {
+        "session_id": stable_id(plan_id, "session", index),
+        "concepts": concepts,
+        "estimated_duration_minutes": SESSION_MINUTES_PER_CONCEPT * len(concepts),
+        "activities": activities
+    }
+
+def _review_time(concept: Dict[str, Any]) -> Optional[datetime]:
+    if not concept.get("next_review_at"):
+        return None
+    review_at = datetime.fromisoformat(concept["next_review_at"])
+    return review_at if review_at.tzinfo else review_at.replace(tzinfo=timezone.utc)
+
+def due_reviews(sessions: List[Dict[str, Any]], now: datetime) -> List[Dict[str, Any]]:
+    """Концепции плана, повторение которых по расписанию SM-2 наступило к now, начиная с самых просроченных."""
+    due = [
+        concept for session in sessions for concept in session["concepts"]
+        if _review_time(concept) is not None and _review_time(concept) <= now
+    ]
+    return sorted(due, key=_review_time)
+
+def set_reviews(plan_id: str, sessions: List[Dict[str, Any]], now: Optional[datetime] = None) -> List[int]:
+    """Пересчитывает занятия повторения сессий, не трогая остальные занятия.
+    
+    Повторения берутся из расписания review_scheduler (next_review_at концепций),
+    поэтому план и очередь /reviews/due не расходятся. Наступившие повторения
+    занимают сессии начиная с первой; не поместившиеся остаются в очереди
+    повторений. Возвращает номера сессий, повторения которых изменились.
+    """
+    due = due_reviews(sessions, now or datetime.now(timezone.utc))
+    changed = []
+    for index, session in enumerate(sessions):
+        reviews = [
+            _activity(plan_id, "review", concept, REVIEW_MINUTES, index)
+            for concept in due[index * REVIEW_LIMIT:(index + 1) * REVIEW_LIMIT]
+        ]
+        activities = [activity for activity in session["activities"] if activity["activity_type"] != "review"]
+        if [activity for activity in session["activities"] if activity["activity_type"] == "review"] != reviews:
+            changed.append(index)
+        session["activities"] = activities + reviews
+    return changed
+
+def build_learning_plan(
+    plan_id: str,
+    user_id: uuid.UUID,
+    concept_ids: List[uuid.UUID],
+    sequence: List[Dict[str, Any]],
+    params: Dict[str, Any],
+    now: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Разбивает упорядоченные концепции на сессии и формирует план обучения."""
+    size = params["max_concepts_per_session"]
+    sessions = [
+        build_session(plan_id, index, sequence[start:start + size], params["include_assessments"])
+        for index, start in enumerate(range(0, len(sequence), size))
+    ]
+    
+    # Если включено интервальное повторение, добавляем наступившие повторения
+    if params["spaced_repetition"]:
+        set_reviews(plan_id, sessions, now)
+    
+    return {
+        "plan_id": plan_id,
+        "user_id": str(user_id),
+        "created_at": datetime.now().isoformat(),
+        "concepts": [str(cid) for cid in concept_ids],
+        "sessions": sessions,
+        "metadata": {
+            "target_difficulty_curve": params["target_difficulty_curve"],
+            "spaced_repetition": params["spaced_repetition"],
+            "max_concepts_per_session": size,
+            "include_assessments": params["include_assessments"],
+            "total_concepts": len(concept_ids),
+            "total_sessions": len(sessions),
+            "estimated_total_duration_minutes": sum(session["estimated_duration_minutes"] for session in sessions)
+        }
+    }
+
+def sequence_key(curve: str, concept: Dict[str, Any]) -> Optional[float]:
+    """Ключ порядка концепции для кривой сложности; None, если порядок не зависит от владения."""
+    if curve == "challenging":
+        return None
+    effective = effective_difficulty(concept["difficulty"], concept["current_mastery"])
+    if curve == "gradual":
+        return effective
+    return int(difficulty_bands(effective))
+
+def _insertion_point(curve: str, sequence: List[Dict[str, Any]], key: float) -> int:
+    """Позиция после всех концепций с ключом не больше key (последовательность отсортирована)."""
+    low, high = 0, len(sequence)
+    while low < high:
+        middle = (low + high) // 2
+        if key < sequence_key(curve, sequence[middle]):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+def apply_mastery_change(
+    plan: Dict[str, Any],
+    concept_id: str,
+    mastery: float,
+    next_review_at: Optional[str] = None,
+    now: Optional[datetime] = None
+) -> List[int]:
+    """Обновляет план после изменения уровня владения концепцией.
+    
+    Концепция переставляется на новое место в последовательности, после чего
+    пересобираются только сессии между старой и новой позицией, а повторения
+    пересчитываются по новому расписанию концепции. Идентификаторы сессий и
+    занятий сохраняются. Возвращает номера измененных сессий.
+    """
+    sessions = plan["sessions"]
+    metadata = plan["metadata"]
+    curve = metadata["target_difficulty_curve"]
+    size = metadata["max_concepts_per_session"]
+    
+    sequence = [concept for session in sessions for concept in session["concepts"]]
+    old = next((i for i, concept in enumerate(sequence) if concept["concept_id"] == concept_id), None)
+    if old is None:
+        return []
+    if sequence[old]["current_mastery"] == mastery and sequence[old].get("next_review_at") == next_review_at:
+        return []
+    
+    concept = {**sequence[old], "current_mastery": mastery, "next_review_at": next_review_at}
+    old_key = sequence_key(curve, sequence[old])
+    key = sequence_key(curve, concept)
+    if key == old_key:
+        new = old
+        sequence[old] = concept
+    else:
+        del sequence[old]
+        new = _insertion_point(curve, sequence, key)
+        sequence.insert(new, concept)
+    
+    first, last = min(old, new) // size, max(old, new) // size
+    for index in range(first, last + 1):
+        sessions[index] = build_session(
+            plan["plan_id"], index, sequence[index * size:(index + 1) * size], metadata["include_assessments"]
+        )
+    
+    affected = set(range(first, last + 1))
+    if metadata["spaced_repetition"]:
+        affected.update(set_reviews(plan["plan_id"], sessions, now))
+    return sorted(affected)
+
+async def save_learning_plan(db: AsyncSession, user_id: uuid.UUID, plan: Dict[str, Any]) -> LearningPlan:
+    """Сохраняет план обучения в таблицу LearningPlan."""
+    learning_plan = LearningPlan(
+        id=uuid.UUID(plan["plan_id"]),
+        user_id=user_id,
+        title=f"План обучения: {plan['metadata']['total_concepts']} концепций",
+        plan_data=plan,
+        status="active"
+    )
+    db.add(learning_plan)
+    await db.commit()
+    return learning_plan
+
+async def replan_on_mastery_change(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    concept_id: uuid.UUID,
+    mastery: float,
+    next_review_at: Optional[datetime] = None
+) -> int:
+    """Обновляет активные планы учащегося, содержащие концепцию; возвращает число измененных планов."""
+    query = select(LearningPlan).where(
+        LearningPlan.user_id == user_id,
+        LearningPlan.status == "active"
+    )
+    result = await db.execute(query)
+    
+    updated = 0
+    for learning_plan in result.scalars().all():
+        affected = apply_mastery_change(
+            learning_plan.plan_data,
+            str(concept_id),
+            mastery,
+            next_review_at.isoformat() if next_review_at else None
+        )
+        if affected:
+            # plan_data изменен на месте, поэтому изменение отмечается явно
+            flag_modified(learning_plan, "plan_data")
+            updated += 1
+            logger.info(f"Learning plan {learning_plan.id} replanned: sessions {affected}")
+    
+    if updated:
+        await db.commit()
+    return updated
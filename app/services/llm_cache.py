@@ -0,0 +1,258 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services.llm_service import (
+    LLMProvider, LLMProviderWrapper, LLMResponse, LLMRequest, LLMBatchResult,
+    make_request_key, BATCH_MAX_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+class CacheBackend(ABC):
+    """Абстрактное хранилище кэша ответов LLM."""
+    
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """Возвращает сохраненное значение или None."""
+        pass
+    
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        """Сохраняет значение на ttl_seconds секунд."""
+        pass
+    
+    @abstractmethod
+    async def clear(self) -> None:
+        """Очищает хранилище."""
+        pass
+
+class InMemoryCacheBackend(CacheBackend):
+    """Хранилище в памяти процесса с вытеснением LRU и TTL."""
+    
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+    
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        
+        self._entries.move_to_end(key)
+        return value
+    
+    async def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    async def clear(self) -> None:
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RedisCacheBackend(CacheBackend):
+    """Хранилище в Redis, общее для всех процессов.
+    
+    TTL задается для каждого ключа; вытеснение LRU обеспечивается политикой
+    maxmemory-policy allkeys-lru на сервере Redis.
+    """
+    
+    def __init__(self, redis_url: str, prefix: str = "adaptive_learning:"):
+        import redis.asyncio as redis
+        
+        self.prefix = prefix
+        self._redis = redis.from_url(redis_url)
+    
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            value = await self._redis.get(self.prefix + key)
+        except Exception as e:
+            logger.error(f"Error reading LLM cache from Redis: {e}")
+            return None
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+    
+    async def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        try:
+            await self._redis.set(self.prefix + key, value, ex=ttl_seconds)
+        except Exception as e:
+            logger.error(f"Error writing LLM cache to Redis: {e}")
+    
+    async def clear(self) -> None:
+        async for key in self._redis.scan_iter(match=self.prefix + "llm:*"):
+            await self._redis.delete(key)
+
+class ResponseCache:
+    """Кэш ответов LLM со счетчиками попаданий и промахов."""
+    
+    def __init__(self, backend: CacheBackend, ttl_seconds: int = 86400):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+    
+    async def get(self, key: str) -> Optional[LLMResponse]:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        return LLMResponse.model_validate_json(value)
+    
+    async def set(self, key: str, response: LLMResponse) -> None:
+        await self.backend.set(key, response.model_dump_json(), self.ttl_seconds)
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+class TextCache:
+    """Кэш текстовых результатов (например, разделов контента или обратной связи)
+    со счетчиками попаданий и промахов.
+    
+    Префикс разделяет ключи разных кэшей в общем хранилище.
+    """
+    
+    def __init__(self, backend: CacheBackend, ttl_seconds: int = 86400, prefix: str = ""):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+    
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.backend.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+    
+    async def set(self, key: str, text: str) -> None:
+        await self.backend.set(self.prefix + key, text, self.ttl_seconds)
+    
+    async def clear(self) -> None:
+        await self.backend.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+def build_response_cache(config: Dict[str, Any]) -> Optional[ResponseCache]:
+    """Создает кэш ответов по конфигурации реестра провайдеров."""
+    backend_type = config.get("backend", "memory")
+    
+    if backend_type == "none":
+        return None
+    if backend_type == "memory":
+        backend = InMemoryCacheBackend(max_entries=config.get("max_entries", 10000))
+    elif backend_type == "redis":
+        backend = RedisCacheBackend(config["redis_url"])
+    else:
+        raise ValueError(f"Unsupported LLM cache backend: {backend_type}")
+    
+    return ResponseCache(backend, ttl_seconds=config.get("ttl_seconds", 86400))
+
+class CachingLLMProvider(LLMProviderWrapper):
+    """Провайдер, кэширующий ответы generate() вложенного провайдера.
+    
+    Кэширование отключается для отдельного запроса через metadata={"cache": False}.
+    """
+    
+    def __init__(self, provider: LLMProvider, cache: ResponseCache):
+        super().__init__(provider)
+        self.cache = cache
+    
+    def _key(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        stop_sequences: Optional[List[str]],
+        metadata: Dict[str, Any]
+    ) -> str:
+        return make_request_key(
+            model=self.resolve_model(metadata),
+            system_prompt=metadata.get("system_prompt", ""),
+            prompt=prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stop_sequences=stop_sequences
+        )
+    
+    async def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        metadata = metadata or {}
+        if not metadata.get("cache", True):
+            return await super().generate(prompt, max_tokens, temperature, stop_sequences, metadata)
+        
+        key = self._key(prompt, max_tokens, temperature, stop_sequences, metadata)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            cached.metadata["cache_hit"] = True
+            return cached
+        
+        response = await super().generate(prompt, max_tokens, temperature, stop_sequences, metadata)
+        await self.cache.set(key, response)
+        return response
+    
+    async def generate_batch(
+        self,
+        requests: List[LLMRequest],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> List[LLMBatchResult]:
+        """Выполняет пакет, отправляя провайдеру только запросы, которых нет в кэше."""
+        results: Dict[int, LLMBatchResult] = {}
+        keys: Dict[int, str] = {}
+        misses: List[int] = []
+        
+        for index, request in enumerate(requests):
+            if not request.metadata.get("cache", True):
+                misses.append(index)
+                continue
+            
+            keys[index] = self._key(
+                request.prompt, request.max_tokens, request.temperature, request.stop_sequences, request.metadata
+            )
+            cached = await self.cache.get(keys[index])
+            if cached is not None:
+                cached.metadata["cache_hit"] = True
+                results[index] = LLMBatchResult(custom_id=request.custom_id, response=cached)
+            else:
+                misses.append(index)
+        
+        if misses:
+            fresh = await super().generate_batch([requests[index] for index in misses], max_concurrency)
+            for index, result in zip(misses, fresh):
+                results[index] = result
+                if result.response is not None and index in keys:
+                    await self.cache.set(keys[index], result.response)
+        
+        return [results[index] for index in range(len(requests))]
@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import logging
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.services.llm_service import (
+    LLMProviderWrapper, LLMResponse, LLMRequest, LLMBatchResult,
+    estimate_tokens, BATCH_MAX_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+# Место вызова по умолчанию, если metadata["call_site"] не задан
+DEFAULT_CALL_SITE = "unknown"
+
+# Цены моделей в долларах за миллион токенов: (входные, выходные).
+# Модель сопоставляется по самому длинному совпадающему префиксу имени.
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "claude-3-opus": (15.0, 75.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-3-sonnet": (3.0, 15.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+    "claude-3-haiku": (0.25, 1.25),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4": (30.0, 60.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "stub": (0.0, 0.0)
+}
+# Переопределение цен: JSON вида {"model-prefix": [input, output]}
+MODEL_PRICES.update({
+    model: tuple(prices) for model, prices in json.loads(os.getenv("LLM_MODEL_PRICES", "{}")).items()
+})
+
+LABELS = ["call_site", "provider", "model"]
+
+LLM_REQUESTS = Counter(
+    "llm_requests_total",
+    "Вызовы LLM по результату: success, error, cache_hit, coalesced, cancelled",
+    LABELS + ["outcome"]
+)
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds",
+    "Длительность вызова LLM",
+    LABELS + ["outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Время до первого фрагмента потоковой генерации",
+    LABELS,
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Израсходованные токены по направлению: input, cache_read, cache_write, output",
+    LABELS + ["direction"]
+)
+LLM_RETRIES = Counter(
+    "llm_retries_total",
+    "Повторы запросов к API провайдера",
+    LABELS
+)
+LLM_COST = Counter(
+    "llm_cost_usd_total",
+    "Оценочная стоимость вызовов LLM в долларах",
+    LABELS
+)
+
+# Множители цены входных токенов для кэшированных префиксов промпта:
+# чтение из кэша Anthropic - 10% цены, запись - 125%; кэш OpenAI - 50% цены
+CACHE_READ_PRICE_FACTORS: Dict[str, float] = {"gpt": 0.5, "default": 0.1}
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+LLM_TIER_DURATION = Histogram(
+    "llm_tier_request_duration_seconds",
+    "Длительность вызовов LLM по уровню модели (default, fast)",
+    ["call_site", "tier"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+)
+LLM_TIER_LATENCY_SAVED = Gauge(
+    "llm_tier_latency_saved_seconds",
+    "Разница скользящих средних длительности вызовов основной и быстрой моделей",
+    ["call_site"]
+)
+
+# Скользящие средние длительности вызовов по (место вызова, уровень модели)
+TIER_LATENCY_ALPHA = 0.1
+_tier_latency: Dict[Tuple[str, str], float] = {}
+
+def record_tier_latency(call_site: str, tier: str, duration: float) -> None:
+    """Учитывает длительность вызова уровня модели и обновляет оценку экономии."""
+    LLM_TIER_DURATION.labels(call_site, tier).observe(duration)
+    
+    key = (call_site, tier)
+    previous = _tier_latency.get(key)
+    _tier_latency[key] = duration if previous is None else previous + TIER_LATENCY_ALPHA * (duration - previous)
+    
+    if (call_site, "default") in _tier_latency and (call_site, "fast") in _tier_latency:
+        LLM_TIER_LATENCY_SAVED.labels(call_site).set(
+            _tier_latency[(call_site, "default")] - _tier_latency[(call_site, "fast")]
+        )
+
+def tier_latency_stats() -> Dict[str, Dict[str, float]]:
+    """Возвращает скользящие средние длительности по местам вызова и уровням моделей."""
+    stats: Dict[str, Dict[str, float]] = {}
+    for (call_site, tier), latency in _tier_latency.items():
+        stats.setdefault(call_site, {})[tier] = latency
+    return stats
+
+def usage_tokens(usage: Dict[str, Any]) -> Dict[str, int]:
+    """Разбирает блок usage любого провайдера на input, cache_read, cache_write и output.
+    
+    input - входные токены без учета прочитанных из кэша и записанных в кэш.
+    """
+    if "prompt_tokens" in usage:
+        # OpenAI: кэшированные токены входят в prompt_tokens
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        return {
+            "input": int(usage.get("prompt_tokens") or 0) - int(cached),
+            "cache_read": int(cached),
+            "cache_write": 0,
+            "output": int(usage.get("completion_tokens") or 0)
+        }
+    return {
+        "input": int(usage.get("input_tokens") or 0),
+        "cache_read": int(usage.get("cache_read_input_tokens") or 0),
+        "cache_write": int(usage.get("cache_creation_input_tokens") or 0),
+        "output": int(usage.get("output_tokens") or 0)
+    }
+
+def _match_prefix(model: str, table: Dict[str, Any]) -> Optional[str]:
+    prefixes = [prefix for prefix in table if model.startswith(prefix)]
+    return max(prefixes, key=len) if prefixes else None
+
+def estimate_cost(model: str, tokens: Dict[str, int]) -> float:
+    """Оценивает стоимость вызова по таблице цен; для неизвестных моделей 0."""
+    prefix = _match_prefix(model, MODEL_PRICES)
+    if prefix is None:
+        return 0.0
+    input_price, output_price = MODEL_PRICES[prefix]
+    read_factor = CACHE_READ_PRICE_FACTORS.get(
+        _match_prefix(model, CACHE_READ_PRICE_FACTORS) or "default"
+    )
+    input_cost = (
+        tokens.get("input", 0)
+        + tokens.get("cache_read", 0) * read_factor
+        + tokens.get("cache_write", 0) * CACHE_WRITE_PRICE_FACTOR
+    ) * input_price
+    return (input_cost + tokens.get("output", 0) * output_price) / 1_000_000
+
+def record_call(
+    call_site: str,
+    provider: str,
+    model: str,
+    outcome: str,
+    duration: Optional[float] = None,
+    usage: Optional[Dict[str, Any]] = None,
+    retries: int = 0
+) -> None:
+    """Записывает метрики одного вызова LLM."""
+    labels = (call_site, provider, model)
+    LLM_REQUESTS.labels(*labels, outcome).inc()
+    if duration is not None:
+        LLM_REQUEST_DURATION.labels(*labels, outcome).observe(duration)
+    if retries:
+        LLM_RETRIES.labels(*labels).inc(retries)
+    
+    # Ответы из кэша и объединенные запросы не расходуют токены
+    if usage and outcome not in ("cache_hit", "coalesced"):
+        tokens = usage_tokens(usage)
+        for direction, count in tokens.items():
+            LLM_TOKENS.labels(*labels, direction).inc(count)
+        LLM_COST.labels(*labels).inc(estimate_cost(model, tokens))
+
+def response_outcome(response: LLMResponse) -> str:
+    if response.metadata.get("cache_hit"):
+        return "cache_hit"
+    if response.metadata.get("coalesced"):
+        return "coalesced"
+    return "success"
+
+class InstrumentedLLMProvider(LLMProviderWrapper):
+    """Провайдер, записывающий метрики Prometheus для каждого вызова LLM.
+    
+    Место вызова передается через metadata={"call_site": ...}: chat,
+    adapt_content, feedback, assessment и т.д.
+    """
+    
+    def _provider_label(self, response: Optional[LLMResponse] = None) -> str:
+        if response is not None and "routed_provider" in response.metadata:
+            return response.metadata["routed_provider"]
+        return self.provider_name
+    
+    async def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        metadata = metadata or {}
+        call_site = metadata.get("call_site", DEFAULT_CALL_SITE)
+        started_at = time.monotonic()
+        
+        try:
+            response = await super().generate(prompt, max_tokens, temperature, stop_sequences, metadata)
+        except Exception:
+            record_call(
+                call_site, self._provider_label(), self.resolve_model(metadata),
+                "error", time.monotonic() - started_at
+            )
+            raise
+        
+        duration = time.monotonic() - started_at
+        outcome = response_outcome(response)
+        record_call(
+            call_site,
+            self._provider_label(response),
+            response.model,
+            outcome,
+            duration,
+            usage=response.metadata.get("usage"),
+            retries=response.metadata.get("retries", 0)
+        )
+        if outcome == "success":
+            record_tier_latency(call_site, metadata.get("tier", "default"), duration)
+        return response
+    
+    async def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """Потоковая генерация с замером времени до первого фрагмента.
+        
+        Потоковые ответы не содержат блока usage, поэтому токены оцениваются по тексту.
+        """
+        metadata = metadata or {}
+        call_site = metadata.get("call_site", DEFAULT_CALL_SITE)
+        model = self.resolve_model(metadata)
+        started_at = time.monotonic()
+        chunks: List[str] = []
+        outcome = "cancelled"
+        
+        try:
+            async for chunk in super().generate_stream(prompt, max_tokens, temperature, stop_sequences, metadata):
+                if not chunks:
+                    LLM_TIME_TO_FIRST_TOKEN.labels(call_site, self.provider_name, model).observe(
+                        time.monotonic() - started_at
+                    )
+                chunks.append(chunk)
+                yield chunk
+            outcome = "success"
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            usage = None
+            if chunks:
+                usage = {
+                    "input_tokens": estimate_tokens(metadata.get("system_prompt", "") + prompt),
+                    "output_tokens": estimate_tokens("".join(chunks))
+                }
+            # Частично полученный ответ тоже оплачивается
+            record_call(call_site, self.provider_name, model, outcome, time.monotonic() - started_at, usage=usage)
+    
+    async def generate_batch(
+        self,
+        requests: List[LLMRequest],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> List[LLMBatchResult]:
+        """Выполняет пакет и записывает метрики по каждому запросу без замера длительности."""
+        results = await super().generate_batch(requests, max_concurrency)
+        
+        for request, result in zip(requests, results):
+            call_site = request.metadata.get("call_site", DEFAULT_CALL_SITE)
+            if result.response is None:
+                record_call(call_site, self.provider_name, self.resolve_model(request.metadata), "error")
+                continue
+            record_call(
+                call_site,
+                self._provider_label(result.response),
+                result.response.model,
+                response_outcome(result.response),
+                usage=result.response.metadata.get("usage"),
+                retries=result.response.metadata.get("retries", 0)
+            )
+        
+        return results
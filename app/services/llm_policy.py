@@ -0,0 +1,85 @@
+import os
+import json
+import logging
+from typing import Dict, Any, Optional
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Политики вызовов LLM по задачам.
+# max_tokens = (base_tokens + output_ratio * входные токены) * множитель детализации,
+# ограниченный диапазоном [min_tokens, max_tokens].
+# Задачи уровня default переводятся на быструю модель, если рассчитанный
+# max_tokens не больше fast_max_tokens или сложность не выше fast_max_difficulty.
+TASK_POLICIES: Dict[str, Dict[str, Any]] = {
+    "adapt_content": {
+        "tier": "default",
+        "base_tokens": 150,
+        "output_ratio": 1.5,
+        "min_tokens": 256,
+        "max_tokens": 4000,
+        # Упрощение контента до низкой сложности не требует большой модели
+        "fast_max_difficulty": 0.3
+    },
+    "feedback": {
+        "tier": "default",
+        "base_tokens": 400,
+        "output_ratio": 0.0,
+        "min_tokens": 150,
+        "max_tokens": 1000,
+        "fast_max_tokens": 500
+    },
+    "chat": {
+        "tier": "default",
+        "base_tokens": 1500,
+        "output_ratio": 0.0,
+        "min_tokens": 1500,
+        "max_tokens": 1500
+    }
+}
+
+# Множители объема ответа по уровню детализации
+DETAIL_FACTORS = {
+    "brief": 0.5,
+    "moderate": 1.0,
+    "detailed": 2.0
+}
+
+def _load_overrides() -> Dict[str, Dict[str, Any]]:
+    """Считывает переопределения политик: JSON вида {"feedback": {"tier": "default"}}."""
+    try:
+        return json.loads(os.getenv("LLM_TASK_POLICIES", "{}"))
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid LLM_TASK_POLICIES: {e}")
+        return {}
+
+for _task, _override in _load_overrides().items():
+    TASK_POLICIES[_task] = {**TASK_POLICIES.get(_task, TASK_POLICIES["chat"]), **_override}
+
+class CallPlan(BaseModel):
+    """Параметры вызова LLM, выбранные политикой."""
+    max_tokens: int
+    tier: str = "default"
+
+def plan_llm_call(
+    task: str,
+    input_tokens: int = 0,
+    difficulty: Optional[float] = None,
+    detail_level: Optional[str] = None
+) -> CallPlan:
+    """Рассчитывает max_tokens и уровень модели для задачи."""
+    policy = TASK_POLICIES.get(task)
+    if policy is None:
+        raise ValueError(f"Unknown LLM task policy: {task}")
+    
+    max_tokens = (policy["base_tokens"] + policy["output_ratio"] * input_tokens) * DETAIL_FACTORS.get(detail_level, 1.0)
+    max_tokens = int(min(policy["max_tokens"], max(policy["min_tokens"], max_tokens)))
+    
+    tier = policy["tier"]
+    if tier == "default":
+        if max_tokens <= policy.get("fast_max_tokens", 0):
+            tier = "fast"
+        elif difficulty is not None and difficulty <= policy.get("fast_max_difficulty", -1.0):
+            tier = "fast"
+    
+    return CallPlan(max_tokens=max_tokens, tier=tier)
@@ -0,0 +1,406 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple, Deque, AsyncIterator
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Коды ответа, при которых запрос к провайдеру имеет смысл повторить
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+def parse_retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    """Извлекает задержку в секундах из заголовков retry-after-ms / retry-after."""
+    if response is None:
+        return None
+    
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    
+    retry_after = response.headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        # Формат HTTP-даты
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error: Exception) -> bool:
+    """Определяет, можно ли повторить запрос после ошибки."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+class TokenBucket:
+    """Ограничитель расхода токенов в минуту по алгоритму token bucket."""
+    
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+    
+    async def acquire(self, tokens: int) -> None:
+        """Ожидает, пока в корзине не наберется нужное число токенов, и списывает их."""
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self._tokens) / self.rate)
+    
+    def refund(self, tokens: int) -> None:
+        """Возвращает в корзину токены, оцененные с запасом."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + tokens)
+
+class RetryPolicy:
+    """Политика повторов с экспоненциальной задержкой и случайным разбросом."""
+    
+    def __init__(
+        self,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        deadline_seconds: float = 60.0
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_seconds = deadline_seconds
+    
+    def compute_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Вычисляет задержку перед повтором (full jitter), не меньше retry-after."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+class AdaptiveLimiter:
+    """Ограничитель запросов к одной модели провайдера.
+    
+    Сочетает лимит одновременных запросов и корзину токенов в минуту.
+    При ответах 429 лимит параллелизма уменьшается вдвое и новые запросы
+    приостанавливаются на время retry-after; после серии успешных ответов
+    лимит постепенно восстанавливается.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 16,
+        tokens_per_minute: int = 0,
+        min_concurrency: int = 1,
+        increase_every: int = 20
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.increase_every = increase_every
+        self.limit = max_concurrency
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.in_flight = 0
+        self.throttled = 0
+        self.retries = 0
+        self._successes = 0
+        self._blocked_until = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+    
+    async def _acquire_slot(self) -> None:
+        while True:
+            pause = self._blocked_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return
+            
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Ожидающий уведомлен об освободившемся слоте, но отменен раньше,
+                # чем занял его: слот передается следующему ожидающему
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_waiters()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+    
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        self._wake_waiters()
+    
+    def _wake_waiters(self) -> None:
+        free_slots = self.limit - self.in_flight
+        while self._waiters and free_slots > 0:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            try:
+                waiter.set_result(None)
+            except RuntimeError:
+                # Цикл событий ожидающего уже закрыт
+                continue
+            free_slots -= 1
+    
+    def on_success(self) -> None:
+        self._successes += 1
+        if self._successes >= self.increase_every and self.limit < self.max_concurrency:
+            self._successes = 0
+            self.limit += 1
+            self._wake_waiters()
+    
+    def on_throttled(self, retry_after: Optional[float]) -> None:
+        self.throttled += 1
+        self._successes = 0
+        new_limit = max(self.min_concurrency, self.limit // 2)
+        if new_limit < self.limit:
+            logger.warning(f"LLM limiter {self.name}: concurrency reduced {self.limit} -> {new_limit}")
+        self.limit = new_limit
+        if retry_after:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+    
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int) -> AsyncIterator[None]:
+        """Удерживает слот лимитера на время потокового запроса (без повторов)."""
+        if self.bucket is not None:
+            await self.bucket.acquire(estimated_tokens)
+        await self._acquire_slot()
+        try:
+            yield
+        finally:
+            self._release_slot()
+    
+    async def run(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        estimated_tokens: int,
+        policy: RetryPolicy,
+        deadline_seconds: Optional[float] = None
+    ) -> Tuple[httpx.Response, int]:
+        """Выполняет запрос с учетом лимитов и повторов.
+        
+        Возвращает успешный ответ и число выполненных повторов.
+        """
+        deadline = time.monotonic() + (deadline_seconds or policy.deadline_seconds)
+        attempt = 0
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"LLM request deadline exceeded ({self.name})")
+            
+            if self.bucket is not None:
+                await asyncio.wait_for(self.bucket.acquire(estimated_tokens), timeout=remaining)
+            await asyncio.wait_for(self._acquire_slot(), timeout=max(0.001, deadline - time.monotonic()))
+            
+            retry_after = None
+            try:
+                response = await asyncio.wait_for(send(), timeout=max(0.001, deadline - time.monotonic()))
+                response.raise_for_status()
+                self.on_success()
+                return response, attempt
+            except Exception as e:
+                if isinstance(e, httpx.HTTPStatusError):
+                    retry_after = parse_retry_after(e.response)
+                    if e.response.status_code == 429:
+                        self.on_throttled(retry_after)
+                
+                delay = policy.compute_delay(attempt, retry_after)
+                if (
+                    not is_retryable(e)
+                    or attempt >= policy.max_retries
+                    or time.monotonic() + delay >= deadline
+                ):
+                    raise
+                
+                attempt += 1
+                self.retries += 1
+                logger.warning(f"LLM request to {self.name} failed ({e}); retry {attempt} in {delay:.2f}s")
+            finally:
+                self._release_slot()
+            
+            await asyncio.sleep(delay)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "throttled": self.throttled,
+            "retries": self.retries
+        }
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен, так как цепь провайдера разомкнута."""
+    pass
+
+class CircuitBreaker:
+    """Предохранитель для провайдера LLM.
+    
+    Размыкается, когда в скользящем окне доля ошибок превышает failure_threshold
+    или доля ответов медленнее slow_call_seconds превышает slow_call_threshold.
+    После reset_timeout пропускает один пробный запрос (полуоткрытое
+    состояние): успех замыкает цепь, ошибка снова размыкает ее. Успехи
+    остальных запросов, завершившихся при разомкнутой цепи (например,
+    отправленных до размыкания), цепь не замыкают.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: float = 0.5,
+        min_requests: int = 10,
+        window_size: int = 50,
+        reset_timeout: float = 30.0,
+        slow_call_seconds: float = 0.0,
+        slow_call_threshold: float = 0.8
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_threshold = slow_call_threshold
+        # Исходы запросов: (ошибка, медленный ответ)
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+    
+    def allow_request(self) -> bool:
+        """Проверяет, можно ли отправить запрос, и резервирует пробный запрос."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+    
+    def record_success(self, latency: Optional[float] = None, trial: bool = False) -> None:
+        """Учитывает успешный запрос; trial - пробный запрос, пропущенный allow_request()."""
+        if trial:
+            self.reset()
+        elif self._state != self.CLOSED:
+            return
+        slow = bool(self.slow_call_seconds) and latency is not None and latency >= self.slow_call_seconds
+        self._outcomes.append((False, slow))
+        if slow:
+            self._check_thresholds()
+    
+    def record_failure(self) -> None:
+        self._outcomes.append((True, False))
+        if self._state != self.CLOSED or self._trial_in_flight:
+            self.trip()
+            return
+        self._check_thresholds()
+    
+    def _check_thresholds(self) -> None:
+        total = len(self._outcomes)
+        if total < self.min_requests:
+            return
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow_calls = sum(1 for _, slow in self._outcomes if slow)
+        if failures / total >= self.failure_threshold:
+            self.trip()
+        elif self.slow_call_seconds and slow_calls / total >= self.slow_call_threshold:
+            logger.warning(f"Circuit {self.name}: {slow_calls} of {total} calls slower than {self.slow_call_seconds}s")
+            self.trip()
+    
+    def release_trial(self) -> None:
+        """Снимает резерв пробного запроса, если он был отменен без результата."""
+        self._trial_in_flight = False
+    
+    def trip(self) -> None:
+        """Размыкает цепь."""
+        if self._state != self.OPEN:
+            logger.warning(f"Circuit {self.name} opened")
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+    
+    def reset(self) -> None:
+        """Замыкает цепь и очищает окно исходов."""
+        if self._state != self.CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+        self._state = self.CLOSED
+        self._outcomes.clear()
+        self._trial_in_flight = False
+    
+    def stats(self) -> Dict[str, Any]:
+        total = len(self._outcomes)
+        return {
+            "state": self.state,
+            "error_rate": sum(1 for failed, _ in self._outcomes if failed) / total if total else 0.0,
+            "slow_call_rate": sum(1 for _, slow in self._outcomes if slow) / total if total else 0.0,
+            "window": total
+        }
+
+# Ограничители процесса, по одному на пару (провайдер, модель)
+_limiters: Dict[str, AdaptiveLimiter] = {}
+
+def _load_limit_overrides() -> Dict[str, Dict[str, Any]]:
+    """Считывает лимиты отдельных моделей из LLM_RATE_LIMITS (JSON)."""
+    try:
+        return json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid LLM_RATE_LIMITS: {e}")
+        return {}
+
+def get_limiter(provider_name: str, model: str) -> AdaptiveLimiter:
+    """Возвращает общий ограничитель для модели провайдера."""
+    name = f"{provider_name}:{model}"
+    limiter = _limiters.get(name)
+    if limiter is None:
+        overrides = _load_limit_overrides().get(name, {})
+        limiter = AdaptiveLimiter(
+            name,
+            max_concurrency=int(overrides.get("max_concurrency", os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "16"))),
+            tokens_per_minute=int(overrides.get("tokens_per_minute", os.getenv("LLM_TOKENS_PER_MINUTE", "0")))
+        )
+        _limiters[name] = limiter
+    return limiter
+
+def get_retry_policy() -> RetryPolicy:
+    """Возвращает политику повторов по настройкам окружения."""
+    return RetryPolicy(
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+        base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")),
+        max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "20")),
+        deadline_seconds=float(os.getenv("LLM_REQUEST_DEADLINE", "60"))
+    )
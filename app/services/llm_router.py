@@ -0,0 +1,269 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional, AsyncIterator, Deque
+import httpx
+
+from app.services.llm_service import LLMProvider, LLMResponse, LLMRequest, LLMBatchResult, BATCH_MAX_CONCURRENCY
+from app.services.llm_resilience import CircuitBreaker, CircuitOpenError, is_retryable
+
+logger = logging.getLogger(__name__)
+
+# Параметры хеджирования запросов
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2.0"))
+HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "30.0"))
+# Минимум замеров задержки, после которого хеджирование включается
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+class ProviderRoute:
+    """Провайдер в составе маршрутизатора со статистикой задержек и предохранителем."""
+    
+    def __init__(
+        self,
+        name: str,
+        provider: LLMProvider,
+        breaker_config: Optional[Dict[str, Any]] = None,
+        window_size: int = 200
+    ):
+        self.name = name
+        self.provider = provider
+        self.breaker = CircuitBreaker(name, **(breaker_config or {}))
+        self.latencies: Deque[float] = deque(maxlen=window_size)
+    
+    def percentile(self, percent: float) -> Optional[float]:
+        """Возвращает перцентиль задержки успешных запросов в секундах."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+    
+    def hedge_delay(self) -> Optional[float]:
+        """Время ожидания ответа, после которого отправляется дублирующий запрос."""
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, self.percentile(HEDGE_PERCENTILE)))
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "circuit": self.breaker.stats()
+        }
+
+class RoutedProvider(LLMProvider):
+    """Провайдер, распределяющий запросы между несколькими провайдерами LLM.
+    
+    Запрос отправляется самому быстрому провайдеру с замкнутой цепью. Если
+    ответ задерживается дольше перцентиля его задержки, дублирующий запрос
+    уходит следующему провайдеру и используется первый успешный ответ.
+    При ошибке или разомкнутой цепи запрос переходит к следующему провайдеру.
+    
+    Каждый провайдер использует свою модель по умолчанию; параметр model
+    из metadata не передается, так как имена моделей у провайдеров различаются.
+    Ошибки, которые нельзя повторить (например, 400), не учитываются
+    предохранителем провайдера.
+    """
+    
+    provider_name = "routed"
+    
+    def __init__(
+        self,
+        providers: Dict[str, LLMProvider],
+        hedging: bool = HEDGE_ENABLED,
+        breaker_config: Optional[Dict[str, Any]] = None
+    ):
+        if not providers:
+            raise ValueError("RoutedProvider requires at least one provider")
+        self.routes = [ProviderRoute(name, provider, breaker_config) for name, provider in providers.items()]
+        self.hedging = hedging
+        self.hedged_requests = 0
+        self.failovers = 0
+    
+    @property
+    def default_model(self) -> str:
+        return self._candidates(include_open=True)[0].provider.default_model
+    
+    @property
+    def fast_model(self) -> str:
+        return self._candidates(include_open=True)[0].provider.fast_model
+    
+    @property
+    def base_url(self) -> str:
+        return self._candidates(include_open=True)[0].provider.base_url
+    
+    def is_available(self) -> bool:
+        return any(route.breaker.state != CircuitBreaker.OPEN for route in self.routes)
+    
+    def open(self) -> httpx.AsyncClient:
+        clients = [route.provider.open() for route in self.routes]
+        return clients[0]
+    
+    def _candidates(self, include_open: bool = False) -> List[ProviderRoute]:
+        """Упорядочивает провайдеров: сначала доступные, затем по медианной задержке."""
+        def sort_key(route: ProviderRoute):
+            median = route.percentile(50)
+            return (route.breaker.state == CircuitBreaker.OPEN, median if median is not None else 0.0)
+        
+        routes = sorted(self.routes, key=sort_key)
+        if include_open:
+            return routes
+        return [route for route in routes if route.breaker.state != CircuitBreaker.OPEN]
+    
+    async def _call(
+        self,
+        route: ProviderRoute,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        stop_sequences: Optional[List[str]],
+        metadata: Dict[str, Any]
+    ) -> LLMResponse:
+        trial = route.breaker.state == CircuitBreaker.HALF_OPEN
+        if not route.breaker.allow_request():
+            raise CircuitOpenError(f"Circuit for LLM provider {route.name} is open")
+        
+        started_at = time.monotonic()
+        try:
+            response = await route.provider.generate(prompt, max_tokens, temperature, stop_sequences, metadata)
+        except asyncio.CancelledError:
+            route.breaker.release_trial()
+            raise
+        except Exception as e:
+            if is_retryable(e):
+                route.breaker.record_failure()
+            else:
+                route.breaker.release_trial()
+            raise
+        
+        latency = time.monotonic() - started_at
+        route.latencies.append(latency)
+        route.breaker.record_success(latency, trial=trial)
+        response.metadata["routed_provider"] = route.name
+        return response
+    
+    async def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        """Генерирует текст с хеджированием и переключением между провайдерами."""
+        metadata = {key: value for key, value in (metadata or {}).items() if key != "model"}
+        candidates = self._candidates()
+        if not candidates:
+            raise CircuitOpenError("All LLM providers are unavailable")
+        
+        def start(route: ProviderRoute) -> asyncio.Task:
+            return asyncio.ensure_future(
+                self._call(route, prompt, max_tokens, temperature, stop_sequences, metadata)
+            )
+        
+        primary = candidates[0]
+        remaining = candidates[1:]
+        pending = {start(primary)}
+        hedge_delay = primary.hedge_delay() if self.hedging and remaining else None
+        errors: List[BaseException] = []
+        
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=hedge_delay,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                if not done:
+                    # Основной провайдер отвечает дольше обычного: дублирующий запрос
+                    hedge_delay = None
+                    self.hedged_requests += 1
+                    pending.add(start(remaining.pop(0)))
+                    continue
+                
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+                
+                if not pending and remaining:
+                    # Переключение на следующего провайдера после ошибки
+                    hedge_delay = None
+                    self.failovers += 1
+                    pending.add(start(remaining.pop(0)))
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        logger.error(f"All routed LLM providers failed: {errors}")
+        raise errors[-1]
+    
+    async def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """Генерирует текст потоком; переключение возможно только до первого фрагмента."""
+        metadata = {key: value for key, value in (metadata or {}).items() if key != "model"}
+        last_error: Optional[Exception] = None
+        
+        for route in self._candidates():
+            trial = route.breaker.state == CircuitBreaker.HALF_OPEN
+            if not route.breaker.allow_request():
+                continue
+            
+            started = False
+            started_at = time.monotonic()
+            try:
+                async for chunk in route.provider.generate_stream(prompt, max_tokens, temperature, stop_sequences, metadata):
+                    if not started:
+                        route.latencies.append(time.monotonic() - started_at)
+                        started = True
+                    yield chunk
+                route.breaker.record_success(trial=trial)
+                return
+            except Exception as e:
+                if is_retryable(e):
+                    route.breaker.record_failure()
+                else:
+                    route.breaker.release_trial()
+                if started:
+                    raise
+                last_error = e
+                self.failovers += 1
+                logger.warning(f"Streaming from LLM provider {route.name} failed, trying next: {e}")
+        
+        raise last_error or CircuitOpenError("All LLM providers are unavailable")
+    
+    async def generate_batch(
+        self,
+        requests: List[LLMRequest],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> List[LLMBatchResult]:
+        """Выполняет пакет у первого доступного провайдера."""
+        candidates = self._candidates()
+        if not candidates:
+            raise CircuitOpenError("All LLM providers are unavailable")
+        
+        requests = [
+            request.model_copy(update={
+                "metadata": {key: value for key, value in request.metadata.items() if key != "model"}
+            })
+            for request in requests
+        ]
+        return await candidates[0].provider.generate_batch(requests, max_concurrency)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedged_requests": self.hedged_requests,
+            "failovers": self.failovers,
+            "providers": {route.name: route.stats() for route in self.routes}
+        }
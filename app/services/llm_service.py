@@ -1,22 +1,261 @@
 import os
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Tuple, Awaitable, AsyncIterator
 import httpx
+import hashlib
+import importlib.util
 import json
 import logging
+import threading
+import time
 from pydantic import BaseModel
 import asyncio
 
+from app.services.llm_resilience import (
+    CircuitBreaker, CircuitOpenError, get_limiter, get_retry_policy, parse_retry_after, is_retryable
+)
+from app.services.prompt_builder import ADAPTATION_TEMPLATE, ContextItem, render_prompt, estimate_tokens
+from app.services.llm_policy import plan_llm_call
+
 logger = logging.getLogger(__name__)
 
+# Параметры пула HTTP-соединений к API провайдеров
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 доступен только при установленном пакете h2 (httpx[http2])
+HTTP2_ENABLED = (
+    os.getenv("LLM_HTTP2", "true").lower() == "true"
+    and importlib.util.find_spec("h2") is not None
+)
+
+# Параметры пакетной генерации
+BATCH_MAX_CONCURRENCY = int(os.getenv("LLM_BATCH_MAX_CONCURRENCY", "8"))
+# Минимальный размер пакета, при котором используется пакетный API провайдера
+BATCH_API_MIN_SIZE = int(os.getenv("LLM_BATCH_API_MIN_SIZE", "50"))
+BATCH_POLL_INTERVAL = float(os.getenv("LLM_BATCH_POLL_INTERVAL", "30"))
+BATCH_DOWNLOAD_TIMEOUT = float(os.getenv("LLM_BATCH_DOWNLOAD_TIMEOUT", "300"))
+
+# Кэширование префиксов промптов на стороне провайдера (prompt caching)
+PROMPT_CACHING_ENABLED = os.getenv("LLM_PROMPT_CACHING", "true").lower() == "true"
+
+# Долгоживущие HTTP-клиенты, по одному на базовый URL API провайдера
+_http_clients: Dict[str, httpx.AsyncClient] = {}
+
+def get_http_client(base_url: str, timeout: float) -> httpx.AsyncClient:
+    """Возвращает общий HTTP-клиент с keep-alive для указанного API."""
+    client = _http_clients.get(base_url)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+        _http_clients[base_url] = client
+    return client
+
+def register_http_client(client: httpx.AsyncClient) -> None:
+    """Добавляет собственный клиент провайдера в общий пул, чтобы закрыть его при остановке процесса."""
+    _http_clients[f"{client.base_url}#{id(client)}"] = client
+
+async def open_http_clients() -> None:
+    """Открывает HTTP-клиенты для настроенного провайдера при старте процесса."""
+    try:
+        provider = get_llm_provider()
+    except ValueError as e:
+        # Без настроенного провайдера клиенты будут созданы при первом вызове
+        logger.warning(f"LLM provider is not configured: {e}")
+        return
+    provider.open()
+    logger.info(f"LLM HTTP client pool opened (http2={HTTP2_ENABLED})")
+
+async def close_http_clients() -> None:
+    """Закрывает все HTTP-клиенты провайдеров при остановке процесса."""
+    clients = list(_http_clients.values())
+    _http_clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error(f"Error closing LLM HTTP client: {e}")
+    logger.info("LLM HTTP client pool closed")
+
 class LLMResponse(BaseModel):
     text: str
     model: str
     metadata: Dict[str, Any] = {}
 
+class LLMRequest(BaseModel):
+    """Запрос к LLM в составе пакета."""
+    custom_id: str = ""
+    prompt: str
+    max_tokens: int = 1000
+    temperature: float = 0.7
+    stop_sequences: Optional[List[str]] = None
+    metadata: Dict[str, Any] = {}
+
+class LLMBatchResult(BaseModel):
+    """Результат отдельного запроса пакета: ответ или текст ошибки."""
+    custom_id: str
+    response: Optional[LLMResponse] = None
+    error: Optional[str] = None
+
+def make_request_key(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    temperature: float,
+    max_tokens: int,
+    stop_sequences: Optional[List[str]] = None
+) -> str:
+    """Вычисляет ключ запроса к LLM для кэширования и объединения запросов."""
+    payload = json.dumps(
+        [model, system_prompt, prompt, round(temperature, 4), max_tokens, stop_sequences or []],
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return "llm:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def build_adaptation_request(
+    content: str,
+    target_difficulty: float,
+    learning_style: Dict[str, float],
+    preferences: Dict[str, Any],
+    custom_id: str = ""
+) -> LLMRequest:
+    """Формирует запрос к LLM для адаптации образовательного контента."""
+    # Определение доминирующего стиля обучения
+    dominant_style = max(learning_style.items(), key=lambda x: x[1])[0] if learning_style else "balanced"
+    
+    # Создание стилевых рекомендаций для промпта
+    style_guidance = ""
+    if dominant_style == "visual":
+        style_guidance = "Включите визуальные описания, используйте пространственные метафоры и визуальную лексику."
+    elif dominant_style == "auditory":
+        style_guidance = "Используйте ритмичный язык, включайте диалоги и обсуждения. Подчеркивайте звуковые аспекты."
+    elif dominant_style == "kinesthetic":
+        style_guidance = "Используйте примеры, связанные с движением и физическим взаимодействием. Включайте практические приложения."
+    else:
+        style_guidance = "Сбалансированно используйте различные стили представления информации."
+    
+    # Учет интересов пользователя
+    interests = preferences.get("interests", [])
+    background = preferences.get("background", "general")
+    
+    # Формирование промпта для адаптации; контент обрезается до бюджета входных токенов
+    prompt = render_prompt(
+        ADAPTATION_TEMPLATE,
+        context=[ContextItem(text=content)],
+        target_difficulty=target_difficulty,
+        style_guidance=style_guidance,
+        interests="Учитывайте следующие интересы пользователя: " + ", ".join(interests) if interests else "",
+        background="Учитывайте образовательный/профессиональный фон пользователя: " + background if background != "general" else ""
+    )
+    
+    # Объем ответа зависит от объема контента, упрощение выполняет быстрая модель
+    plan = plan_llm_call("adapt_content", input_tokens=estimate_tokens(content), difficulty=target_difficulty)
+    
+    return LLMRequest(
+        custom_id=custom_id,
+        prompt=prompt.text,
+        max_tokens=plan.max_tokens,
+        temperature=0.4,
+        metadata=prompt.metadata(call_site="adapt_content", tier=plan.tier)
+    )
+
 class LLMProvider(ABC):
     """Абстрактный класс для провайдера LLM."""
     
+    provider_name: str = ""
+    base_url: str = ""
+    api_url: str = ""
+    timeout: float = 30
+    # Быстрая недорогая модель для простых задач (metadata={"tier": "fast"})
+    fast_model: str = ""
+    
+    def resolve_model(self, metadata: Dict[str, Any]) -> str:
+        """Определяет модель запроса: явно заданная, модель уровня tier или по умолчанию."""
+        if "model" in metadata:
+            return metadata["model"]
+        if metadata.get("tier") == "fast" and self.fast_model:
+            return self.fast_model
+        return self.default_model
+    
+    def open(self) -> httpx.AsyncClient:
+        """Возвращает общий HTTP-клиент провайдера, создавая его при необходимости."""
+        return get_http_client(self.base_url, self.timeout)
+    
+    def is_available(self) -> bool:
+        """Проверяет, принимает ли провайдер запросы (не разомкнут ли предохранитель)."""
+        return True
+    
+    async def _post(
+        self,
+        headers: Dict[str, str],
+        data: Dict[str, Any],
+        estimated_tokens: int,
+        deadline_seconds: Optional[float] = None
+    ) -> Tuple[Dict[str, Any], int]:
+        """Отправляет запрос к API с учетом лимитов модели и повторов.
+        
+        Возвращает тело ответа и число выполненных повторов.
+        """
+        limiter = get_limiter(self.provider_name, data["model"])
+        response, retries = await limiter.run(
+            lambda: self.open().post(self.api_url, headers=headers, json=data),
+            estimated_tokens=estimated_tokens,
+            policy=get_retry_policy(),
+            deadline_seconds=deadline_seconds
+        )
+        response_data = response.json()
+        
+        # Возврат в корзину токенов, оцененных с запасом
+        if limiter.bucket is not None:
+            usage = response_data.get("usage", {})
+            used_tokens = (
+                usage.get("input_tokens", usage.get("prompt_tokens", 0))
+                + usage.get("output_tokens", usage.get("completion_tokens", 0))
+            )
+            if used_tokens and used_tokens < estimated_tokens:
+                limiter.bucket.refund(estimated_tokens - used_tokens)
+        
+        return response_data, retries
+    
+    async def _stream(
+        self,
+        headers: Dict[str, str],
+        data: Dict[str, Any],
+        estimated_tokens: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Отправляет потоковый запрос к API и отдает события SSE в разобранном виде."""
+        limiter = get_limiter(self.provider_name, data["model"])
+        async with limiter.slot(estimated_tokens):
+            async with self.open().stream(
+                "POST",
+                self.api_url,
+                headers=headers,
+                json={**data, "stream": True}
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                    if response.status_code == 429:
+                        limiter.on_throttled(parse_retry_after(response))
+                    response.raise_for_status()
+                
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    yield json.loads(payload)
+            limiter.on_success()
+    
     @abstractmethod
     async def generate(
         self, 
@@ -29,7 +268,65 @@ class LLMProvider(ABC):
         """Генерирует текст с помощью LLM."""
         pass
     
-    @abstractmethod
+    async def generate_stream(
+        self, 
+        prompt: str, 
+        max_tokens: int = 1000, 
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """Генерирует текст по частям по мере их поступления от LLM.
+        
+        Реализация по умолчанию отдает результат generate() одним фрагментом.
+        """
+        response = await self.generate(prompt, max_tokens, temperature, stop_sequences, metadata)
+        yield response.text
+    
+    async def generate_batch(
+        self,
+        requests: List[LLMRequest],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> List[LLMBatchResult]:
+        """Выполняет пакет запросов; результаты возвращаются в порядке запросов.
+        
+        Реализация по умолчанию выполняет запросы параллельно, не более
+        max_concurrency одновременно. Ошибка отдельного запроса не прерывает пакет.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(request: LLMRequest) -> LLMBatchResult:
+            async with semaphore:
+                try:
+                    response = await self.generate(
+                        prompt=request.prompt,
+                        max_tokens=request.max_tokens,
+                        temperature=request.temperature,
+                        stop_sequences=request.stop_sequences,
+                        metadata=request.metadata
+                    )
+                    return LLMBatchResult(custom_id=request.custom_id, response=response)
+                except Exception as e:
+                    return LLMBatchResult(custom_id=request.custom_id, error=str(e))
+        
+        return list(await asyncio.gather(*[run(request) for request in requests]))
+    
+    async def _poll_batch(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        is_finished: Callable[[Dict[str, Any]], bool]
+    ) -> Dict[str, Any]:
+        """Опрашивает состояние пакета в API провайдера до его завершения."""
+        client = self.open()
+        while True:
+            response = await client.get(url, headers=headers)
+            response.raise_for_status()
+            batch = response.json()
+            if is_finished(batch):
+                return batch
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+    
     async def adapt_content(
         self,
         content: str,
@@ -37,157 +334,242 @@ class LLMProvider(ABC):
         learning_style: Dict[str, float],
         preferences: Dict[str, Any]
     ) -> str:
-        """Адаптирует образовательный контент."""
-        pass
+        """Адаптирует образовательный контент через generate() провайдера."""
+        request = build_adaptation_request(content, target_difficulty, learning_style, preferences)
+        
+        # Вызов LLM для адаптации
+        response = await self.generate(
+            prompt=request.prompt,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            metadata=request.metadata
+        )
+        
+        return response.text
 
 class AnthropicProvider(LLMProvider):
     """Провайдер для работы с API Anthropic Claude."""
     
+    provider_name = "anthropic"
+    
     def __init__(
         self, 
         api_key: str, 
         default_model: str = "claude-3-opus-20240229",
-        timeout: int = 30
+        timeout: int = 30,
+        fast_model: str = ""
     ):
         self.api_key = api_key
         self.default_model = default_model
+        self.fast_model = fast_model
         self.timeout = timeout
-        self.api_url = "https://api.anthropic.com/v1/messages"
+        self.base_url = "https://api.anthropic.com"
+        self.api_url = "/v1/messages"
     
-    async def generate(
-        self, 
-        prompt: str, 
-        max_tokens: int = 1000, 
-        temperature: float = 0.7,
-        stop_sequences: Optional[List[str]] = None,
-        metadata: Optional[Dict[str, Any]] = None
-    ) -> LLMResponse:
-        """Генерирует текст с помощью Claude."""
-        system_prompt = metadata.get("system_prompt", "")
-        
+    def _build_request(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        stop_sequences: Optional[List[str]],
+        metadata: Dict[str, Any]
+    ) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """Формирует заголовки и тело запроса к Messages API."""
         headers = {
             "Content-Type": "application/json",
             "x-api-key": self.api_key,
             "anthropic-version": "2023-06-01"
         }
         
+        system_prompt = metadata.get("system_prompt", "")
+        content: Any = prompt
+        
+        if PROMPT_CACHING_ENABLED:
+            # Системный промпт и неизменный префикс промпта помечаются для кэширования;
+            # префиксы короче минимального размера кэша API обрабатывает как обычно
+            cache_control = {"type": "ephemeral"}
+            if system_prompt:
+                system_prompt = [{"type": "text", "text": system_prompt, "cache_control": cache_control}]
+            cache_prefix = metadata.get("cache_prefix", "")
+            if cache_prefix and prompt.startswith(cache_prefix):
+                content = [{"type": "text", "text": cache_prefix, "cache_control": cache_control}]
+                if len(prompt) > len(cache_prefix):
+                    content.append({"type": "text", "text": prompt[len(cache_prefix):]})
+        
         data = {
-            "model": metadata.get("model", self.default_model),
+            "model": self.resolve_model(metadata),
             "max_tokens": max_tokens,
             "temperature": temperature,
             "system": system_prompt,
             "messages": [
-                {"role": "user", "content": prompt}
+                {"role": "user", "content": content}
             ]
         }
         
         if stop_sequences:
             data["stop_sequences"] = stop_sequences
         
+        return headers, data
+    
+    def _parse_response(self, response_data: Dict[str, Any], retries: int = 0) -> LLMResponse:
+        """Преобразует ответ Messages API в LLMResponse."""
+        return LLMResponse(
+            text=response_data.get("content", [{"text": ""}])[0]["text"],
+            model=response_data.get("model", self.default_model),
+            metadata={
+                "usage": response_data.get("usage", {}),
+                "id": response_data.get("id", ""),
+                "retries": retries
+            }
+        )
+    
+    async def generate(
+        self, 
+        prompt: str, 
+        max_tokens: int = 1000, 
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        """Генерирует текст с помощью Claude."""
+        metadata = metadata or {}
+        headers, data = self._build_request(prompt, max_tokens, temperature, stop_sequences, metadata)
+        
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    self.api_url,
-                    headers=headers,
-                    json=data
-                )
-                
-                response.raise_for_status()
-                response_data = response.json()
-                
-                return LLMResponse(
-                    text=response_data.get("content", [{"text": ""}])[0]["text"],
-                    model=response_data.get("model", self.default_model),
-                    metadata={
-                        "usage": response_data.get("usage", {}),
-                        "id": response_data.get("id", "")
-                    }
-                )
+            response_data, retries = await self._post(
+                headers,
+                data,
+                estimated_tokens=estimate_tokens(metadata.get("system_prompt", "") + prompt) + max_tokens,
+                deadline_seconds=metadata.get("deadline_seconds")
+            )
+            
+            return self._parse_response(response_data, retries)
         except Exception as e:
             logger.error(f"Error calling Anthropic API: {e}")
             raise
     
-    async def adapt_content(
+    async def generate_stream(
+        self, 
+        prompt: str, 
+        max_tokens: int = 1000, 
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """Генерирует текст с помощью Claude в потоковом режиме."""
+        metadata = metadata or {}
+        headers, data = self._build_request(prompt, max_tokens, temperature, stop_sequences, metadata)
+        
+        try:
+            async for event in self._stream(
+                headers,
+                data,
+                estimated_tokens=estimate_tokens(metadata.get("system_prompt", "") + prompt) + max_tokens
+            ):
+                event_type = event.get("type")
+                if event_type == "content_block_delta":
+                    text = event.get("delta", {}).get("text")
+                    if text:
+                        yield text
+                elif event_type == "error":
+                    raise RuntimeError(f"Anthropic stream error: {event.get('error')}")
+        except Exception as e:
+            logger.error(f"Error streaming from Anthropic API: {e}")
+            raise
+    
+    async def generate_batch(
         self,
-        content: str,
-        target_difficulty: float,
-        learning_style: Dict[str, float],
-        preferences: Dict[str, Any]
-    ) -> str:
-        """Адаптирует образовательный контент с помощью Claude."""
-        # Определение доминирующего стиля обучения
-        dominant_style = max(learning_style.items(), key=lambda x: x[1])[0] if learning_style else "balanced"
-        
-        # Создание стилевых рекомендаций для промпта
-        style_guidance = ""
-        if dominant_style == "visual":
-            style_guidance = "Включите визуальные описания, используйте пространственные метафоры и визуальную лексику."
-        elif dominant_style == "auditory":
-            style_guidance = "Используйте ритмичный язык, включайте диалоги и обсуждения. Подчеркивайте звуковые аспекты."
-        elif dominant_style == "kinesthetic":
-            style_guidance = "Используйте примеры, связанные с движением и физическим взаимодействием. Включайте практические приложения."
-        else:
-            style_guidance = "Сбалансированно используйте различные стили представления информации."
-        
-        # Учет интересов пользователя
-        interests = preferences.get("interests", [])
-        background = preferences.get("background", "general")
-        
-        # Формирование промпта для адаптации
-        prompt = f"""
-        Адаптируйте следующий образовательный контент под уровень сложности {target_difficulty:.2f} (от 0.0 до 1.0, где 0.0 - очень простой, 1.0 - очень сложный).
-        
-        Используйте следующие рекомендации по стилю обучения:
-        {style_guidance}
-        
-        {"Учитывайте следующие интересы пользователя: " + ", ".join(interests) if interests else ""}
-        {"Учитывайте образовательный/профессиональный фон пользователя: " + background if background != "general" else ""}
-        
-        Исходный контент:
-        {content}
-        
-        При адаптации:
-        1. Сохраните ключевые концепции и цели обучения
-        2. Отрегулируйте сложность языка, глубину объяснений и уровень детализации
-        3. Адаптируйте стиль представления и примеры под предпочтения пользователя
-        4. Сохраните общую структуру, сходную с исходным контентом
-        
-        Верните только адаптированный контент без пояснений или метакомментариев.
+        requests: List[LLMRequest],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> List[LLMBatchResult]:
+        """Выполняет пакет запросов через Message Batches API.
+        
+        Небольшие пакеты выполняются обычными параллельными вызовами.
         """
+        if len(requests) < BATCH_API_MIN_SIZE:
+            return await super().generate_batch(requests, max_concurrency)
         
-        # Вызов LLM для адаптации
-        response = await self.generate(
-            prompt=prompt,
-            max_tokens=2000,
-            temperature=0.4,
-            metadata={"system_prompt": "Вы - эксперт по адаптивному обучению, который помогает персонализировать образовательный контент под нужды конкретных учащихся."}
-        )
+        headers = {}
+        batch_requests = []
+        for request in requests:
+            headers, data = self._build_request(
+                request.prompt,
+                request.max_tokens,
+                request.temperature,
+                request.stop_sequences,
+                request.metadata
+            )
+            batch_requests.append({"custom_id": request.custom_id, "params": data})
         
-        return response.text
+        try:
+            client = self.open()
+            response = await client.post("/v1/messages/batches", headers=headers, json={"requests": batch_requests})
+            response.raise_for_status()
+            batch = response.json()
+            logger.info(f"Anthropic batch {batch['id']} submitted ({len(requests)} requests)")
+            
+            batch = await self._poll_batch(
+                f"/v1/messages/batches/{batch['id']}",
+                headers,
+                lambda b: b.get("processing_status") == "ended"
+            )
+            
+            results_response = await client.get(batch["results_url"], headers=headers, timeout=BATCH_DOWNLOAD_TIMEOUT)
+            results_response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Error calling Anthropic Message Batches API: {e}")
+            raise
+        
+        results = {}
+        for line in results_response.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            result = item.get("result", {})
+            if result.get("type") == "succeeded":
+                results[item["custom_id"]] = LLMBatchResult(
+                    custom_id=item["custom_id"],
+                    response=self._parse_response(result["message"])
+                )
+            else:
+                results[item["custom_id"]] = LLMBatchResult(
+                    custom_id=item["custom_id"],
+                    error=json.dumps(result.get("error", result.get("type")), ensure_ascii=False)
+                )
+        
+        return [
+            results.get(request.custom_id) or LLMBatchResult(custom_id=request.custom_id, error="Missing batch result")
+            for request in requests
+        ]
 
 class OpenAIProvider(LLMProvider):
     """Провайдер для работы с API OpenAI."""
     
+    provider_name = "openai"
+    
     def __init__(
         self, 
         api_key: str, 
         default_model: str = "gpt-4",
-        timeout: int = 30
+        timeout: int = 30,
+        fast_model: str = ""
     ):
         self.api_key = api_key
         self.default_model = default_model
+        self.fast_model = fast_model
         self.timeout = timeout
-        self.api_url = "https://api.openai.com/v1/chat/completions"
+        self.base_url = "https://api.openai.com"
+        self.api_url = "/v1/chat/completions"
     
-    async def generate(
-        self, 
-        prompt: str, 
-        max_tokens: int = 1000, 
-        temperature: float = 0.7,
-        stop_sequences: Optional[List[str]] = None,
-        metadata: Optional[Dict[str, Any]] = None
-    ) -> LLMResponse:
-        """Генерирует текст с помощью модели OpenAI."""
+    def _build_request(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        stop_sequences: Optional[List[str]],
+        metadata: Dict[str, Any]
+    ) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """Формирует заголовки и тело запроса к Chat Completions API."""
         system_prompt = metadata.get("system_prompt", "Вы - полезный образовательный ассистент.")
         
         headers = {
@@ -196,7 +578,7 @@ class OpenAIProvider(LLMProvider):
         }
         
         data = {
-            "model": metadata.get("model", self.default_model),
+            "model": self.resolve_model(metadata),
             "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt}
@@ -208,100 +590,633 @@ class OpenAIProvider(LLMProvider):
         if stop_sequences:
             data["stop"] = stop_sequences
         
+        return headers, data
+    
+    def _parse_response(self, response_data: Dict[str, Any], retries: int = 0) -> LLMResponse:
+        """Преобразует ответ Chat Completions API в LLMResponse."""
+        return LLMResponse(
+            text=response_data["choices"][0]["message"]["content"],
+            model=response_data.get("model", self.default_model),
+            metadata={
+                "usage": response_data.get("usage", {}),
+                "id": response_data.get("id", ""),
+                "retries": retries
+            }
+        )
+    
+    async def generate(
+        self, 
+        prompt: str, 
+        max_tokens: int = 1000, 
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        """Генерирует текст с помощью модели OpenAI."""
+        metadata = metadata or {}
+        headers, data = self._build_request(prompt, max_tokens, temperature, stop_sequences, metadata)
+        
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    self.api_url,
-                    headers=headers,
-                    json=data
-                )
-                
-                response.raise_for_status()
-                response_data = response.json()
-                
-                return LLMResponse(
-                    text=response_data["choices"][0]["message"]["content"],
-                    model=response_data.get("model", self.default_model),
-                    metadata={
-                        "usage": response_data.get("usage", {}),
-                        "id": response_data.get("id", "")
-                    }
-                )
+            response_data, retries = await self._post(
+                headers,
+                data,
+                estimated_tokens=estimate_tokens(data["messages"][0]["content"] + prompt) + max_tokens,
+                deadline_seconds=metadata.get("deadline_seconds")
+            )
+            
+            return self._parse_response(response_data, retries)
         except Exception as e:
             logger.error(f"Error calling OpenAI API: {e}")
             raise
     
-    async def adapt_content(
+    async def generate_stream(
+        self, 
+        prompt: str, 
+        max_tokens: int = 1000, 
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """Генерирует текст с помощью модели OpenAI в потоковом режиме."""
+        metadata = metadata or {}
+        headers, data = self._build_request(prompt, max_tokens, temperature, stop_sequences, metadata)
+        
+        try:
+            async for event in self._stream(
+                headers,
+                data,
+                estimated_tokens=estimate_tokens(data["messages"][0]["content"] + prompt) + max_tokens
+            ):
+                for choice in event.get("choices", []):
+                    text = choice.get("delta", {}).get("content")
+                    if text:
+                        yield text
+        except Exception as e:
+            logger.error(f"Error streaming from OpenAI API: {e}")
+            raise
+    
+    async def generate_batch(
         self,
-        content: str,
-        target_difficulty: float,
-        learning_style: Dict[str, float],
-        preferences: Dict[str, Any]
-    ) -> str:
-        """Адаптирует образовательный контент с помощью модели OpenAI."""
-        # Реализация аналогична методу для Claude
-        dominant_style = max(learning_style.items(), key=lambda x: x[1])[0] if learning_style else "balanced"
-        
-        # Создание стилевых рекомендаций
-        style_guidance = ""
-        if dominant_style == "visual":
-            style_guidance = "Включите визуальные описания, используйте пространственные метафоры и визуальную лексику."
-        elif dominant_style == "auditory":
-            style_guidance = "Используйте ритмичный язык, включайте диалоги и обсуждения. Подчеркивайте звуковые аспекты."
-        elif dominant_style == "kinesthetic":
-            style_guidance = "Используйте примеры, связанные с движением и физическим взаимодействием. Включайте практические приложения."
-        else:
-            style_guidance = "Сбалансированно используйте различные стили представления информации."
-        
-        # Учет интересов пользователя
-        interests = preferences.get("interests", [])
-        background = preferences.get("background", "general")
-        
-        # Формирование промпта для адаптации
-        prompt = f"""
-        Адаптируйте следующий образовательный контент под уровень сложности {target_difficulty:.2f} (от 0.0 до 1.0, где 0.0 - очень простой, 1.0 - очень сложный).
-        
-        Используйте следующие рекомендации по стилю обучения:
-        {style_guidance}
-        
-        {"Учитывайте следующие интересы пользователя: " + ", ".join(interests) if interests else ""}
-        {"Учитывайте образовательный/профессиональный фон пользователя: " + background if background != "general" else ""}
-        
-        Исходный контент:
-        {content}
-        
-        При адаптации:
-        1. Сохраните ключевые концепции и цели обучения
-        2. Отрегулируйте сложность языка, глубину объяснений и уровень детализации
-        3. Адаптируйте стиль представления и примеры под предпочтения пользователя
-        4. Сохраните общую структуру, сходную с исходным контентом
-        
-        Верните только адаптированный контент без пояснений или метакомментариев.
+        requests: List[LLMRequest],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> List[LLMBatchResult]:
+        """Выполняет пакет запросов через Batch API.
+        
+        Небольшие пакеты выполняются обычными параллельными вызовами.
         """
+        if len(requests) < BATCH_API_MIN_SIZE:
+            return await super().generate_batch(requests, max_concurrency)
         
-        # Вызов LLM для адаптации
-        response = await self.generate(
+        lines = []
+        for request in requests:
+            _, data = self._build_request(
+                request.prompt,
+                request.max_tokens,
+                request.temperature,
+                request.stop_sequences,
+                request.metadata
+            )
+            lines.append(json.dumps(
+                {"custom_id": request.custom_id, "method": "POST", "url": self.api_url, "body": data},
+                ensure_ascii=False
+            ))
+        
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        
+        try:
+            client = self.open()
+            upload = await client.post(
+                "/v1/files",
+                headers=headers,
+                data={"purpose": "batch"},
+                files={"file": ("batch.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")},
+                timeout=BATCH_DOWNLOAD_TIMEOUT
+            )
+            upload.raise_for_status()
+            
+            response = await client.post(
+                "/v1/batches",
+                headers=headers,
+                json={
+                    "input_file_id": upload.json()["id"],
+                    "endpoint": self.api_url,
+                    "completion_window": "24h"
+                }
+            )
+            response.raise_for_status()
+            batch = response.json()
+            logger.info(f"OpenAI batch {batch['id']} submitted ({len(requests)} requests)")
+            
+            batch = await self._poll_batch(
+                f"/v1/batches/{batch['id']}",
+                headers,
+                lambda b: b.get("status") in ("completed", "failed", "expired", "cancelled")
+            )
+            
+            output_lines = []
+            for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                if not file_id:
+                    continue
+                content = await client.get(f"/v1/files/{file_id}/content", headers=headers, timeout=BATCH_DOWNLOAD_TIMEOUT)
+                content.raise_for_status()
+                output_lines.extend(content.text.splitlines())
+        except Exception as e:
+            logger.error(f"Error calling OpenAI Batch API: {e}")
+            raise
+        
+        results = {}
+        for line in output_lines:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response_item = item.get("response") or {}
+            if not item.get("error") and response_item.get("status_code") == 200:
+                results[item["custom_id"]] = LLMBatchResult(
+                    custom_id=item["custom_id"],
+                    response=self._parse_response(response_item["body"])
+                )
+            else:
+                results[item["custom_id"]] = LLMBatchResult(
+                    custom_id=item["custom_id"],
+                    error=json.dumps(item.get("error") or response_item.get("body"), ensure_ascii=False)
+                )
+        
+        return [
+            results.get(request.custom_id) or LLMBatchResult(
+                custom_id=request.custom_id,
+                error=f"Missing batch result (batch status: {batch.get('status')})"
+            )
+            for request in requests
+        ]
+
+class LLMProviderWrapper(LLMProvider):
+    """Базовый класс обертки над провайдером LLM.
+    
+    Делегирует вызовы вложенному провайдеру; adapt_content() базового класса
+    при этом проходит через generate() обертки.
+    """
+    
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+    
+    @property
+    def provider_name(self) -> str:
+        return self.provider.provider_name
+    
+    @property
+    def default_model(self) -> str:
+        return self.provider.default_model
+    
+    @property
+    def fast_model(self) -> str:
+        return self.provider.fast_model
+    
+    @property
+    def base_url(self) -> str:
+        return self.provider.base_url
+    
+    @property
+    def timeout(self) -> float:
+        return self.provider.timeout
+    
+    def open(self) -> httpx.AsyncClient:
+        return self.provider.open()
+    
+    def is_available(self) -> bool:
+        return self.provider.is_available()
+    
+    async def generate(
+        self, 
+        prompt: str, 
+        max_tokens: int = 1000, 
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        return await self.provider.generate(
             prompt=prompt,
-            max_tokens=2000,
-            temperature=0.4,
-            metadata={"system_prompt": "Вы - эксперт по адаптивному обучению, который помогает персонализировать образовательный контент под нужды конкретных учащихся."}
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            metadata=metadata
         )
+    
+    async def generate_stream(
+        self, 
+        prompt: str, 
+        max_tokens: int = 1000, 
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        async for chunk in self.provider.generate_stream(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            metadata=metadata
+        ):
+            yield chunk
+    
+    async def generate_batch(
+        self,
+        requests: List[LLMRequest],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> List[LLMBatchResult]:
+        return await self.provider.generate_batch(requests, max_concurrency)
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в один.
+    
+    Первый вызывающий запускает задачу, остальные ожидают ее результат.
+    Задача выполняется отдельно от вызывающих, поэтому отмена одного из них
+    не прерывает ожидание остальных.
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[Tuple[int, str], asyncio.Task] = {}
+        self.coalesced = 0
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет fn() или присоединяется к уже выполняющемуся вызову с тем же ключом."""
+        flight_key = (id(asyncio.get_running_loop()), key)
+        task = self._inflight.get(flight_key)
         
-        return response.text
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda t: self._forget(flight_key, t))
+            return await asyncio.shield(task)
+        
+        self.coalesced += 1
+        return await asyncio.shield(task)
+    
+    def _forget(self, flight_key: Tuple[int, str], task: asyncio.Task) -> None:
+        if self._inflight.get(flight_key) is task:
+            del self._inflight[flight_key]
+        # Исключение извлекается, даже если все вызывающие были отменены
+        if not task.cancelled():
+            task.exception()
+    
+    def __len__(self) -> int:
+        return len(self._inflight)
 
-def get_llm_provider() -> LLMProvider:
-    """Возвращает экземпляр провайдера LLM в зависимости от настроек."""
-    provider_type = os.getenv("LLM_PROVIDER", "anthropic")
-    
-    if provider_type == "anthropic":
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY is not set")
-        return AnthropicProvider(api_key=api_key)
-    elif provider_type == "openai":
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY is not set")
-        return OpenAIProvider(api_key=api_key)
-    else:
-        raise ValueError(f"Unsupported LLM provider: {provider_type}")
+class CoalescingLLMProvider(LLMProviderWrapper):
+    """Провайдер, объединяющий одинаковые одновременные запросы в один вызов API.
+    
+    Объединение отключается для отдельного запроса через metadata={"coalesce": False}.
+    """
+    
+    def __init__(self, provider: LLMProvider, flight: Optional[SingleFlight] = None):
+        super().__init__(provider)
+        self.flight = flight or SingleFlight()
+    
+    async def generate(
+        self, 
+        prompt: str, 
+        max_tokens: int = 1000, 
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        metadata = metadata or {}
+        if not metadata.get("coalesce", True):
+            return await super().generate(prompt, max_tokens, temperature, stop_sequences, metadata)
+        
+        key = make_request_key(
+            model=self.resolve_model(metadata),
+            system_prompt=metadata.get("system_prompt", ""),
+            prompt=prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stop_sequences=stop_sequences
+        )
+        leader = False
+        
+        async def call() -> LLMResponse:
+            nonlocal leader
+            leader = True
+            return await super(CoalescingLLMProvider, self).generate(
+                prompt, max_tokens, temperature, stop_sequences, metadata
+            )
+        
+        response = await self.flight.do(key, call)
+        # Каждый вызывающий получает собственную копию ответа
+        response = response.model_copy(deep=True)
+        if not leader:
+            response.metadata["coalesced"] = True
+        return response
+
+class CircuitBreakerLLMProvider(LLMProviderWrapper):
+    """Провайдер с предохранителем.
+    
+    Пока цепь разомкнута, вызовы сразу завершаются CircuitOpenError, и
+    вызывающие без ожидания таймаута переходят к резервному варианту.
+    Восстановление провайдера проверяется фоновым пробным запросом, а не
+    запросами пользователей. Ошибки, которые нельзя повторить (например, 400),
+    на состояние цепи не влияют.
+    """
+    
+    def __init__(self, provider: LLMProvider, breaker: CircuitBreaker, probe_timeout: float = 10.0):
+        super().__init__(provider)
+        self.breaker = breaker
+        self.probe_timeout = probe_timeout
+        self.rejected = 0
+        self._probe_task: Optional[asyncio.Future] = None
+    
+    def is_available(self) -> bool:
+        return self.breaker.state == CircuitBreaker.CLOSED and self.provider.is_available()
+    
+    def _check(self) -> None:
+        if self.breaker.state != CircuitBreaker.CLOSED:
+            self.rejected += 1
+            self._ensure_probe()
+            raise CircuitOpenError(f"Circuit for LLM provider {self.breaker.name} is open")
+    
+    def _record(self, started_at: float, error: Optional[Exception] = None) -> None:
+        if error is None:
+            self.breaker.record_success(time.monotonic() - started_at)
+        elif is_retryable(error):
+            self.breaker.record_failure()
+        if self.breaker.state != CircuitBreaker.CLOSED:
+            self._ensure_probe()
+    
+    def _ensure_probe(self) -> None:
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.ensure_future(self._probe_loop())
+    
+    async def _probe_loop(self) -> None:
+        """Периодически проверяет провайдера минимальным запросом, пока цепь разомкнута."""
+        while self.breaker.state != CircuitBreaker.CLOSED:
+            await asyncio.sleep(self.breaker.reset_timeout)
+            try:
+                await asyncio.wait_for(
+                    self.provider.generate(
+                        "ping",
+                        max_tokens=1,
+                        temperature=0.0,
+                        metadata={"tier": "fast", "deadline_seconds": self.probe_timeout}
+                    ),
+                    timeout=self.probe_timeout
+                )
+            except Exception as e:
+                logger.warning(f"Circuit {self.breaker.name} probe failed: {e}")
+                self.breaker.trip()
+                continue
+            self.breaker.reset()
+    
+    async def generate(
+        self, 
+        prompt: str, 
+        max_tokens: int = 1000, 
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        self._check()
+        started_at = time.monotonic()
+        try:
+            response = await super().generate(prompt, max_tokens, temperature, stop_sequences, metadata)
+        except Exception as e:
+            self._record(started_at, e)
+            raise
+        self._record(started_at)
+        return response
+    
+    async def generate_stream(
+        self, 
+        prompt: str, 
+        max_tokens: int = 1000, 
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        self._check()
+        started_at = time.monotonic()
+        started = False
+        try:
+            async for chunk in super().generate_stream(prompt, max_tokens, temperature, stop_sequences, metadata):
+                if not started:
+                    # Для потока медленным считается позднее начало ответа
+                    self._record(started_at)
+                    started = True
+                yield chunk
+        except Exception as e:
+            if not started:
+                self._record(started_at, e)
+            raise
+    
+    async def generate_batch(
+        self,
+        requests: List[LLMRequest],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> List[LLMBatchResult]:
+        self._check()
+        return await super().generate_batch(requests, max_concurrency)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {**self.breaker.stats(), "rejected": self.rejected}
+
+def _build_anthropic(config: Dict[str, Any], model: str) -> LLMProvider:
+    """Создает провайдера Anthropic по конфигурации реестра."""
+    api_key = config["api_keys"].get("anthropic")
+    if not api_key:
+        raise ValueError("ANTHROPIC_API_KEY is not set")
+    return AnthropicProvider(
+        api_key=api_key,
+        default_model=model,
+        timeout=config["timeout"],
+        fast_model=config["fast_models"].get("anthropic", "")
+    )
+
+def _build_openai(config: Dict[str, Any], model: str) -> LLMProvider:
+    """Создает провайдера OpenAI по конфигурации реестра."""
+    api_key = config["api_keys"].get("openai")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY is not set")
+    return OpenAIProvider(
+        api_key=api_key,
+        default_model=model,
+        timeout=config["timeout"],
+        fast_model=config["fast_models"].get("openai", "")
+    )
+
+def _build_stub(config: Dict[str, Any], model: str) -> LLMProvider:
+    """Создает локальную заглушку провайдера для нагрузочного тестирования."""
+    from app.services.llm_stub import build_stub_provider
+    return build_stub_provider(config, model)
+
+class LLMProviderRegistry:
+    """Реестр провайдеров LLM, общий для всего процесса.
+    
+    Провайдеры создаются один раз на пару (имя, модель), поэтому все вызывающие
+    получают один и тот же экземпляр вместе с его соединениями и состоянием.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._factories: Dict[str, Callable[[Dict[str, Any], str], LLMProvider]] = {
+            "anthropic": _build_anthropic,
+            "openai": _build_openai,
+            "stub": _build_stub,
+            "routed": self._build_routed
+        }
+        self._providers: Dict[Tuple[str, str], LLMProvider] = {}
+        self._config = self._load_config()
+        self._response_cache = None
+        self._response_cache_built = False
+        self._flight = SingleFlight()
+    
+    @staticmethod
+    def _load_config() -> Dict[str, Any]:
+        """Считывает конфигурацию провайдеров из переменных окружения."""
+        return {
+            "provider": os.getenv("LLM_PROVIDER", "anthropic"),
+            "timeout": float(os.getenv("LLM_TIMEOUT", "30")),
+            "api_keys": {
+                "anthropic": os.getenv("ANTHROPIC_API_KEY"),
+                "openai": os.getenv("OPENAI_API_KEY")
+            },
+            "models": {
+                "anthropic": os.getenv("ANTHROPIC_MODEL", "claude-3-opus-20240229"),
+                "openai": os.getenv("OPENAI_MODEL", "gpt-4"),
+                "stub": os.getenv("LLM_STUB_MODEL", "stub-model")
+            },
+            # Быстрые модели для простых задач (см. llm_policy)
+            "fast_models": {
+                "anthropic": os.getenv("ANTHROPIC_FAST_MODEL", "claude-3-haiku-20240307"),
+                "openai": os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini"),
+                "stub": os.getenv("LLM_STUB_FAST_MODEL", "stub-fast-model")
+            },
+            # Провайдеры для LLM_PROVIDER=routed в порядке предпочтения
+            "routed_providers": [
+                name.strip() for name in os.getenv("LLM_ROUTED_PROVIDERS", "anthropic,openai").split(",") if name.strip()
+            ],
+            # Параметры локальной заглушки (LLM_PROVIDER=stub)
+            "stub": {
+                "latency_distribution": os.getenv("LLM_STUB_LATENCY_DISTRIBUTION", "lognormal"),  # fixed, uniform, normal, lognormal
+                "latency_ms": float(os.getenv("LLM_STUB_LATENCY_MS", "300")),
+                "latency_jitter_ms": float(os.getenv("LLM_STUB_LATENCY_JITTER_MS", "100")),
+                "tokens_per_second": float(os.getenv("LLM_STUB_TOKENS_PER_SECOND", "80")),
+                "output_tokens": int(os.getenv("LLM_STUB_OUTPUT_TOKENS", "200")),
+                "error_rate": float(os.getenv("LLM_STUB_ERROR_RATE", "0")),
+                "error_statuses": [int(code) for code in os.getenv("LLM_STUB_ERROR_STATUSES", "429,500,503").split(",") if code.strip()],
+                "seed": int(os.getenv("LLM_STUB_SEED", "0")),
+                "cache_min_tokens": int(os.getenv("LLM_STUB_CACHE_MIN_TOKENS", "1024")),
+                "fast_speedup": float(os.getenv("LLM_STUB_FAST_SPEEDUP", "3"))
+            },
+            "circuit_breaker": {
+                "enabled": os.getenv("LLM_CIRCUIT_BREAKER", "true").lower() == "true",
+                "failure_threshold": float(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "0.5")),
+                "min_requests": int(os.getenv("LLM_CIRCUIT_MIN_REQUESTS", "10")),
+                "window_size": int(os.getenv("LLM_CIRCUIT_WINDOW_SIZE", "50")),
+                "reset_timeout": float(os.getenv("LLM_CIRCUIT_RESET_TIMEOUT", "30")),
+                # Ответы медленнее порога считаются медленными; 0 отключает проверку
+                "slow_call_seconds": float(os.getenv("LLM_CIRCUIT_SLOW_CALL_SECONDS", "20")),
+                "slow_call_threshold": float(os.getenv("LLM_CIRCUIT_SLOW_CALL_THRESHOLD", "0.8"))
+            },
+            "coalesce_requests": os.getenv("LLM_COALESCE_REQUESTS", "true").lower() == "true",
+            "metrics_enabled": os.getenv("LLM_METRICS_ENABLED", "true").lower() == "true",
+            "cache": {
+                "backend": os.getenv("LLM_CACHE_BACKEND", "memory"),  # memory, redis, none
+                "ttl_seconds": int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400")),
+                "max_entries": int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000")),
+                "redis_url": os.getenv("REDIS_URL", "redis://localhost:6379/0")
+            }
+        }
+    
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self._config
+    
+    def _build_routed(self, config: Dict[str, Any], model: str) -> LLMProvider:
+        """Создает маршрутизатор над провайдерами из LLM_ROUTED_PROVIDERS."""
+        from app.services.llm_router import RoutedProvider
+        
+        providers = {}
+        for name in config["routed_providers"]:
+            if name not in self._factories or name == "routed":
+                raise ValueError(f"Unsupported routed LLM provider: {name}")
+            try:
+                providers[name] = self._factories[name](config, config["models"].get(name, ""))
+            except ValueError as e:
+                # Провайдер без ключа API исключается из маршрутизации
+                logger.warning(f"Routed LLM provider {name} skipped: {e}")
+        
+        # Маршрутизатору предохранители нужны для выбора провайдера и при LLM_CIRCUIT_BREAKER=false
+        breaker_config = {key: value for key, value in config["circuit_breaker"].items() if key != "enabled"}
+        return RoutedProvider(providers, breaker_config=breaker_config)
+    
+    def register(self, name: str, factory: Callable[[Dict[str, Any], str], LLMProvider]) -> None:
+        """Регистрирует фабрику провайдера под указанным именем."""
+        with self._lock:
+            self._factories[name] = factory
+            self._providers = {
+                key: provider for key, provider in self._providers.items() if key[0] != name
+            }
+    
+    def get(self, name: Optional[str] = None, model: Optional[str] = None) -> LLMProvider:
+        """Возвращает общий экземпляр провайдера, создавая его при первом обращении."""
+        config = self._config
+        name = name or config["provider"]
+        if name not in self._factories:
+            raise ValueError(f"Unsupported LLM provider: {name}")
+        model = model or config["models"].get(name, "")
+        key = (name, model)
+        
+        provider = self._providers.get(key)
+        if provider is not None:
+            return provider
+        
+        with self._lock:
+            provider = self._providers.get(key)
+            if provider is None:
+                provider = self._wrap(name, self._factories[name](config, model))
+                self._providers[key] = provider
+                logger.info(f"LLM provider created: {name} ({model})")
+        return provider
+    
+    @property
+    def response_cache(self):
+        """Кэш ответов, общий для всех провайдеров реестра (None, если отключен)."""
+        if not self._response_cache_built:
+            # Импорт внутри метода для избежания циклических импортов
+            from app.services.llm_cache import build_response_cache
+            self._response_cache = build_response_cache(self._config["cache"])
+            self._response_cache_built = True
+        return self._response_cache
+    
+    def _wrap(self, name: str, provider: LLMProvider) -> LLMProvider:
+        """Оборачивает провайдера в слои, включенные в конфигурации."""
+        from app.services.llm_cache import CachingLLMProvider
+        
+        # Маршрутизатор ведет предохранители для каждого своего провайдера.
+        # Предохранитель ниже кэша, поэтому ответы из кэша доступны и при разомкнутой цепи
+        breaker_config = dict(self._config["circuit_breaker"])
+        if breaker_config.pop("enabled") and name != "routed":
+            breaker = CircuitBreaker(f"{name}:{provider.default_model}", **breaker_config)
+            provider = CircuitBreakerLLMProvider(provider, breaker)
+        if self.response_cache is not None:
+            provider = CachingLLMProvider(provider, self.response_cache)
+        if self._config["coalesce_requests"]:
+            provider = CoalescingLLMProvider(provider, self._flight)
+        if self._config["metrics_enabled"]:
+            from app.services.llm_metrics import InstrumentedLLMProvider
+            provider = InstrumentedLLMProvider(provider)
+        return provider
+    
+    def reload(self, config: Optional[Dict[str, Any]] = None) -> None:
+        """Перечитывает конфигурацию; следующие вызовы get() получат новые экземпляры."""
+        with self._lock:
+            self._config = config or self._load_config()
+            self._providers = {}
+            self._response_cache = None
+            self._response_cache_built = False
+        logger.info(f"LLM provider registry reloaded (provider={self._config['provider']})")
+
+# Реестр провайдеров процесса
+llm_registry = LLMProviderRegistry()
+
+def get_llm_provider(name: Optional[str] = None, model: Optional[str] = None) -> LLMProvider:
+    """Возвращает общий экземпляр провайдера LLM в зависимости от настроек."""
+    return llm_registry.get(name, model)
@@ -0,0 +1,260 @@
+import json
+import math
+import time
+import random
+import hashlib
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, AsyncIterator
+import httpx
+
+from app.services.llm_service import (
+    LLMProvider, AnthropicProvider, LLMRequest, LLMBatchResult, estimate_tokens, register_http_client,
+    BATCH_MAX_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+# Словарь для генерации детерминированных ответов
+STUB_VOCABULARY = [
+    "обучение", "концепция", "пример", "задача", "уровень", "материал", "понимание",
+    "навык", "практика", "объяснение", "модель", "система", "данные", "результат",
+    "метод", "вопрос", "ответ", "структура", "анализ", "принцип", "и", "в", "на",
+    "для", "как", "это", "что", "при", "с", "по"
+]
+
+LATENCY_DISTRIBUTIONS = {"fixed", "uniform", "normal", "lognormal"}
+
+# Время жизни записи кэша промптов, как у ephemeral-кэша Messages API
+PROMPT_CACHE_TTL_SECONDS = 300
+
+class LocalStubProvider(AnthropicProvider):
+    """Локальная замена провайдера LLM для нагрузочного тестирования.
+    
+    Эмулирует Messages API через httpx.MockTransport, поэтому запросы проходят
+    тот же путь, что и к реальному API: ограничитель, повторы, разбор ответа
+    и потоковые события. Текст ответа детерминирован и зависит только от
+    запроса и seed; задержка, скорость генерации токенов и доля ошибок
+    задаются параметрами.
+    """
+    
+    provider_name = "stub"
+    
+    def __init__(
+        self,
+        default_model: str = "stub-model",
+        timeout: float = 30,
+        latency_distribution: str = "lognormal",
+        latency_ms: float = 300.0,
+        latency_jitter_ms: float = 100.0,
+        tokens_per_second: float = 80.0,
+        output_tokens: int = 200,
+        error_rate: float = 0.0,
+        error_statuses: Optional[List[int]] = None,
+        seed: int = 0,
+        cache_min_tokens: int = 1024,
+        fast_model: str = "stub-fast-model",
+        fast_speedup: float = 3.0
+    ):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unsupported stub latency distribution: {latency_distribution}")
+        
+        super().__init__(api_key="stub", default_model=default_model, timeout=timeout, fast_model=fast_model)
+        self.base_url = "http://llm-stub.local"
+        self.latency_distribution = latency_distribution
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses or [429, 500, 503]
+        self.seed = seed
+        self.cache_min_tokens = cache_min_tokens
+        self.fast_speedup = fast_speedup
+        self.requests = 0
+        self.injected_errors = 0
+        self.prompt_cache_hits = 0
+        self._prompt_cache: Dict[str, float] = {}
+        self._random = random.Random(seed)
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def open(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                transport=httpx.MockTransport(self._handle)
+            )
+            # Клиент с собственным транспортом не делится с другими провайдерами,
+            # но закрывается вместе с общим пулом
+            register_http_client(self._client)
+        return self._client
+    
+    def _sample_latency(self) -> float:
+        """Время до первого токена в секундах согласно заданному распределению."""
+        mean = self.latency_ms
+        jitter = self.latency_jitter_ms
+        
+        if self.latency_distribution == "fixed":
+            latency = mean
+        elif self.latency_distribution == "uniform":
+            latency = self._random.uniform(mean - jitter, mean + jitter)
+        elif self.latency_distribution == "normal":
+            latency = self._random.gauss(mean, jitter)
+        elif mean > 0:
+            # Логнормальное распределение с тем же средним дает длинный хвост задержек
+            sigma2 = math.log(1 + (jitter / mean) ** 2)
+            latency = self._random.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+        else:
+            latency = 0.0
+        
+        return max(0.0, latency) / 1000
+    
+    def _token_delay(self, model: str) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return 1 / (self.tokens_per_second * self._speedup(model))
+    
+    def _speedup(self, model: str) -> float:
+        """Во сколько раз быстрая модель отвечает быстрее основной."""
+        return self.fast_speedup if model == self.fast_model else 1.0
+    
+    @staticmethod
+    def _text(value: Any) -> str:
+        """Извлекает текст из строки или списка блоков контента."""
+        if isinstance(value, str):
+            return value
+        return "".join(block.get("text", "") for block in value or [] if isinstance(block, dict))
+    
+    def _completion(self, data: Dict[str, Any]) -> List[str]:
+        """Детерминированно генерирует токены ответа по содержимому запроса."""
+        payload = json.dumps(
+            [self.seed, data.get("model"), self._text(data.get("system")), data.get("messages"), data.get("temperature")],
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        generator = random.Random(hashlib.sha256(payload.encode("utf-8")).hexdigest())
+        count = max(1, min(self.output_tokens, data.get("max_tokens", self.output_tokens)))
+        return [generator.choice(STUB_VOCABULARY) for _ in range(count)]
+    
+    def _usage(self, data: Dict[str, Any], output_tokens: int) -> Dict[str, int]:
+        """Считает входные токены с эмуляцией кэша промптов по блокам с cache_control."""
+        blocks = []
+        for value in [data.get("system")] + [message.get("content") for message in data.get("messages", [])]:
+            if isinstance(value, list):
+                blocks.extend(block for block in value if isinstance(block, dict))
+            elif value:
+                blocks.append({"text": value})
+        
+        total = estimate_tokens("".join(block.get("text", "") for block in blocks))
+        usage = {"input_tokens": total, "output_tokens": output_tokens}
+        
+        # Кэшируется весь префикс до последнего блока с cache_control включительно
+        breakpoints = [index for index, block in enumerate(blocks) if "cache_control" in block]
+        if not breakpoints:
+            return usage
+        prefix = "".join(block.get("text", "") for block in blocks[:breakpoints[-1] + 1])
+        cached_tokens = estimate_tokens(prefix)
+        if cached_tokens < self.cache_min_tokens:
+            return usage
+        
+        key = hashlib.sha256(f"{data.get('model')}:{prefix}".encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        hit = self._prompt_cache.get(key, 0) > now
+        self._prompt_cache[key] = now + PROMPT_CACHE_TTL_SECONDS
+        
+        usage["input_tokens"] = max(0, total - cached_tokens)
+        usage["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = cached_tokens
+        if hit:
+            self.prompt_cache_hits += 1
+        return usage
+    
+    def _error_response(self, status_code: int) -> httpx.Response:
+        headers = {"retry-after": "1"} if status_code == 429 else {}
+        return httpx.Response(
+            status_code,
+            headers=headers,
+            json={"type": "error", "error": {"type": "stub_error", "message": f"Injected error {status_code}"}}
+        )
+    
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        """Обрабатывает запрос к эмулируемому Messages API."""
+        self.requests += 1
+        data = json.loads(request.content)
+        
+        latency = self._sample_latency() / self._speedup(data["model"])
+        if latency > self.timeout:
+            await asyncio.sleep(self.timeout)
+            raise httpx.ReadTimeout("Stub LLM request timed out", request=request)
+        await asyncio.sleep(latency)
+        
+        if self.error_rate > 0 and self._random.random() < self.error_rate:
+            self.injected_errors += 1
+            return self._error_response(self._random.choice(self.error_statuses))
+        
+        tokens = self._completion(data)
+        usage = self._usage(data, len(tokens))
+        message_id = "msg_stub_" + hashlib.sha256(" ".join(tokens).encode("utf-8")).hexdigest()[:16]
+        
+        if data.get("stream"):
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=self._stream_events(message_id, data["model"], tokens, usage)
+            )
+        
+        await asyncio.sleep(len(tokens) * self._token_delay(data["model"]))
+        return httpx.Response(200, json={
+            "id": message_id,
+            "type": "message",
+            "model": data["model"],
+            "content": [{"type": "text", "text": " ".join(tokens)}],
+            "stop_reason": "max_tokens" if len(tokens) >= data.get("max_tokens", 0) else "end_turn",
+            "usage": usage
+        })
+    
+    async def _stream_events(
+        self,
+        message_id: str,
+        model: str,
+        tokens: List[str],
+        usage: Dict[str, int]
+    ) -> AsyncIterator[bytes]:
+        """Отдает ответ событиями SSE с заданной скоростью генерации токенов."""
+        def event(event_type: str, payload: Dict[str, Any]) -> bytes:
+            body = json.dumps({"type": event_type, **payload}, ensure_ascii=False)
+            return f"event: {event_type}\ndata: {body}\n\n".encode("utf-8")
+        
+        yield event("message_start", {"message": {"id": message_id, "model": model, "usage": {**usage, "output_tokens": 0}}})
+        for index, token in enumerate(tokens):
+            await asyncio.sleep(self._token_delay(model))
+            text = token if index == 0 else " " + token
+            yield event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": text}})
+        yield event("message_delta", {"delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": usage["output_tokens"]}})
+        yield event("message_stop", {})
+    
+    async def generate_batch(
+        self,
+        requests: List[LLMRequest],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> List[LLMBatchResult]:
+        """Выполняет пакет параллельными вызовами без эмуляции пакетного API."""
+        return await LLMProvider.generate_batch(self, requests, max_concurrency)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "injected_errors": self.injected_errors,
+            "prompt_cache_hits": self.prompt_cache_hits
+        }
+
+def build_stub_provider(config: Dict[str, Any], model: str) -> LLMProvider:
+    """Создает локальную заглушку по конфигурации реестра."""
+    stub_config = config.get("stub", {})
+    logger.warning("Using local stub LLM provider; responses are synthetic")
+    return LocalStubProvider(
+        default_model=model or "stub-model",
+        timeout=config["timeout"],
+        fast_model=config.get("fast_models", {}).get("stub", "stub-fast-model"),
+        **stub_config
+    )
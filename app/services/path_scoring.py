@@ -0,0 +1,78 @@
+import numpy as np
+from typing import Tuple
+
+# Границы полос эффективной сложности: low < 0.3 <= medium < 0.7 <= high
+BAND_EDGES = np.array([0.3, 0.7])
+
+# Сложность и уровень владения концепции по умолчанию
+DEFAULT_DIFFICULTY = 0.5
+DEFAULT_MASTERY = 0.0
+
+def gather_neighbors(indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """Возвращает соседей набора узлов из смежности CSR одной операцией над массивами."""
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=indices.dtype)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return indices[offsets + np.arange(total)]
+
+def kahn_levels(
+    indptr: np.ndarray,
+    reverse_indptr: np.ndarray,
+    reverse_indices: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Рассчитывает топологические уровни алгоритмом Кана, обрабатывая уровень целиком.
+    
+    indptr - смежность концепция -> требования (важно только число требований),
+    reverse_* - смежность требование -> зависящие концепции. Возвращает уровни,
+    порядок обхода и концепции в циклах; они получают уровень после всех остальных.
+    """
+    count = len(indptr) - 1
+    levels = np.zeros(count, dtype=np.int32)
+    remaining = np.diff(indptr).astype(np.int64)
+    frontier = np.flatnonzero(remaining == 0)
+    order = []
+    level = 0
+    
+    while len(frontier):
+        levels[frontier] = level
+        order.append(frontier)
+        dependents = gather_neighbors(reverse_indptr, reverse_indices, frontier)
+        np.subtract.at(remaining, dependents, 1)
+        frontier = np.unique(dependents[remaining[dependents] == 0])
+        level += 1
+    
+    cyclic = np.flatnonzero(remaining > 0)
+    levels[cyclic] = level
+    order.append(cyclic)
+    return levels, np.concatenate(order), cyclic
+
+def effective_difficulty(difficulty: np.ndarray, mastery: np.ndarray) -> np.ndarray:
+    """Эффективная сложность: сложность * (1 - уровень владения)."""
+    return difficulty * (1 - mastery)
+
+def difficulty_bands(effective: np.ndarray) -> np.ndarray:
+    """Номер полосы сложности: 0 - low, 1 - medium, 2 - high."""
+    return np.digitize(effective, BAND_EDGES)
+
+def order_by_curve(
+    curve: str,
+    difficulty: np.ndarray,
+    mastery: np.ndarray,
+    levels: np.ndarray
+) -> np.ndarray:
+    """Возвращает перестановку концепций для кривой сложности.
+    
+    Массивы задаются в базовом (топологическом) порядке; все сортировки
+    устойчивы, поэтому при равенстве ключей базовый порядок сохраняется.
+    """
+    if curve == "gradual":
+        # По эффективной сложности с учетом текущего уровня владения
+        return np.argsort(effective_difficulty(difficulty, mastery), kind="stable")
+    if curve == "challenging":
+        # Сначала базовые зависимости, внутри уровня - от сложного к простому
+        return np.lexsort((-difficulty, levels))
+    # "adaptive" или другое: сначала простые, затем средние, потом сложные
+    return np.argsort(difficulty_bands(effective_difficulty(difficulty, mastery)), kind="stable")
@@ -0,0 +1,98 @@
+import os
+import uuid
+import logging
+from typing import Dict, Any, List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.assessment import LearningPlan
+from app.models.content import EducationalContent, content_concept
+from app.services.adaptive_service import AdaptiveMechanisms
+
+logger = logging.getLogger(__name__)
+
+# Число ближайших занятий плана, контент которых адаптируется заранее
+PREFETCH_ACTIVITY_COUNT = int(os.getenv("PREFETCH_ACTIVITY_COUNT", "5"))
+# Заблаговременная адаптация не должна занимать лимиты LLM интерактивных запросов
+PREFETCH_MAX_CONCURRENCY = int(os.getenv("PREFETCH_MAX_CONCURRENCY", "2"))
+
+# Занятия, для которых учащийся открывает контент концепции
+PREFETCH_ACTIVITY_TYPES = {"learn", "review"}
+
+def upcoming_concepts(plan: Dict[str, Any], activity_count: int, start_session: int = 0) -> List[str]:
+    """Концепции ближайших activity_count занятий плана, начиная с сессии start_session."""
+    concepts = []
+    remaining = activity_count
+    for session in plan.get("sessions", [])[start_session:]:
+        for activity in session["activities"]:
+            if remaining <= 0:
+                return concepts
+            if activity["activity_type"] not in PREFETCH_ACTIVITY_TYPES:
+                continue
+            remaining -= 1
+            if activity["concept_id"] not in concepts:
+                concepts.append(activity["concept_id"])
+    return concepts
+
+async def prefetch_plan_content(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    plan_id: uuid.UUID,
+    activity_count: int = PREFETCH_ACTIVITY_COUNT,
+    start_session: int = 0
+) -> Dict[str, Any]:
+    """Адаптирует контент ближайших занятий плана, чтобы при открытии урока он был в кэше.
+    
+    Уже адаптированный контент пропускается; результаты сохраняются в кэш
+    адаптированного контента так же, как при интерактивной адаптации.
+    """
+    plan_result = await db.execute(
+        select(LearningPlan).where(LearningPlan.id == plan_id, LearningPlan.user_id == user_id)
+    )
+    learning_plan = plan_result.scalars().first()
+    if not learning_plan:
+        raise ValueError(f"Learning plan with id {plan_id} not found")
+    
+    concept_ids = upcoming_concepts(learning_plan.plan_data, activity_count, start_session)
+    if not concept_ids:
+        return {"concepts": 0, "contents": 0, "cached": 0, "adapted": 0, "failed": 0}
+    
+    # Контент концепций в порядке занятий плана
+    content_query = select(content_concept.c.concept_id, EducationalContent.id).join(
+        EducationalContent, EducationalContent.id == content_concept.c.content_id
+    ).where(
+        content_concept.c.concept_id.in_([uuid.UUID(concept_id) for concept_id in concept_ids])
+    )
+    content_result = await db.execute(content_query)
+    contents_by_concept: Dict[str, List[uuid.UUID]] = {}
+    for concept_id, content_id in content_result.all():
+        contents_by_concept.setdefault(str(concept_id), []).append(content_id)
+    
+    content_ids = []
+    for concept_id in concept_ids:
+        for content_id in contents_by_concept.get(concept_id, []):
+            if content_id not in content_ids:
+                content_ids.append(content_id)
+    if not content_ids:
+        return {"concepts": len(concept_ids), "contents": 0, "cached": 0, "adapted": 0, "failed": 0}
+    
+    batch = await AdaptiveMechanisms.prepare_content_batch(db, user_id, content_ids)
+    cached = sum(1 for item in batch["items"] if item.get("cached") is not None)
+    
+    adapted = 0
+    failed = 0
+    async for result in AdaptiveMechanisms.adapt_content_batch(batch, PREFETCH_MAX_CONCURRENCY):
+        if result["status"] == "error":
+            failed += 1
+        elif not result["content"]["metadata"]["adaptation"]["cache_hit"]:
+            adapted += 1
+    
+    report = {
+        "concepts": len(concept_ids),
+        "contents": len(content_ids),
+        "cached": cached,
+        "adapted": adapted,
+        "failed": failed
+    }
+    logger.info(f"Prefetched content of learning plan {plan_id}: {report}")
+    return report
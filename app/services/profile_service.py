@@ -3,10 +3,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 from datetime import datetime
 from typing import Dict, Any, Optional, List
+import logging
 
 from app.models.user import LearningProfile, User, ConceptMastery
 from app.models.content import Concept
 from app.api.schemas import LearningProfileBase
+from app.services.learning_plan_service import replan_on_mastery_change
+from app.services.review_scheduler import schedule_review
+
+logger = logging.getLogger(__name__)
 
 async def create_profile(db: AsyncSession, user_id: uuid.UUID, profile_data: LearningProfileBase):
     """Создает профиль обучения для пользователя."""
@@ -112,6 +117,7 @@ async def update_concept_mastery(db: AsyncSession, user_id: uuid.UUID, concept_i
         current_mastery.confidence = new_confidence
         current_mastery.last_assessed_at = datetime.now()
         current_mastery.updated_at = datetime.now()
+        schedule_review(current_mastery, score)
     else:
         # Создание нового уровня владения
         new_mastery = ConceptMastery(
@@ -122,6 +128,7 @@ async def update_concept_mastery(db: AsyncSession, user_id: uuid.UUID, concept_i
             confidence=confidence,
             last_assessed_at=datetime.now()
         )
+        schedule_review(new_mastery, score)
         db.add(new_mastery)
     
     await db.commit()
@@ -134,6 +141,16 @@ async def update_concept_mastery(db: AsyncSession, user_id: uuid.UUID, concept_i
     updated_mastery_result = await db.execute(updated_mastery_query)
     updated_mastery = updated_mastery_result.scalars().first()
     
+    # Инкрементальное обновление активных планов обучения с этой концепцией
+    try:
+        await replan_on_mastery_change(
+            db, user_id, concept_id, updated_mastery.mastery_level, updated_mastery.next_review_at
+        )
+    except Exception as e:
+        # Уровень владения уже сохранен; план будет обновлен при следующем изменении
+        logger.error(f"Error replanning learning plans of user {user_id} for concept {concept_id}: {e}")
+        await db.rollback()
+    
     return updated_mastery
 
 async def update_profile_from_interaction(db: AsyncSession, user_id: uuid.UUID, interaction_data: Dict[str, Any]):
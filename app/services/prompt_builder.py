@@ -0,0 +1,260 @@
+import os
+import re
+import json
+import math
+import string
+import logging
+import textwrap
+from typing import Dict, Any, List, Optional, Tuple
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Бюджеты входных токенов (системный промпт + промпт) по типам вызовов.
+# Переопределяются через LLM_PROMPT_BUDGETS: JSON вида {"chat": 4000}
+PROMPT_BUDGETS: Dict[str, int] = {
+    "adapt_content": 8000,
+    "chat": 6000,
+    "feedback": 2000,
+    "default": 8000
+}
+PROMPT_BUDGETS.update({
+    task: int(budget) for task, budget in json.loads(os.getenv("LLM_PROMPT_BUDGETS", "{}")).items()
+})
+
+# Контекст короче этого порога не обрезается, а отбрасывается целиком
+MIN_CONTEXT_TOKENS = 50
+TRUNCATION_MARK = " [...]"
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_TRAILING_SPACES = re.compile(r"[ \t]+\n")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+def estimate_tokens(text: str) -> int:
+    """Оценивает число токенов в тексте без обращения к токенизатору провайдера.
+    
+    Латинские слова считаются по 4 символа на токен, остальные (кириллица и т.д.)
+    по 2.5 символа, знаки препинания - по одному токену.
+    """
+    tokens = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        word = match.group()
+        if not word[0].isalnum() and word[0] != "_":
+            tokens += 1
+        elif word.isascii():
+            tokens += math.ceil(len(word) / 4)
+        else:
+            tokens += math.ceil(len(word) / 2.5)
+    return tokens + 1
+
+def collapse_blank_lines(text: str) -> str:
+    """Удаляет пробелы в конце строк и схлопывает серии пустых строк."""
+    return _BLANK_LINES.sub("\n\n", _TRAILING_SPACES.sub("\n", text)).strip()
+
+def normalize_whitespace(text: str) -> str:
+    """Убирает общий отступ и лишние пустые строки, сохраняя структуру текста."""
+    return collapse_blank_lines(textwrap.dedent(text))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Обрезает текст до max_tokens по границе абзаца или предложения."""
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    
+    cut = len(text) * max_tokens // total
+    while cut > 0:
+        candidate = text[:cut]
+        boundary = max(candidate.rfind("\n"), candidate.rfind(". "))
+        if boundary > cut // 2:
+            candidate = candidate[:boundary + 1]
+        candidate = candidate.rstrip() + TRUNCATION_MARK
+        if estimate_tokens(candidate) <= max_tokens:
+            return candidate
+        cut = int(cut * 0.9)
+    return ""
+
+class ContextItem(BaseModel):
+    """Фрагмент контекста промпта; меньшее значение priority - более важный фрагмент."""
+    text: str
+    priority: int = 0
+    title: str = ""
+
+def fit_context(items: List[ContextItem], budget_tokens: int, separator: str = "\n\n") -> str:
+    """Укладывает фрагменты контекста в бюджет токенов в порядке приоритета.
+    
+    Фрагменты, не поместившиеся целиком, обрезаются; если остаток бюджета
+    меньше MIN_CONTEXT_TOKENS, менее важные фрагменты отбрасываются.
+    """
+    parts = []
+    remaining = budget_tokens
+    separator_tokens = estimate_tokens(separator)
+    
+    for item in sorted(items, key=lambda item: item.priority):
+        text = f"{item.title}\n{item.text}" if item.title else item.text
+        tokens = estimate_tokens(text) + separator_tokens
+        if tokens <= remaining:
+            parts.append(text)
+            remaining -= tokens
+            continue
+        
+        if remaining >= MIN_CONTEXT_TOKENS:
+            truncated = truncate_to_tokens(text, remaining - separator_tokens)
+            if truncated:
+                parts.append(truncated)
+        logger.info(f"Prompt context trimmed to {budget_tokens} tokens ({len(parts)} of {len(items)} items kept)")
+        break
+    
+    return separator.join(parts)
+
+class PromptTemplate:
+    """Шаблон промпта, нормализованный один раз при создании.
+    
+    Поля подставляются через str.format; строки, оставшиеся пустыми после
+    подстановки необязательных полей, схлопываются. Часть prefix ставится
+    в начало промпта и содержит только неизменные между вызовами инструкции
+    и общий контекст, чтобы провайдер мог кэшировать ее (prompt caching).
+    """
+    
+    def __init__(self, name: str, text: str, system_prompt: str = "", prefix: str = ""):
+        self.name = name
+        self.text = normalize_whitespace(text)
+        self.prefix = normalize_whitespace(prefix)
+        self.system_prompt = normalize_whitespace(system_prompt)
+        self.fields = {
+            field for part in (self.prefix, self.text)
+            for _, field, _, _ in string.Formatter().parse(part) if field
+        }
+    
+    def render_parts(self, **values: Any) -> Tuple[str, str]:
+        """Возвращает кэшируемый префикс и изменяемую часть промпта."""
+        prefix = collapse_blank_lines(self.prefix.format(**values)) + "\n\n" if self.prefix else ""
+        return prefix, collapse_blank_lines(self.text.format(**values))
+    
+    def render(self, **values: Any) -> str:
+        return "".join(self.render_parts(**values))
+
+class RenderedPrompt(BaseModel):
+    """Готовый промпт; text начинается с cache_prefix."""
+    text: str
+    cache_prefix: str = ""
+    system_prompt: str = ""
+    
+    def metadata(self, **extra: Any) -> Dict[str, Any]:
+        """Возвращает metadata для вызова LLMProvider.generate()."""
+        return {"system_prompt": self.system_prompt, "cache_prefix": self.cache_prefix, **extra}
+
+def get_prompt_budget(task: str) -> int:
+    """Возвращает бюджет входных токенов для типа вызова."""
+    return PROMPT_BUDGETS.get(task, PROMPT_BUDGETS["default"])
+
+def render_prompt(
+    template: PromptTemplate,
+    context: Optional[List[ContextItem]] = None,
+    budget_tokens: Optional[int] = None,
+    **values: Any
+) -> RenderedPrompt:
+    """Заполняет шаблон, укладывая контекст (поле {context}) в бюджет входных токенов.
+    
+    Бюджет включает системный промпт шаблона и неизменяемые поля; на контекст
+    приходится остаток.
+    """
+    budget_tokens = budget_tokens or get_prompt_budget(template.name)
+    if "context" in template.fields:
+        fixed_tokens = estimate_tokens(template.system_prompt) + estimate_tokens(template.render(context="", **values))
+        values["context"] = fit_context(context or [], budget_tokens - fixed_tokens)
+    
+    prefix, body = template.render_parts(**values)
+    return RenderedPrompt(text=prefix + body, cache_prefix=prefix, system_prompt=template.system_prompt)
+
+def build_prompt(
+    template: PromptTemplate,
+    context: Optional[List[ContextItem]] = None,
+    budget_tokens: Optional[int] = None,
+    **values: Any
+) -> str:
+    """Возвращает текст промпта; см. render_prompt()."""
+    return render_prompt(template, context, budget_tokens, **values).text
+
+# Статические инструкции и общий контекст (контент, документы) идут первыми,
+# параметры конкретного учащегося - в конце
+ADAPTATION_TEMPLATE = PromptTemplate(
+    "adapt_content",
+    prefix="""
+    Адаптируйте приведенный ниже образовательный контент под уровень сложности и стиль обучения учащегося.
+    
+    При адаптации:
+    1. Сохраните ключевые концепции и цели обучения
+    2. Отрегулируйте сложность языка, глубину объяснений и уровень детализации
+    3. Адаптируйте стиль представления и примеры под предпочтения пользователя
+    4. Сохраните общую структуру, сходную с исходным контентом
+    
+    Верните только адаптированный контент без пояснений или метакомментариев.
+    
+    Исходный контент:
+    {context}
+    """,
+    text="""
+    Уровень сложности: {target_difficulty:.2f} (от 0.0 до 1.0, где 0.0 - очень простой, 1.0 - очень сложный).
+    
+    Используйте следующие рекомендации по стилю обучения:
+    {style_guidance}
+    
+    {interests}
+    {background}
+    """,
+    system_prompt="Вы - эксперт по адаптивному обучению, который помогает персонализировать образовательный контент под нужды конкретных учащихся."
+)
+
+CHAT_TEMPLATE = PromptTemplate(
+    "chat",
+    prefix="""
+    Вы - адаптивный образовательный ассистент, помогающий пользователю в обучении.
+    Отвечайте в соответствии с профилем пользователя и предоставленным образовательным контекстом.
+    Будьте полезны, точны и адаптивны - подстраивайте объяснения под стиль обучения и уровень пользователя.
+    
+    Образовательный контекст:
+    {context}
+    """,
+    text="""
+    {user_profile}
+    
+    Сообщение пользователя: {message}
+    """,
+    system_prompt="Вы - адаптивный образовательный ассистент, который персонализирует ответы под профиль конкретного учащегося."
+)
+
+FEEDBACK_TEMPLATE = PromptTemplate(
+    "feedback",
+    prefix="""
+    Сгенерируйте персонализированную образовательную обратную связь для учащегося на основе результатов оценки.
+    
+    Обратная связь должна:
+    1. Обращаться к конкретным сильным и слабым сторонам в ответе учащегося
+    2. Быть адаптирована к его стилю обучения и мотивационному профилю
+    3. Предоставлять конкретные предложения по улучшению
+    4. Использовать стиль и мотивационный тон из параметров обратной связи
+    
+    Верните обратную связь как связный абзац без метакомментариев или заголовков разделов.
+    """,
+    text="""
+    Результаты оценки:
+    - Оценка: {total_score:.2f} из 1.0
+    - Сильные стороны: {strengths}
+    - Области для улучшения: {areas_for_improvement}
+    
+    Профиль учащегося:
+    - Стиль обучения: {learning_style}
+    - Мотивационный профиль: {motivation_profile}
+    
+    Параметры обратной связи:
+    - Стиль: {feedback_style}
+    - Мотивационный тон: {motivational_tone}
+    - Включать следующие шаги: {include_next_steps}
+    - Уровень детализации: {detail_level}
+    
+    {next_steps_instruction}
+    """,
+    system_prompt="Вы - опытный педагог, который предоставляет полезную и мотивирующую обратную связь учащимся."
+)
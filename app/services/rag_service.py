@@ -1,9 +1,14 @@
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any, List, Optional
+import os
 import uuid
 
 from app.models.content import Concept, EducationalContent, content_concept
+from app.services.prompt_builder import ContextItem, truncate_to_tokens
+
+# Максимальный размер одного документа в контексте промпта
+RAG_MAX_DOCUMENT_TOKENS = int(os.getenv("RAG_MAX_DOCUMENT_TOKENS", "1500"))
 
 async def get_educational_context(db: AsyncSession, query: str, user_profile: Dict[str, Any]) -> Dict[str, Any]:
     """Получает образовательный контекст на основе запроса и профиля пользователя."""
@@ -46,13 +51,20 @@ async def get_educational_context(db: AsyncSession, query: str, user_profile: Di
     learning_style = user_profile.get("learning_style", {})
     preferences = user_profile.get("preferences", {})
     
-    # Построение образовательного контекста
-    educational_context = ""
-    if content_items:
-        for i, item in enumerate(content_items):
-            educational_context += f"Document {i+1}: {item.title}\n{item.body}\n\n"
-    else:
-        educational_context = "Релевантный образовательный контент не найден."
+    # Построение образовательного контекста; порядок документов задает их приоритет
+    documents = [
+        ContextItem(
+            title=f"Document {i+1}: {item.title}",
+            text=truncate_to_tokens(item.body, RAG_MAX_DOCUMENT_TOKENS),
+            priority=i
+        )
+        for i, item in enumerate(content_items)
+    ]
+    if not documents:
+        documents = [ContextItem(text="Релевантный образовательный контент не найден.")]
+    educational_context = "\n\n".join(
+        f"{document.title}\n{document.text}" if document.title else document.text for document in documents
+    )
     
     # Формирование профиля пользователя для передачи в LLM
     user_profile_text = "Профиль пользователя:\n"
@@ -66,6 +78,7 @@ async def get_educational_context(db: AsyncSession, query: str, user_profile: Di
     # Формирование контекста
     context = {
         "educational_context": educational_context,
+        "documents": documents,
         "user_profile": user_profile_text,
         "concepts_referenced": [concept.name for concept in concepts]
     }
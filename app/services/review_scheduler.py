@@ -0,0 +1,177 @@
+import os
+import uuid
+import logging
+from datetime import datetime, date, time, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+from sqlalchemy import select, delete, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import ConceptMastery, DailyReviewQueue
+
+logger = logging.getLogger(__name__)
+
+# Размер пакета при обходе очереди повторений всех учащихся
+REVIEW_QUEUE_BATCH_SIZE = int(os.getenv("REVIEW_QUEUE_BATCH_SIZE", "5000"))
+# Максимум концепций в ответе "что повторить сейчас"
+REVIEW_DUE_LIMIT = int(os.getenv("REVIEW_DUE_LIMIT", "50"))
+
+# Параметры алгоритма SM-2
+DEFAULT_EASE_FACTOR = 2.5
+MIN_EASE_FACTOR = 1.3
+# Ответ с качеством ниже порога сбрасывает серию повторений
+PASSING_QUALITY = 3
+
+def review_quality(score: float) -> int:
+    """Качество ответа по шкале SM-2 (0-5) из результата оценки в [0, 1]."""
+    return int(round(min(1.0, max(0.0, score)) * 5))
+
+def sm2(ease_factor: float, interval_days: float, repetitions: int, quality: int) -> Tuple[float, float, int]:
+    """Следующее состояние повторения по SM-2: фактор легкости, интервал в днях и число успешных повторений."""
+    if quality < PASSING_QUALITY:
+        repetitions = 0
+        interval_days = 1.0
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval_days = 1.0
+        elif repetitions == 2:
+            interval_days = 6.0
+        else:
+            interval_days = round(interval_days * ease_factor, 2)
+    
+    ease_factor = max(MIN_EASE_FACTOR, ease_factor + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return ease_factor, interval_days, repetitions
+
+def schedule_review(mastery: ConceptMastery, score: float, reviewed_at: Optional[datetime] = None) -> None:
+    """Обновляет состояние повторения концепции и время следующего повторения."""
+    reviewed_at = reviewed_at or datetime.now(timezone.utc)
+    ease_factor = mastery.ease_factor if mastery.ease_factor is not None else DEFAULT_EASE_FACTOR
+    
+    mastery.ease_factor, mastery.interval_days, mastery.repetitions = sm2(
+        ease_factor, mastery.interval_days or 0.0, mastery.repetitions or 0, review_quality(score)
+    )
+    mastery.next_review_at = reviewed_at + timedelta(days=mastery.interval_days)
+
+async def get_due_reviews(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    now: Optional[datetime] = None,
+    limit: Optional[int] = REVIEW_DUE_LIMIT
+) -> List[ConceptMastery]:
+    """Концепции, которые учащийся должен повторить к моменту now, начиная с самых просроченных.
+    
+    Запрос - диапазонное сканирование индекса (user_id, next_review_at).
+    """
+    now = now or datetime.now(timezone.utc)
+    query = select(ConceptMastery).where(
+        ConceptMastery.user_id == user_id,
+        ConceptMastery.next_review_at <= now
+    ).order_by(ConceptMastery.next_review_at).limit(limit)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+async def iter_due_reviews(
+    db: AsyncSession,
+    end: datetime,
+    start: Optional[datetime] = None,
+    batch_size: int = REVIEW_QUEUE_BATCH_SIZE
+) -> AsyncIterator[List[Any]]:
+    """Обходит повторения всех учащихся со временем в [start, end) пакетами.
+    
+    Пакеты выбираются по ключу (next_review_at, id) из индекса без OFFSET,
+    поэтому стоимость пакета не зависит от его номера. Без start в обход
+    попадают и все просроченные повторения.
+    """
+    after = None
+    while True:
+        query = select(
+            ConceptMastery.id, ConceptMastery.user_id, ConceptMastery.concept_id, ConceptMastery.next_review_at
+        ).where(ConceptMastery.next_review_at < end)
+        if start is not None:
+            query = query.where(ConceptMastery.next_review_at >= start)
+        if after is not None:
+            query = query.where(tuple_(ConceptMastery.next_review_at, ConceptMastery.id) > after)
+        query = query.order_by(ConceptMastery.next_review_at, ConceptMastery.id).limit(batch_size)
+        
+        result = await db.execute(query)
+        rows = result.all()
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1].next_review_at, rows[-1].id)
+
+async def build_daily_queues(
+    db: AsyncSession,
+    queue_date: Optional[date] = None,
+    batch_size: int = REVIEW_QUEUE_BATCH_SIZE
+) -> Dict[str, Any]:
+    """Рассчитывает очереди повторений всех учащихся на день и заменяет сохраненные очереди этого дня.
+    
+    В очередь попадают концепции со временем повторения до конца дня (UTC),
+    включая просроченные. Каждый пакет записывается и фиксируется сразу,
+    поэтому память не зависит от числа учащихся. Повторения учащегося могут
+    попасть в несколько пакетов: они дописываются в его очередь по порядку
+    времени. Пока очередь не записана, get_daily_queue строит ее по индексу.
+    """
+    queue_date = queue_date or datetime.now(timezone.utc).date()
+    end = datetime.combine(queue_date + timedelta(days=1), time.min, tzinfo=timezone.utc)
+    
+    await db.execute(delete(DailyReviewQueue).where(DailyReviewQueue.queue_date == queue_date))
+    await db.commit()
+    
+    users = 0
+    items = 0
+    async for rows in iter_due_reviews(db, end, batch_size=batch_size):
+        batch: Dict[uuid.UUID, List[Dict[str, Any]]] = {}
+        for row in rows:
+            batch.setdefault(row.user_id, []).append({
+                "concept_id": str(row.concept_id),
+                "due_at": row.next_review_at.isoformat()
+            })
+        
+        # Очереди учащихся, начатые предыдущими пакетами
+        existing_query = select(DailyReviewQueue).where(
+            DailyReviewQueue.queue_date == queue_date,
+            DailyReviewQueue.user_id.in_(list(batch))
+        )
+        existing_result = await db.execute(existing_query)
+        for queue in existing_result.scalars().all():
+            # Новый список, чтобы SQLAlchemy отследил изменение JSON-поля
+            queue.items = queue.items + batch.pop(queue.user_id)
+        
+        db.add_all([
+            DailyReviewQueue(user_id=user_id, queue_date=queue_date, items=user_items)
+            for user_id, user_items in batch.items()
+        ])
+        await db.commit()
+        
+        users += len(batch)
+        items += len(rows)
+    
+    report = {"queue_date": queue_date.isoformat(), "users": users, "items": items}
+    logger.info(f"Daily review queues built: {report}")
+    return report
+
+async def get_daily_queue(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    queue_date: Optional[date] = None
+) -> List[Dict[str, Any]]:
+    """Очередь повторений учащегося на день; если она не рассчитана заранее, строится по индексу."""
+    queue_date = queue_date or datetime.now(timezone.utc).date()
+    query = select(DailyReviewQueue.items).where(
+        DailyReviewQueue.user_id == user_id,
+        DailyReviewQueue.queue_date == queue_date
+    )
+    result = await db.execute(query)
+    items = result.scalars().first()
+    if items is not None:
+        return items
+    
+    end = datetime.combine(queue_date + timedelta(days=1), time.min, tzinfo=timezone.utc)
+    due = await get_due_reviews(db, user_id, end - timedelta(microseconds=1), limit=None)
+    return [
+        {"concept_id": str(mastery.concept_id), "due_at": mastery.next_review_at.isoformat()}
+        for mastery in due
+    ]
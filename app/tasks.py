@@ -1,10 +1,13 @@
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import worker_process_init, worker_process_shutdown
 import os
 import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 from typing import Dict, Any, List, Optional
 import uuid
+from datetime import date
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -16,15 +19,50 @@ celery_app = Celery(
     backend=os.getenv("REDIS_URL", "redis://localhost:6379/0")
 )
 
+# Периодические задачи (celery -A app.tasks beat)
+celery_app.conf.beat_schedule = {
+    # Очереди повторений на день рассчитываются заранее, до начала занятий
+    "build-daily-review-queues": {
+        "task": "app.tasks.build_daily_review_queues_task",
+        "schedule": crontab(hour=int(os.getenv("REVIEW_QUEUE_BUILD_HOUR", "3")), minute=0)
+    }
+}
+celery_app.conf.timezone = "UTC"
+
+# Заблаговременная адаптация выполняется в отдельной очереди со своим воркером
+# (celery -A app.tasks worker -Q prefetch), чтобы не задерживать интерактивные задачи
+PREFETCH_QUEUE = os.getenv("PREFETCH_QUEUE", "prefetch")
+celery_app.conf.task_routes = {
+    "app.tasks.prefetch_plan_content_task": {"queue": PREFETCH_QUEUE}
+}
+
 # Импорт будет осуществляться после определения приложения Celery
 # для избежания циклических импортов
 from app.db.database import async_session
-from app.services import profile_service, content_service, assessment_service
+from app.services import profile_service, content_service, assessment_service, cohort_service, review_scheduler
+from app.services import prefetch_service
+from app.services.llm_service import open_http_clients, close_http_clients
 
 # Utility для запуска асинхронных функций в Celery
 def run_async(coro):
     return asyncio.get_event_loop().run_until_complete(coro)
 
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Открывает пул HTTP-соединений к LLM в каждом процессе воркера."""
+    try:
+        run_async(open_http_clients())
+    except Exception as e:
+        logger.error(f"Error opening LLM HTTP clients in worker: {e}")
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """Закрывает пул HTTP-соединений к LLM при остановке процесса воркера."""
+    try:
+        run_async(close_http_clients())
+    except Exception as e:
+        logger.error(f"Error closing LLM HTTP clients in worker: {e}")
+
 @celery_app.task
 def update_profile_from_interaction_task(user_id: str, interaction_data: Dict[str, Any]):
     """Задача для асинхронного обновления профиля на основе взаимодействия."""
@@ -90,6 +128,102 @@ def adapt_content_task(content_id: str, user_id: str, adaptation_params: Optiona
         logger.error(f"Error adapting content {content_id} for user {user_id}: {e}")
         return {"status": "error", "message": str(e)}
 
+@celery_app.task(bind=True)
+def batch_adapt_content_task(self, work_item_ids: List[str], chunk_size: int = 100):
+    """Задача для пакетной адаптации контента по заданиям AdaptedContent.
+    
+    Повторный запуск с теми же заданиями продолжает работу с незавершенных.
+    """
+    try:
+        def report_progress(done: int, failed: int, total: int):
+            self.update_state(state="PROGRESS", meta={"done": done, "failed": failed, "total": total})
+        
+        # Создание асинхронной сессии
+        async def adapt_batch():
+            async with async_session() as session:
+                return await content_service.process_adaptation_work_items(
+                    session,
+                    [uuid.UUID(item_id) for item_id in work_item_ids],
+                    chunk_size=chunk_size,
+                    on_progress=report_progress
+                )
+        
+        # Запуск асинхронной функции
+        summary = run_async(adapt_batch())
+        logger.info(f"Batch adaptation finished: {summary}")
+        return {"status": "success", **summary}
+    except Exception as e:
+        logger.error(f"Error in batch adaptation: {e}")
+        return {"status": "error", "message": str(e)}
+
+@celery_app.task(bind=True)
+def pre_adapt_cohorts_task(self, cohort_count: Optional[int] = None, chunk_size: int = 100):
+    """Задача для кластеризации учащихся и заблаговременной адаптации контента по когортам.
+    
+    Возвращает покрытие когорт и долю вариантов, уже имевшихся в кэше.
+    """
+    try:
+        def report_progress(ready: int, total: int):
+            self.update_state(state="PROGRESS", meta={"ready": ready, "total": total})
+        
+        # Создание асинхронной сессии
+        async def pre_adapt():
+            async with async_session() as session:
+                return await cohort_service.pre_adapt_content(
+                    session,
+                    cohort_count=cohort_count or cohort_service.COHORT_COUNT,
+                    chunk_size=chunk_size,
+                    on_progress=report_progress
+                )
+        
+        # Запуск асинхронной функции
+        report = run_async(pre_adapt())
+        return {"status": "success", **report}
+    except Exception as e:
+        logger.error(f"Error in cohort pre-adaptation: {e}")
+        return {"status": "error", "message": str(e)}
+
+@celery_app.task(ignore_result=True)
+def prefetch_plan_content_task(user_id: str, plan_id: str, activity_count: Optional[int] = None, start_session: int = 0):
+    """Задача для заблаговременной адаптации контента ближайших занятий плана."""
+    try:
+        # Создание асинхронной сессии
+        async def prefetch():
+            async with async_session() as session:
+                return await prefetch_service.prefetch_plan_content(
+                    session,
+                    uuid.UUID(user_id),
+                    uuid.UUID(plan_id),
+                    activity_count=activity_count or prefetch_service.PREFETCH_ACTIVITY_COUNT,
+                    start_session=start_session
+                )
+        
+        # Запуск асинхронной функции
+        report = run_async(prefetch())
+        return {"status": "success", **report}
+    except Exception as e:
+        logger.error(f"Error prefetching content of learning plan {plan_id}: {e}")
+        return {"status": "error", "message": str(e)}
+
+@celery_app.task
+def build_daily_review_queues_task(queue_date: Optional[str] = None):
+    """Задача для расчета очередей повторений всех учащихся на день."""
+    try:
+        # Создание асинхронной сессии
+        async def build_queues():
+            async with async_session() as session:
+                return await review_scheduler.build_daily_queues(
+                    session,
+                    date.fromisoformat(queue_date) if queue_date else None
+                )
+        
+        # Запуск асинхронной функции
+        report = run_async(build_queues())
+        return {"status": "success", **report}
+    except Exception as e:
+        logger.error(f"Error building daily review queues: {e}")
+        return {"status": "error", "message": str(e)}
+
 @celery_app.task
 def create_assessment_task(user_id: str, concept_ids: List[str], difficulty_level: float = 0.5, 
                           assessment_type: str = "adaptive", max_questions: int = 5):
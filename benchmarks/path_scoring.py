@@ -0,0 +1,121 @@
+"""Сравнение построчного и векторного расчета порядка концепций в плане обучения.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.path_scoring --sizes 10000 50000 100000
+
+Для каждого размера учебной программы генерируется случайный граф требований
+(каждая концепция требует до --prerequisites более ранних концепций), после
+чего замеряется время расчета всех трех кривых сложности: построчной реализацией
+на словарях (прежний код optimize_learning_path с послойным отбором уровней) и
+векторной реализацией из app.services.path_scoring.
+"""
+import argparse
+import time
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+
+from app.services.path_scoring import kahn_levels, order_by_curve
+
+CURVES = ["gradual", "challenging", "adaptive"]
+
+def generate_curriculum(size: int, prerequisites: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Возвращает сложность, уровень владения и связи (концепция, требование)."""
+    random = np.random.default_rng(seed)
+    difficulty = random.random(size)
+    mastery = np.where(random.random(size) < 0.3, random.random(size), 0.0)
+    
+    sources = np.repeat(np.arange(1, size), random.integers(0, prerequisites + 1, size - 1))
+    targets = (random.random(len(sources)) * sources).astype(np.int64)
+    return difficulty, mastery, np.unique(np.stack([sources, targets], axis=1), axis=0)
+
+def legacy_order(curve: str, concept_data: Dict[str, Dict], mastery_levels: Dict[str, float], dependency_graph: Dict[str, List[str]]) -> List[str]:
+    """Прежняя реализация кривых сложности на словарях и лямбдах."""
+    base_sequence = list(concept_data)
+    
+    if curve == "gradual":
+        weighted_difficulty = {
+            c: concept_data.get(c, {}).get("difficulty", 0.5) * (1 - mastery_levels.get(c, 0.0))
+            for c in base_sequence
+        }
+        return sorted(base_sequence, key=lambda c: weighted_difficulty.get(c, 0.5))
+    
+    if curve == "challenging":
+        optimized_sequence = []
+        remaining = set(base_sequence)
+        while remaining:
+            level_concepts = []
+            for concept in list(remaining):
+                if all(prereq not in remaining for prereq in dependency_graph.get(concept, [])):
+                    level_concepts.append(concept)
+                    remaining.remove(concept)
+            if not level_concepts and remaining:
+                level_concepts = list(remaining)
+                remaining.clear()
+            level_concepts.sort(key=lambda c: concept_data.get(c, {}).get("difficulty", 0.5), reverse=True)
+            optimized_sequence.extend(level_concepts)
+        return optimized_sequence
+    
+    bands = {"low": [], "medium": [], "high": []}
+    for concept in base_sequence:
+        effective = concept_data.get(concept, {}).get("difficulty", 0.5) * (1 - mastery_levels.get(concept, 0.0))
+        if effective < 0.3:
+            bands["low"].append(concept)
+        elif effective < 0.7:
+            bands["medium"].append(concept)
+        else:
+            bands["high"].append(concept)
+    return bands["low"] + bands["medium"] + bands["high"]
+
+def vectorised_order(curve: str, difficulty: np.ndarray, mastery: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Векторная реализация; для кривой challenging включает построение CSR и расчет уровней."""
+    size = len(difficulty)
+    if curve != "challenging":
+        return order_by_curve(curve, difficulty, mastery, np.zeros(size, dtype=np.int32))
+    
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edges[:, 0], minlength=size), out=indptr[1:])
+    reverse = edges[np.argsort(edges[:, 1], kind="stable")]
+    reverse_indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(reverse[:, 1], minlength=size), out=reverse_indptr[1:])
+    
+    levels, _, _ = kahn_levels(indptr, reverse_indptr, reverse[:, 0])
+    return order_by_curve(curve, difficulty, mastery, levels)
+
+def measure(function: Callable[[], object], repeat: int) -> float:
+    """Лучшее время из repeat запусков в миллисекундах."""
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started_at)
+    return best * 1000
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--prerequisites", type=int, default=2, help="Максимум требований у концепции")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-max-size", type=int, default=100000, help="Не запускать прежнюю реализацию для больших программ")
+    args = parser.parse_args()
+    
+    print(f"{'concepts':>9} {'edges':>8} {'curve':>12} {'legacy, ms':>12} {'numpy, ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        difficulty, mastery, edges = generate_curriculum(size, args.prerequisites)
+        ids = [f"c{index}" for index in range(size)]
+        concept_data = {ids[index]: {"difficulty": float(difficulty[index])} for index in range(size)}
+        mastery_levels = {ids[index]: float(mastery[index]) for index in range(size)}
+        dependency_graph: Dict[str, List[str]] = {}
+        for source, target in edges:
+            dependency_graph.setdefault(ids[source], []).append(ids[target])
+        
+        for curve in CURVES:
+            numpy_ms = measure(lambda: vectorised_order(curve, difficulty, mastery, edges), args.repeat)
+            if size <= args.legacy_max_size:
+                legacy_ms = measure(lambda: legacy_order(curve, concept_data, mastery_levels, dependency_graph), args.repeat)
+                print(f"{size:>9} {len(edges):>8} {curve:>12} {legacy_ms:>12.1f} {numpy_ms:>10.1f} {legacy_ms / numpy_ms:>7.1f}x")
+            else:
+                print(f"{size:>9} {len(edges):>8} {curve:>12} {'-':>12} {numpy_ms:>10.1f} {'-':>8}")
+
+if __name__ == "__main__":
+    main()
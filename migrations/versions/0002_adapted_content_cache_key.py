@@ -0,0 +1,26 @@
+"""Adaptation cache key
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Ключ кэша адаптированного контента
+    op.add_column('adapted_content', sa.Column('cache_key', sa.String(64), nullable=True))
+    op.create_index('idx_adapted_content_cache_key', 'adapted_content', ['cache_key'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_adapted_content_cache_key', table_name='adapted_content')
+    op.drop_column('adapted_content', 'cache_key')
@@ -0,0 +1,36 @@
+"""Learner cohorts
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Создание таблицы learner_cohorts
+    op.create_table('learner_cohorts',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('index', sa.Integer, nullable=False),
+        sa.Column('centroid', postgresql.JSONB, nullable=False),
+        sa.Column('size', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'), nullable=False)
+    )
+
+    # Варианты когорт хранятся без пользователя
+    op.alter_column('adapted_content', 'user_id', existing_type=postgresql.UUID(as_uuid=True), nullable=True)
+
+
+def downgrade() -> None:
+    op.execute('DELETE FROM adapted_content WHERE user_id IS NULL')
+    op.alter_column('adapted_content', 'user_id', existing_type=postgresql.UUID(as_uuid=True), nullable=False)
+    op.drop_table('learner_cohorts')
@@ -0,0 +1,26 @@
+"""Concept relationship indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Индексы для загрузки связей набора концепций одним запросом
+    op.create_index('idx_concept_relationships_source_concept_id', 'concept_relationships', ['source_concept_id'])
+    op.create_index('idx_concept_relationships_target_concept_id', 'concept_relationships', ['target_concept_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_concept_relationships_target_concept_id', table_name='concept_relationships')
+    op.drop_index('idx_concept_relationships_source_concept_id', table_name='concept_relationships')
@@ -0,0 +1,51 @@
+"""Review schedule and daily review queues
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Состояние интервального повторения (SM-2)
+    op.add_column('concept_mastery', sa.Column('ease_factor', sa.Float, nullable=False, server_default='2.5'))
+    op.add_column('concept_mastery', sa.Column('interval_days', sa.Float, nullable=False, server_default='0'))
+    op.add_column('concept_mastery', sa.Column('repetitions', sa.Integer, nullable=False, server_default='0'))
+    op.add_column('concept_mastery', sa.Column('next_review_at', sa.DateTime(timezone=True), nullable=True))
+
+    # Существующие концепции повторяются через день после последней оценки
+    op.execute("UPDATE concept_mastery SET next_review_at = last_assessed_at + INTERVAL '1 day'")
+
+    op.create_index('idx_concept_mastery_user_next_review', 'concept_mastery', ['user_id', 'next_review_at'])
+    op.create_index('idx_concept_mastery_next_review', 'concept_mastery', ['next_review_at', 'id'])
+
+    # Создание таблицы daily_review_queues
+    op.create_table('daily_review_queues',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('queue_date', sa.Date, nullable=False),
+        sa.Column('items', postgresql.JSONB, nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'), nullable=False)
+    )
+    op.create_index('idx_daily_review_queues_user_date', 'daily_review_queues', ['user_id', 'queue_date'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_daily_review_queues_user_date', table_name='daily_review_queues')
+    op.drop_table('daily_review_queues')
+    op.drop_index('idx_concept_mastery_next_review', table_name='concept_mastery')
+    op.drop_index('idx_concept_mastery_user_next_review', table_name='concept_mastery')
+    op.drop_column('concept_mastery', 'next_review_at')
+    op.drop_column('concept_mastery', 'repetitions')
+    op.drop_column('concept_mastery', 'interval_days')
+    op.drop_column('concept_mastery', 'ease_factor')
@@ -0,0 +1,28 @@
+"""Adapted content status
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Состояние задания пакетной адаптации; кэш адаптации использует только готовые варианты
+    op.add_column('adapted_content', sa.Column('status', sa.String(16), nullable=False, server_default='ready'))
+    op.execute(
+        "UPDATE adapted_content SET status = adaptation_params->>'batch_status' "
+        "WHERE adaptation_params->>'batch_status' IN ('pending', 'failed')"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('adapted_content', 'status')
@@ -0,0 +1,71 @@
+import uuid
+import pytest
+
+from app.models.content import EducationalContent
+from app.services.adaptation_cache import (
+    AdaptationCache, AdaptationProfile, CachedAdaptation, adaptation_cache_key
+)
+
+def test_similar_profiles_share_cache_key():
+    """Тест квантования профиля: близкие профили дают один ключ, изменение контента - новый."""
+    content = EducationalContent(id=uuid.uuid4(), title="Переменные", body="Переменная хранит значение.")
+    first = AdaptationProfile.from_profile(0.52, {"visual": 0.7, "auditory": 0.3}, {"interests": ["Игры", "музыка"]})
+    second = AdaptationProfile.from_profile(0.48, {"visual": 0.6}, {"interests": ["музыка", "игры "]})
+    other = AdaptationProfile.from_profile(0.48, {"kinesthetic": 0.9}, {"interests": ["музыка", "игры"]})
+    
+    assert first.difficulty == 0.5
+    assert adaptation_cache_key(content, first) == adaptation_cache_key(content, second)
+    assert adaptation_cache_key(content, first) != adaptation_cache_key(content, other)
+    
+    key = adaptation_cache_key(content, first)
+    content.body = "Переменная - именованная ячейка памяти."
+    assert adaptation_cache_key(content, first) != key
+
+@pytest.mark.asyncio
+async def test_memory_lru_serves_without_database():
+    """Тест LRU в памяти: попадание не обращается к базе, старые записи вытесняются."""
+    cache = AdaptationCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache._remember(key, CachedAdaptation(id=key, body=f"текст {key}", difficulty=0.5))
+    
+    entry = await cache.get(None, "c")
+    
+    assert entry.body == "текст c"
+    assert "a" not in cache._entries
+    assert cache.stats()["memory_hits"] == 1
+
+# Сессия-заглушка: запоминает запросы, строк не возвращает
+class EmptySession:
+    def __init__(self):
+        self.queries = []
+        self.added = []
+    
+    async def execute(self, query):
+        self.queries.append(str(query))
+        return EmptyResult()
+    
+    def add(self, instance):
+        self.added.append(instance)
+    
+    async def commit(self):
+        pass
+
+class EmptyResult:
+    def scalars(self):
+        return self
+    
+    def first(self):
+        return None
+
+@pytest.mark.asyncio
+async def test_cache_ignores_pending_work_items():
+    """Тест: поиск и сохранение варианта учитывают только готовые записи, а не задания пакетной адаптации."""
+    content = EducationalContent(id=uuid.uuid4(), title="Переменные", body="Переменная хранит значение.")
+    cache = AdaptationCache()
+    session = EmptySession()
+    
+    assert await cache.get(session, "key") is None
+    await cache.put(session, "key", content, uuid.uuid4(), "адаптированный текст", 0.5, {})
+    
+    assert all("adapted_content.status = " in query for query in session.queries)
+    assert session.added[0].status == "ready"
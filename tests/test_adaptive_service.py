@@ -0,0 +1,249 @@
+import uuid
+import asyncio
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from app.models.user import LearningProfile, ConceptMastery
+from app.models.content import Concept, ConceptRelationship, EducationalContent
+from app.services import adaptive_service
+from app.services.adaptive_service import AdaptiveMechanisms
+from app.services.feedback_templates import get_feedback_cache
+from app.services.llm_service import LLMResponse
+from app.services.concept_graph import reset_concept_graph
+from app.services.learning_plan_service import build_learning_plan, apply_mastery_change, sequence_key
+from app.services.prefetch_service import upcoming_concepts
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+    
+    def scalars(self):
+        return self
+    
+    def all(self):
+        return self.rows
+    
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+# Сессия-заглушка: возвращает строки по сущности запроса и считает запросы
+class RecordingSession:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+        self.added = []
+    
+    async def execute(self, query):
+        self.queries += 1
+        return FakeResult(self.rows.get(query.column_descriptions[0]["entity"], []))
+    
+    def add(self, instance):
+        self.added.append(instance)
+    
+    async def commit(self):
+        pass
+
+@pytest.mark.asyncio
+async def test_learning_path_uses_constant_number_of_queries():
+    """Тест: число запросов не зависит от размера плана, порядок учитывает требования."""
+    user_id = uuid.uuid4()
+    concepts = [
+        Concept(id=uuid.uuid4(), name=f"Концепция {i}", description="", domain="math", difficulty=0.1 + i / 100)
+        for i in range(60)
+    ]
+    # Первая концепция требует изучения последней, самой сложной
+    edges = [(concepts[0].id, concepts[-1].id)]
+    session = RecordingSession({
+        LearningProfile: [LearningProfile(user_id=user_id, learning_style={}, preferences={})],
+        Concept: concepts,
+        ConceptRelationship: edges,
+        ConceptMastery: [(concepts[1].id, 0.9, datetime.now(timezone.utc) - timedelta(days=1))]
+    })
+    
+    reset_concept_graph()
+    for _ in range(2):
+        plan = await AdaptiveMechanisms.optimize_learning_path(
+            session,
+            user_id,
+            [concept.id for concept in concepts],
+            {"target_difficulty_curve": "challenging", "max_concepts_per_session": 5}
+        )
+    
+    # Граф концепций загружается один раз на процесс
+    assert session.queries == 4 + 3
+    sequence = [concept["concept_id"] for s in plan["sessions"] for concept in s["concepts"]]
+    assert len(sequence) == 60
+    assert sequence.index(str(concepts[-1].id)) < sequence.index(str(concepts[0].id))
+    assert session.added[-1].plan_data is plan
+    # Повторение, наступившее по расписанию SM-2, попадает в первую сессию
+    reviews = [a["concept_id"] for a in plan["sessions"][0]["activities"] if a["activity_type"] == "review"]
+    assert reviews == [str(concepts[1].id)]
+
+def test_mastery_change_replans_only_affected_sessions():
+    """Тест: инкрементальное перепланирование совпадает с полным и сохраняет идентификаторы."""
+    params = {
+        "target_difficulty_curve": "gradual",
+        "max_concepts_per_session": 3,
+        "spaced_repetition": True,
+        "include_assessments": True
+    }
+    concepts = [
+        {"concept_id": f"c{i}", "name": f"Концепция {i}", "difficulty": 0.05 + i / 40, "current_mastery": 0.0}
+        for i in range(30)
+    ]
+    plan_id = str(uuid.uuid4())
+    plan = build_learning_plan(plan_id, uuid.uuid4(), [c["concept_id"] for c in concepts], concepts, params)
+    before = [dict(s) for s in plan["sessions"]]
+    
+    # Концепция из 7-й сессии освоена и переносится во 2-ю
+    affected = apply_mastery_change(plan, "c20", 0.8)
+    
+    assert affected == list(range(1, 7))
+    assert [s["session_id"] for s in plan["sessions"]] == [s["session_id"] for s in before]
+    for index in set(range(10)) - set(affected):
+        assert plan["sessions"][index] == before[index]
+    
+    updated = [{**c, "current_mastery": 0.8, "next_review_at": None} if c["concept_id"] == "c20" else c for c in concepts]
+    updated.sort(key=lambda c: sequence_key("gradual", c))
+    expected = build_learning_plan(plan_id, uuid.uuid4(), [c["concept_id"] for c in concepts], updated, params)
+    assert plan["sessions"] == expected["sessions"]
+
+def test_plan_reviews_follow_review_schedule():
+    """Тест: занятия повторения плана - наступившие повторения SM-2, а не правило по уровню владения."""
+    params = {
+        "target_difficulty_curve": "gradual",
+        "max_concepts_per_session": 2,
+        "spaced_repetition": True,
+        "include_assessments": False
+    }
+    now = datetime(2026, 10, 17, tzinfo=timezone.utc)
+    concepts = [
+        {
+            "concept_id": f"c{i}",
+            "name": f"Концепция {i}",
+            "difficulty": 0.1 * (i + 1),
+            "current_mastery": 0.2,
+            "next_review_at": (now - timedelta(days=4 - i)).isoformat() if i < 3 else None
+        }
+        for i in range(6)
+    ]
+    plan_id = str(uuid.uuid4())
+    plan = build_learning_plan(plan_id, uuid.uuid4(), [c["concept_id"] for c in concepts], concepts, params, now)
+    
+    def reviews(index):
+        return [a["concept_id"] for a in plan["sessions"][index]["activities"] if a["activity_type"] == "review"]
+    
+    assert [reviews(index) for index in range(3)] == [["c0", "c1"], ["c2"], []]
+    
+    # Повторение c0 выполнено и перенесено планировщиком: очередь плана сдвигается
+    affected = apply_mastery_change(plan, "c0", 0.2, (now + timedelta(days=6)).isoformat(), now)
+    
+    assert affected == [0, 1]
+    assert [reviews(index) for index in range(3)] == [["c1", "c2"], [], []]
+
+# Провайдер-заглушка, считающий обращения к LLM
+class CountingProvider:
+    def __init__(self):
+        self.calls = 0
+    
+    def is_available(self):
+        return True
+    
+    async def generate(self, prompt, **kwargs):
+        self.calls += 1
+        return LLMResponse(text="Развернутый разбор ответа", model="test-model")
+
+@pytest.mark.asyncio
+async def test_feedback_uses_templates_and_caches_llm(monkeypatch):
+    """Тест: типовые результаты получают шаблон, ответ LLM для средних результатов кэшируется."""
+    user_id = uuid.uuid4()
+    provider = CountingProvider()
+    monkeypatch.setattr(adaptive_service, "get_llm_provider", lambda: provider)
+    await get_feedback_cache().clear()
+    session = RecordingSession({
+        LearningProfile: [LearningProfile(user_id=user_id, learning_style={"visual": 0.7}, preferences={})]
+    })
+    
+    perfect = await AdaptiveMechanisms.generate_adaptive_feedback(session, {"total_score": 1.0, "strengths": ["Циклы"]}, user_id)
+    assert perfect["type"] == "template"
+    assert "циклы" in perfect["content"]
+    assert provider.calls == 0
+    
+    mixed = {"total_score": 0.6, "strengths": ["Циклы"], "areas_for_improvement": ["Рекурсия"]}
+    first = await AdaptiveMechanisms.generate_adaptive_feedback(session, mixed, user_id)
+    second = await AdaptiveMechanisms.generate_adaptive_feedback(session, {**mixed, "total_score": 0.7}, user_id)
+    
+    assert first["type"] == second["type"] == "adaptive"
+    assert (first["metadata"]["cache_hit"], second["metadata"]["cache_hit"]) == (False, True)
+    assert provider.calls == 1
+
+# Провайдер-заглушка для адаптации: считает одновременные обращения
+class ConcurrentAdapter(CountingProvider):
+    def __init__(self):
+        super().__init__()
+        self.active = 0
+        self.max_active = 0
+    
+    async def adapt_content(self, content, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if content == "сбой":
+            raise RuntimeError("adaptation failed")
+        return f"адаптировано: {content}"
+
+@pytest.mark.asyncio
+async def test_batch_adaptation_streams_partial_results(monkeypatch):
+    """Тест пакетной адаптации: постоянное число запросов, ограничение параллелизма, частичный успех."""
+    user_id = uuid.uuid4()
+    provider = ConcurrentAdapter()
+    monkeypatch.setattr(adaptive_service, "get_llm_provider", lambda: provider)
+    monkeypatch.setattr(adaptive_service, "get_adaptation_cache", lambda: None)
+    contents = [
+        EducationalContent(
+            id=uuid.uuid4(), title=f"Урок {i}", body="сбой" if i == 3 else f"текст {i}", content_type="text",
+            difficulty=0.5, created_at=datetime.now(), updated_at=datetime.now()
+        )
+        for i in range(8)
+    ]
+    missing_id = uuid.uuid4()
+    session = RecordingSession({
+        LearningProfile: [LearningProfile(user_id=user_id, learning_style={}, preferences={})],
+        EducationalContent: contents
+    })
+    
+    batch = await AdaptiveMechanisms.prepare_content_batch(session, user_id, [c.id for c in contents] + [missing_id])
+    results = [result async for result in AdaptiveMechanisms.adapt_content_batch(batch, max_concurrency=3)]
+    
+    assert session.queries == 4
+    assert provider.max_active == 3
+    assert sorted(result["index"] for result in results) == list(range(9))
+    failed = {result["content_id"] for result in results if result["status"] == "error"}
+    assert failed == {str(contents[3].id), str(missing_id)}
+    assert all(r["content"]["body"].startswith("адаптировано") for r in results if r["status"] == "ok")
+
+def test_prefetch_takes_next_learning_activities():
+    """Тест: заранее адаптируется контент ближайших занятий изучения и повторения."""
+    params = {
+        "target_difficulty_curve": "gradual",
+        "max_concepts_per_session": 2,
+        "spaced_repetition": True,
+        "include_assessments": True
+    }
+    due = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+    concepts = [
+        {
+            "concept_id": f"c{i}",
+            "name": f"Концепция {i}",
+            "difficulty": 0.5,
+            "current_mastery": 0.0,
+            "next_review_at": due if i >= 4 else None
+        }
+        for i in range(6)
+    ]
+    plan = build_learning_plan(str(uuid.uuid4()), uuid.uuid4(), [c["concept_id"] for c in concepts], concepts, params)
+    
+    # Первая сессия: изучение c0, c1 и наступившие повторения c4, c5
+    assert upcoming_concepts(plan, 4) == ["c0", "c1", "c4", "c5"]
+    assert upcoming_concepts(plan, 3, start_session=1) == ["c2", "c3", "c4"]
@@ -0,0 +1,28 @@
+import numpy as np
+
+from app.services.cohort_service import kmeans, cohort_profile, profile_vector
+
+def test_kmeans_separates_learner_groups():
+    """Тест кластеризации: две явные группы учащихся дают две когорты."""
+    visual = [profile_vector({"visual": 0.9, "auditory": 0.1}, 0.3) for _ in range(20)]
+    kinesthetic = [profile_vector({"kinesthetic": 0.8}, 0.7) for _ in range(10)]
+    vectors = np.array(visual + kinesthetic) + np.random.default_rng(1).normal(0, 0.01, (30, 4))
+    
+    centroids, labels, inertia = kmeans(vectors, k=2)
+    
+    assert len(set(labels[:20])) == 1 and len(set(labels[20:])) == 1
+    assert labels[0] != labels[20]
+    assert inertia < 0.1
+    
+    profiles = {cohort_profile(centroid).style: cohort_profile(centroid) for centroid in centroids}
+    assert profiles["visual"].difficulty == 0.3
+    assert profiles["kinesthetic"].difficulty == 0.7
+
+def test_kmeans_limits_cohorts_to_distinct_profiles():
+    """Тест: когорт не больше, чем различных профилей."""
+    vectors = np.array([profile_vector({"visual": 1.0}, 0.5)] * 5)
+    
+    centroids, labels, _ = kmeans(vectors, k=8)
+    
+    assert len(centroids) == 1
+    assert (labels == 0).all()
@@ -0,0 +1,46 @@
+import numpy as np
+
+from app.services.concept_graph import ConceptGraph
+from app.services.path_scoring import order_by_curve
+
+def test_levels_and_transitive_prerequisites():
+    """Тест уровней и транзитивного замыкания: c требует b, b требует a."""
+    graph = ConceptGraph([("c", "b"), ("b", "a"), ("d", "a")])
+    
+    assert [graph.level(concept) for concept in "abcd"] == [0, 1, 2, 1]
+    assert sorted(graph.prerequisites("c", transitive=True)) == ["a", "b"]
+    assert graph.prerequisites("c") == ["b"]
+    assert graph.requires("c", "a") and not graph.requires("a", "c")
+    assert graph.topological_order(["c", "d", "b", "a"]) == ["a", "d", "b", "c"]
+
+def test_incremental_refresh_matches_full_rebuild():
+    """Тест: добавленные связи дают те же уровни и замыкание, что и полная перестройка."""
+    edges = [("b", "a"), ("c", "b"), ("e", "d"), ("c", "e"), ("f", "c")]
+    graph = ConceptGraph(edges[:2])
+    for concept_id, prerequisite_id in edges[2:]:
+        graph.add_prerequisite(concept_id, prerequisite_id)
+    rebuilt = ConceptGraph(edges)
+    
+    for concept in "abcdef":
+        assert graph.level(concept) == rebuilt.level(concept)
+        assert sorted(graph.prerequisites(concept, transitive=True)) == sorted(rebuilt.prerequisites(concept, transitive=True))
+    assert graph.stats()["pending_edges"] == 3
+
+def test_cycles_do_not_break_graph():
+    """Тест: цикл требований не приводит к зацикливанию, концепции цикла идут последними."""
+    graph = ConceptGraph([("b", "a"), ("c", "b")])
+    graph.add_prerequisite("b", "c")
+    rebuilt = ConceptGraph([("b", "a"), ("c", "b"), ("b", "c")])
+    
+    assert graph.requires("b", "b")
+    assert rebuilt.level("b") == rebuilt.level("c") > rebuilt.level("a")
+
+def test_curve_order_matches_levels_and_bands():
+    """Тест векторного порядка: требования раньше, полосы сложности по возрастанию."""
+    difficulty = np.array([0.9, 0.2, 0.5, 0.8])
+    mastery = np.array([0.0, 0.0, 0.0, 0.5])
+    levels = np.array([0, 1, 1, 0])
+    
+    assert order_by_curve("challenging", difficulty, mastery, levels).tolist() == [0, 3, 2, 1]
+    assert order_by_curve("gradual", difficulty, mastery, levels).tolist() == [1, 3, 2, 0]
+    assert order_by_curve("adaptive", difficulty, mastery, levels).tolist() == [1, 2, 3, 0]
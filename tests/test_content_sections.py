@@ -0,0 +1,77 @@
+import pytest
+
+from app.services.adaptation_cache import AdaptationProfile
+from app.services.content_sections import split_sections, adapt_sections, adapt_sections_batch, get_section_cache
+from app.services.llm_service import LLMProvider, LLMResponse
+
+# Провайдер-заглушка: запоминает адаптированные разделы
+class SectionProvider:
+    def __init__(self):
+        self.sections = []
+    
+    async def adapt_content(self, content, **kwargs):
+        self.sections.append(content)
+        return content.upper()
+
+# Провайдер-заглушка: запоминает промпты, пакет выполняется через generate()
+class PromptProvider(LLMProvider):
+    default_model = "test-model"
+    
+    def __init__(self):
+        self.prompts = []
+    
+    async def generate(self, prompt, max_tokens=1000, temperature=0.7, stop_sequences=None, metadata=None):
+        self.prompts.append(prompt)
+        return LLMResponse(text=f"ответ на: {prompt}", model=self.default_model)
+
+def test_split_sections_by_headings_and_budget():
+    """Тест: заголовок начинает раздел, абзацы объединяются в пределах бюджета."""
+    body = "# Введение\n\nкороткий абзац\n\nеще абзац\n\n## Детали\n\n" + "\n\n".join(["слово " * 40] * 3)
+    
+    sections = split_sections(body, max_tokens=100)
+    
+    assert sections[0] == "# Введение\n\nкороткий абзац\n\nеще абзац"
+    assert sections[1].startswith("## Детали")
+    assert len(sections) > 2
+    assert "\n\n".join(sections) == body.strip()
+
+@pytest.mark.asyncio
+async def test_edited_paragraph_readapts_only_its_section():
+    """Тест: после правки одного раздела в LLM отправляется только он, порядок сохраняется."""
+    profile = AdaptationProfile.from_profile(0.5, {"visual": 1.0}, {})
+    provider = SectionProvider()
+    body = "# Первый\n\nтекст один\n\n# Второй\n\nтекст два\n\n# Третий\n\nтекст три"
+    
+    adapted, stats = await adapt_sections(provider, body, profile)
+    assert stats == {"sections": 3, "cached_sections": 0}
+    
+    edited = body.replace("текст два", "новый текст два")
+    provider.sections.clear()
+    adapted, stats = await adapt_sections(provider, edited, profile)
+    
+    assert provider.sections == ["# Второй\n\nновый текст два"]
+    assert stats == {"sections": 3, "cached_sections": 2}
+    assert adapted == edited.upper()
+    assert get_section_cache().hits >= 2
+
+@pytest.mark.asyncio
+async def test_batch_adaptation_matches_interactive_sections():
+    """Тест: пакет отправляет те же промпты разделов, что и интерактивная адаптация, без повторов."""
+    profile = AdaptationProfile.from_profile(0.7, {"auditory": 1.0}, {"interests": ["спорт"]})
+    body = "# Циклы\n\nцикл повторяет действия\n\n# Условия\n\nусловие выбирает ветку"
+    edited = body.replace("выбирает ветку", "выбирает одну из веток")
+    provider = PromptProvider()
+    
+    await get_section_cache().clear()
+    interactive, _ = await adapt_sections(provider, body, profile)
+    interactive_prompts = list(provider.prompts)
+    
+    await get_section_cache().clear()
+    provider.prompts.clear()
+    results = await adapt_sections_batch(provider, [(body, profile), (edited, profile)], call_site="test")
+    
+    assert results[0] == (interactive, None)
+    assert results[1][0].startswith(interactive.split("\n\n")[0])
+    # Общий первый раздел запрашивается один раз
+    assert len(provider.prompts) == 3
+    assert set(interactive_prompts) <= set(provider.prompts)
@@ -0,0 +1,398 @@
+import pytest
+import asyncio
+import httpx
+from typing import Dict, Any, List, Optional
+
+from app.services.llm_service import (
+    LLMProvider, LLMResponse, LLMRequest, CoalescingLLMProvider, CircuitBreakerLLMProvider, close_http_clients
+)
+from app.services.llm_resilience import AdaptiveLimiter, RetryPolicy, CircuitBreaker, CircuitOpenError
+from app.services.llm_cache import CachingLLMProvider, InMemoryCacheBackend, ResponseCache, TextCache
+from app.services.llm_router import RoutedProvider
+from app.services.llm_stub import LocalStubProvider
+from app.services.llm_metrics import InstrumentedLLMProvider, estimate_cost
+from app.services.llm_policy import plan_llm_call
+from prometheus_client import REGISTRY
+
+# Провайдер-заглушка, считающий обращения к API
+class CountingProvider(LLMProvider):
+    default_model = "test-model"
+    
+    def __init__(self):
+        self.calls = 0
+    
+    async def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop_sequences: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return LLMResponse(text=f"ответ на: {prompt}", model=self.default_model)
+
+# Провайдер-заглушка, всегда завершающийся ошибкой
+class FailingProvider(CountingProvider):
+    async def generate(self, prompt: str, *args, **kwargs) -> LLMResponse:
+        self.calls += 1
+        raise httpx.ConnectError("connection refused")
+
+@pytest.mark.asyncio
+async def test_response_cache_hit():
+    """Тест повторного использования ответа для идентичного запроса."""
+    inner = CountingProvider()
+    cache = ResponseCache(InMemoryCacheBackend())
+    provider = CachingLLMProvider(inner, cache)
+    
+    first = await provider.generate("вопрос", temperature=0.2)
+    second = await provider.generate("вопрос", temperature=0.2)
+    
+    assert inner.calls == 1
+    assert first.text == second.text
+    assert second.metadata["cache_hit"] is True
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_response_cache_opt_out():
+    """Тест отключения кэша для отдельного запроса."""
+    inner = CountingProvider()
+    provider = CachingLLMProvider(inner, ResponseCache(InMemoryCacheBackend()))
+    
+    await provider.generate("вопрос", metadata={"cache": False})
+    await provider.generate("вопрос", metadata={"cache": False})
+    
+    assert inner.calls == 2
+
+@pytest.mark.asyncio
+async def test_in_memory_backend_lru_eviction():
+    """Тест вытеснения самых старых записей при переполнении."""
+    backend = InMemoryCacheBackend(max_entries=2)
+    
+    await backend.set("a", "1", ttl_seconds=60)
+    await backend.set("b", "2", ttl_seconds=60)
+    await backend.get("a")
+    await backend.set("c", "3", ttl_seconds=60)
+    
+    assert await backend.get("a") == "1"
+    assert await backend.get("b") is None
+    assert await backend.get("c") == "3"
+
+@pytest.mark.asyncio
+async def test_text_caches_share_backend_by_prefix():
+    """Тест: кэши с разными префиксами не пересекаются в общем хранилище."""
+    backend = InMemoryCacheBackend()
+    sections = TextCache(backend, prefix="section:")
+    feedback = TextCache(backend, prefix="feedback:")
+    
+    await sections.set("key", "раздел")
+    
+    assert await sections.get("key") == "раздел"
+    assert await feedback.get("key") is None
+    assert sections.stats()["hits"] == 1
+    assert feedback.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_coalescing_identical_requests():
+    """Тест объединения одинаковых одновременных запросов в один вызов."""
+    inner = CountingProvider()
+    provider = CoalescingLLMProvider(inner)
+    
+    responses = await asyncio.gather(*[provider.generate("вопрос") for _ in range(10)])
+    
+    assert inner.calls == 1
+    assert all(response.text == responses[0].text for response in responses)
+    assert provider.flight.coalesced == 9
+    assert len(provider.flight) == 0
+
+@pytest.mark.asyncio
+async def test_limiter_retries_after_throttling():
+    """Тест повтора запроса после 429 и снижения лимита параллелизма."""
+    statuses = [429, 503, 200]
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        status_code = statuses.pop(0)
+        return httpx.Response(status_code, headers={"retry-after": "0"}, json={"ok": status_code == 200})
+    
+    limiter = AdaptiveLimiter("test:model", max_concurrency=8)
+    policy = RetryPolicy(max_retries=3, base_delay=0.001, max_delay=0.01, deadline_seconds=5)
+    
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://test") as client:
+        response, retries = await limiter.run(lambda: client.post("/"), estimated_tokens=10, policy=policy)
+    
+    assert response.json() == {"ok": True}
+    assert retries == 2
+    assert limiter.throttled == 1
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_limiter_raises_non_retryable_errors():
+    """Тест немедленного проброса ошибок, которые нельзя повторить."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(400, json={"error": "bad request"})
+    
+    limiter = AdaptiveLimiter("test:model")
+    policy = RetryPolicy(max_retries=3, base_delay=0.001)
+    
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://test") as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await limiter.run(lambda: client.post("/"), estimated_tokens=10, policy=policy)
+    
+    assert limiter.retries == 0
+
+@pytest.mark.asyncio
+async def test_limiter_passes_slot_of_cancelled_waiter():
+    """Тест передачи слота следующему ожидающему, если уведомленный ожидающий отменен."""
+    limiter = AdaptiveLimiter("test:model", max_concurrency=1)
+    await limiter._acquire_slot()
+    
+    cancelled = asyncio.create_task(limiter._acquire_slot())
+    waiting = asyncio.create_task(limiter._acquire_slot())
+    await asyncio.sleep(0)
+    
+    limiter._release_slot()
+    cancelled.cancel()
+    
+    await asyncio.wait_for(waiting, timeout=1)
+    assert cancelled.cancelled()
+    assert limiter.in_flight == 1
+
+@pytest.mark.asyncio
+async def test_batch_uses_cache_and_keeps_order():
+    """Тест пакетной генерации: попадания в кэш не отправляются провайдеру."""
+    inner = CountingProvider()
+    provider = CachingLLMProvider(inner, ResponseCache(InMemoryCacheBackend()))
+    await provider.generate("вопрос 1")
+    
+    results = await provider.generate_batch([
+        LLMRequest(custom_id=str(i), prompt=f"вопрос {i}") for i in range(1, 4)
+    ])
+    
+    assert inner.calls == 3
+    assert [result.custom_id for result in results] == ["1", "2", "3"]
+    assert results[0].response.metadata["cache_hit"] is True
+    assert all(result.error is None for result in results)
+
+@pytest.mark.asyncio
+async def test_routed_provider_failover():
+    """Тест переключения на резервного провайдера при ошибке основного."""
+    failing = FailingProvider()
+    backup = CountingProvider()
+    provider = RoutedProvider({"primary": failing, "backup": backup}, hedging=False)
+    
+    response = await provider.generate("вопрос", metadata={"model": "primary-model"})
+    
+    assert response.metadata["routed_provider"] == "backup"
+    assert failing.calls == 1
+    assert backup.calls == 1
+    assert provider.failovers == 1
+
+@pytest.mark.asyncio
+async def test_routed_provider_ignores_non_retryable_errors_in_circuit():
+    """Тест предохранителей маршрутизатора: ошибка 400 не размыкает цепь, ошибка 503 размыкает."""
+    class StatusProvider(CountingProvider):
+        def __init__(self, status_code: int):
+            super().__init__()
+            self.status_code = status_code
+        
+        async def generate(self, prompt: str, *args, **kwargs) -> LLMResponse:
+            self.calls += 1
+            request = httpx.Request("POST", "http://test")
+            raise httpx.HTTPStatusError("error", request=request, response=httpx.Response(self.status_code, request=request))
+    
+    backup = CountingProvider()
+    provider = RoutedProvider(
+        {"invalid": StatusProvider(400), "unavailable": StatusProvider(503), "backup": backup},
+        hedging=False,
+        breaker_config={"min_requests": 1}
+    )
+    
+    response = await provider.generate("вопрос")
+    
+    assert response.metadata["routed_provider"] == "backup"
+    assert provider.failovers == 2
+    states = {route.name: route.breaker.state for route in provider.routes}
+    assert states == {"invalid": CircuitBreaker.CLOSED, "unavailable": CircuitBreaker.OPEN, "backup": CircuitBreaker.CLOSED}
+
+@pytest.mark.asyncio
+async def test_routed_provider_hedges_slow_requests():
+    """Тест дублирующего запроса, когда основной провайдер отвечает слишком долго."""
+    class SlowProvider(CountingProvider):
+        async def generate(self, prompt: str, *args, **kwargs) -> LLMResponse:
+            self.calls += 1
+            await asyncio.sleep(5)
+            return LLMResponse(text="поздний ответ", model=self.default_model)
+    
+    slow = SlowProvider()
+    fast = CountingProvider()
+    provider = RoutedProvider({"slow": slow, "fast": fast})
+    provider.routes[0].latencies.extend([0.001] * 50)
+    provider.routes[1].latencies.extend([0.01] * 50)
+    
+    response = await asyncio.wait_for(provider.generate("вопрос"), timeout=4)
+    
+    assert response.metadata["routed_provider"] == "fast"
+    assert provider.hedged_requests == 1
+
+@pytest.mark.asyncio
+async def test_stub_provider_is_deterministic():
+    """Тест детерминированных ответов локальной заглушки в обычном и потоковом режимах."""
+    provider = LocalStubProvider(latency_ms=1, latency_jitter_ms=0, tokens_per_second=0, output_tokens=20)
+    
+    first = await provider.generate("вопрос", metadata={"system_prompt": "система"})
+    second = await provider.generate("вопрос", metadata={"system_prompt": "система"})
+    chunks = [chunk async for chunk in provider.generate_stream("вопрос", metadata={"system_prompt": "система"})]
+    other = await provider.generate("другой вопрос")
+    
+    assert first.text == second.text
+    assert "".join(chunks) == first.text
+    assert other.text != first.text
+    assert first.metadata["usage"]["output_tokens"] == 20
+
+@pytest.mark.asyncio
+async def test_stub_provider_client_closed_with_shared_pool():
+    """Тест закрытия HTTP-клиента заглушки вместе с общим пулом при остановке процесса."""
+    provider = LocalStubProvider(latency_ms=0, tokens_per_second=0)
+    client = provider.open()
+    
+    await close_http_clients()
+    
+    assert client.is_closed
+
+@pytest.mark.asyncio
+async def test_stub_provider_error_injection():
+    """Тест внедрения ошибок: ошибки, которые можно повторить, проходят через повторы."""
+    provider = LocalStubProvider(
+        default_model="stub-errors",
+        latency_distribution="fixed",
+        latency_ms=0,
+        tokens_per_second=0,
+        error_rate=1.0,
+        error_statuses=[400]
+    )
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        await provider.generate("вопрос")
+    
+    assert provider.injected_errors == 1
+    assert provider.stats()["requests"] == 1
+
+@pytest.mark.asyncio
+async def test_instrumentation_records_tokens_and_cache_hits():
+    """Тест метрик вызовов: токены и стоимость учитываются только для обращений к API."""
+    stub = LocalStubProvider(default_model="claude-3-haiku-metrics", latency_ms=0, tokens_per_second=0, output_tokens=10)
+    provider = InstrumentedLLMProvider(CachingLLMProvider(stub, ResponseCache(InMemoryCacheBackend())))
+    labels = {"call_site": "feedback", "provider": "stub", "model": "claude-3-haiku-metrics"}
+    
+    response = await provider.generate("вопрос", metadata={"call_site": "feedback"})
+    await provider.generate("вопрос", metadata={"call_site": "feedback"})
+    
+    input_tokens = response.metadata["usage"]["input_tokens"]
+    assert REGISTRY.get_sample_value("llm_requests_total", {**labels, "outcome": "success"}) == 1
+    assert REGISTRY.get_sample_value("llm_requests_total", {**labels, "outcome": "cache_hit"}) == 1
+    assert REGISTRY.get_sample_value("llm_tokens_total", {**labels, "direction": "output"}) == 10
+    assert REGISTRY.get_sample_value("llm_cost_usd_total", labels) == pytest.approx(
+        estimate_cost("claude-3-haiku-metrics", {"input": input_tokens, "output": 10})
+    )
+
+@pytest.mark.asyncio
+async def test_instrumentation_records_failed_batch_requests():
+    """Тест метрик пакета: ошибка отдельного запроса учитывается, а пакет завершается."""
+    class PartiallyFailingProvider(CountingProvider):
+        default_model = "batch-metrics-model"
+        
+        async def generate(self, prompt: str, *args, **kwargs) -> LLMResponse:
+            if prompt == "ошибка":
+                raise httpx.ConnectError("connection refused")
+            return await super().generate(prompt, *args, **kwargs)
+    
+    provider = InstrumentedLLMProvider(PartiallyFailingProvider())
+    labels = {"call_site": "batch", "provider": "", "model": "batch-metrics-model"}
+    
+    results = await provider.generate_batch([
+        LLMRequest(custom_id="ok", prompt="вопрос", metadata={"call_site": "batch"}),
+        LLMRequest(custom_id="failed", prompt="ошибка", metadata={"call_site": "batch"})
+    ])
+    
+    assert results[0].response is not None
+    assert results[1].error == "connection refused"
+    assert REGISTRY.get_sample_value("llm_requests_total", {**labels, "outcome": "success"}) == 1
+    assert REGISTRY.get_sample_value("llm_requests_total", {**labels, "outcome": "error"}) == 1
+
+@pytest.mark.asyncio
+async def test_stub_provider_simulates_prompt_caching():
+    """Тест кэширования префикса промпта: повторный запрос читает префикс из кэша."""
+    provider = LocalStubProvider(latency_ms=0, tokens_per_second=0, output_tokens=5, cache_min_tokens=100)
+    prefix = "Общий контекст курса. " * 100 + "\n\n"
+    metadata = {"system_prompt": "система", "cache_prefix": prefix}
+    
+    first = await provider.generate(prefix + "первый вопрос", metadata=metadata)
+    second = await provider.generate(prefix + "второй вопрос", metadata=metadata)
+    
+    assert first.metadata["usage"]["cache_creation_input_tokens"] > 100
+    assert second.metadata["usage"]["cache_read_input_tokens"] == first.metadata["usage"]["cache_creation_input_tokens"]
+    assert second.metadata["usage"]["input_tokens"] < first.metadata["usage"]["cache_creation_input_tokens"]
+    assert provider.stats()["prompt_cache_hits"] == 1
+
+def test_policy_sizes_max_tokens_and_tier():
+    """Тест выбора max_tokens по объему входа и быстрой модели для простых задач."""
+    short = plan_llm_call("adapt_content", input_tokens=100, difficulty=0.6)
+    long = plan_llm_call("adapt_content", input_tokens=2000, difficulty=0.6)
+    simplification = plan_llm_call("adapt_content", input_tokens=2000, difficulty=0.2)
+    
+    assert short.max_tokens < long.max_tokens <= 4000
+    assert short.tier == "default"
+    assert simplification.tier == "fast"
+    assert plan_llm_call("feedback", detail_level="brief").tier == "fast"
+    assert plan_llm_call("feedback", detail_level="detailed").tier == "default"
+
+@pytest.mark.asyncio
+async def test_fast_tier_resolves_fast_model():
+    """Тест выбора быстрой модели провайдером по metadata["tier"]."""
+    provider = LocalStubProvider(latency_distribution="fixed", latency_ms=0, tokens_per_second=0)
+    
+    fast = await provider.generate("вопрос", metadata={"tier": "fast"})
+    default = await provider.generate("вопрос")
+    
+    assert fast.model == "stub-fast-model"
+    assert default.model == "stub-model"
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fails_fast_and_recovers_by_probe():
+    """Разомкнутая цепь отклоняет вызовы сразу, а фоновая проверка замыкает ее."""
+    failing = FailingProvider()
+    breaker = CircuitBreaker("test", min_requests=2, reset_timeout=0.05)
+    provider = CircuitBreakerLLMProvider(failing, breaker)
+    
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            await provider.generate("вопрос")
+    assert not provider.is_available()
+    
+    with pytest.raises(CircuitOpenError):
+        await provider.generate("вопрос")
+    assert failing.calls == 2
+    
+    # Провайдер восстановился: пробный запрос замыкает цепь без участия пользователей
+    failing.generate = CountingProvider.generate.__get__(failing)
+    await asyncio.sleep(0.2)
+    assert provider.is_available()
+    response = await provider.generate("вопрос")
+    assert response.text == "ответ на: вопрос"
+
+def test_circuit_breaker_closes_only_on_trial_success():
+    """Успех запроса, отправленного до размыкания, не замыкает цепь без пробного запроса."""
+    breaker = CircuitBreaker("test", min_requests=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker._state == CircuitBreaker.OPEN
+    
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success(trial=True)
+    assert breaker.state == CircuitBreaker.CLOSED
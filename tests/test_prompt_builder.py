@@ -0,0 +1,45 @@
+from app.services.prompt_builder import (
+    PromptTemplate, ContextItem, build_prompt, estimate_tokens, fit_context, normalize_whitespace
+)
+
+def test_template_whitespace_is_normalized():
+    """Тест удаления отступов и пустых строк необязательных полей."""
+    template = PromptTemplate("test", """
+        Вопрос: {question}
+        
+        {optional}
+        
+        
+        Ответьте кратко.
+    """)
+    
+    prompt = template.render(question="что такое переменная?", optional="")
+    
+    assert prompt == "Вопрос: что такое переменная?\n\nОтветьте кратко."
+    assert normalize_whitespace("    a\n      b\n") == "a\n  b"
+
+def test_context_trimmed_by_priority():
+    """Тест укладки контекста в бюджет: менее важные документы отбрасываются."""
+    items = [
+        ContextItem(title="Document 2", text="второстепенный материал " * 200, priority=1),
+        ContextItem(title="Document 1", text="ключевой материал", priority=0)
+    ]
+    
+    context = fit_context(items, budget_tokens=100)
+    
+    assert context.startswith("Document 1\nключевой материал")
+    assert estimate_tokens(context) <= 100
+
+def test_prompt_size_is_bounded():
+    """Тест ограничения размера промпта при очень длинном контексте."""
+    template = PromptTemplate("test", "Контекст:\n{context}\n\nВопрос: {question}")
+    
+    prompt = build_prompt(
+        template,
+        context=[ContextItem(text="Длинное предложение о переменных. " * 5000)],
+        budget_tokens=500,
+        question="что такое переменная?"
+    )
+    
+    assert estimate_tokens(prompt) <= 500
+    assert prompt.endswith("Вопрос: что такое переменная?")
@@ -0,0 +1,88 @@
+import uuid
+import pytest
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.models.user import ConceptMastery, DailyReviewQueue
+from app.services import review_scheduler
+from app.services.review_scheduler import sm2, schedule_review, build_daily_queues, MIN_EASE_FACTOR
+
+# Сессия-заглушка: хранит добавленные очереди и считает фиксации
+class QueueSession:
+    def __init__(self):
+        self.queues = []
+        self.commits = 0
+        self.user_ids = []
+    
+    async def execute(self, query):
+        # Учащиеся из условия IN запроса очередей
+        self.user_ids = next((value for value in query.compile().params.values() if isinstance(value, list)), [])
+        return self
+    
+    def scalars(self):
+        return self
+    
+    def all(self):
+        return [queue for queue in self.queues if queue.user_id in self.user_ids]
+    
+    def add_all(self, instances):
+        self.queues.extend(instances)
+    
+    async def commit(self):
+        self.commits += 1
+
+def test_sm2_intervals_grow_and_reset_on_failure():
+    """Тест SM-2: интервалы 1, 6, затем умножаются на фактор легкости; ошибка сбрасывает серию."""
+    state = (2.5, 0.0, 0)
+    intervals = []
+    for _ in range(4):
+        state = sm2(*state, quality=5)
+        intervals.append(state[1])
+    
+    assert intervals[:2] == [1.0, 6.0]
+    assert intervals[2] > intervals[1] and intervals[3] > intervals[2]
+    
+    ease_factor, interval_days, repetitions = sm2(*state, quality=1)
+    assert (interval_days, repetitions) == (1.0, 0)
+    assert MIN_EASE_FACTOR <= ease_factor < state[0]
+
+def test_schedule_review_sets_next_review_time():
+    """Тест: новая запись получает состояние по умолчанию и время следующего повторения."""
+    reviewed_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    mastery = ConceptMastery(mastery_level=0.9, confidence=0.5)
+    
+    schedule_review(mastery, 0.9, reviewed_at)
+    schedule_review(mastery, 0.9, reviewed_at)
+    
+    assert mastery.repetitions == 2
+    assert mastery.next_review_at == reviewed_at + timedelta(days=6)
+
+@pytest.mark.asyncio
+async def test_daily_queues_written_per_batch(monkeypatch):
+    """Тест: каждый пакет фиксируется сразу, повторения из разных пакетов дописываются в очередь учащегося."""
+    first, second = uuid.uuid4(), uuid.uuid4()
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    
+    def review(user_id, hours):
+        return SimpleNamespace(user_id=user_id, concept_id=uuid.uuid4(), next_review_at=start + timedelta(hours=hours))
+    
+    batches = [[review(first, 1), review(second, 2)], [review(first, 3)]]
+    
+    async def fake_iter_due_reviews(db, end, batch_size):
+        for rows in batches:
+            yield rows
+            # Предыдущий пакет уже записан к моменту выборки следующего
+            assert db.commits == batches.index(rows) + 2
+    
+    monkeypatch.setattr(review_scheduler, "iter_due_reviews", fake_iter_due_reviews)
+    session = QueueSession()
+    
+    report = await build_daily_queues(session, date(2026, 1, 1), batch_size=2)
+    
+    assert report == {"queue_date": "2026-01-01", "users": 2, "items": 3}
+    queues = {queue.user_id: queue.items for queue in session.queues}
+    assert [item["due_at"] for item in queues[first]] == [
+        batches[0][0].next_review_at.isoformat(), batches[1][0].next_review_at.isoformat()
+    ]
+    assert len(queues[second]) == 1
+    assert all(isinstance(queue, DailyReviewQueue) for queue in session.queues)